@@ -1,6 +1,6 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { createClient } from '@supabase/supabase-js';
-import { createHash } from 'crypto';
+import { createHash, randomUUID } from 'crypto';
 
 // Helper to generate a consistent UUID from any string
 function generateUuidFromString(input: string): string {
@@ -137,11 +137,17 @@ export async function POST(request: NextRequest) {
     try {
       // Forward the request to the backend with generous timeout for educational content
       const controller = new AbortController();
+      const proxyTimeoutMs = 120000; // 120 second timeout - generous for complex educational prompts
+      const proxyDeadline = Date.now() + proxyTimeoutMs;
       const timeoutId = setTimeout(() => {
         console.log("API call timeout - aborting fetch after generous wait for educational content");
         controller.abort();
-      }, 120000); // 120 second timeout - generous for complex educational prompts
+      }, proxyTimeoutMs);
       
+      // One key for every attempt: the backend answers a retry with the original turn's response
+      // (or waits for it) instead of logging the message and calling the LLM again
+      const idempotencyKey = request.headers.get('idempotency-key') || randomUUID();
+
       // Implement robust retry logic for educational reliability
       let maxRetries = 3;  // More retries for educational systems
       let retryCount = 0;
@@ -154,6 +160,9 @@ export async function POST(request: NextRequest) {
             method: 'POST',
             headers: {
               'Content-Type': 'application/json',
+              // Tell the backend how long we will wait so it stops work we would abandon
+              'X-Request-Timeout-Ms': String(Math.max(proxyDeadline - Date.now() - 2000, 1000)),
+              'Idempotency-Key': idempotencyKey,
             },
             body: JSON.stringify(body),
             signal: controller.signal
@@ -5,9 +5,17 @@ const supabaseUrl = process.env.SUPABASE_URL;
 const supabaseKey = process.env.SUPABASE_SERVICE_KEY;
 const supabase = createClient(supabaseUrl!, supabaseKey!);
 
+// Events buffered by lib/event-buffer.ts arrive as { events: [...] }; at most this many per request
+const MAX_EVENT_BATCH = 500;
+
 export async function POST(request: NextRequest) {
   try {
     const body = await request.json();
+
+    if (Array.isArray(body) || Array.isArray(body?.events)) {
+      return await handleEventBatch(Array.isArray(body) ? body : body.events);
+    }
+
     const { session_id, event_type, phase, component, metadata } = body;
 
     if (!session_id || !event_type) {
@@ -21,39 +29,78 @@ export async function POST(request: NextRequest) {
     const userId = sessionData.user_id;
 
     // Master log for all interactions
-    await supabase.from('content_interaction_logs').insert({
-      session_id, user_id: userId, interaction_type: event_type,
-      content_type: component, phase, component,
-      interaction_data: metadata,
-    });
-
-    let responseData = { success: true };
-
-    switch (event_type) {
-      case 'video_watch_completed':
-        await handleVideoEvent(session_id, userId, phase, metadata);
-        break;
-      case 'chat_started':
-        const chatData = await handleChatStarted(session_id, userId, phase, component);
-        responseData = chatData;
-        break;
-      case 'chat_ended':
-        await handleChatEnded(metadata.chat_analytics_id, metadata);
-        break;
-      case 'revision_submitted':
-        await handleRevisionEvent(session_id, userId, phase, component, metadata);
-        break;
-      case 'phase_completed':
-        await handlePhaseCompleted(session_id, userId, phase);
-        break;
-    }
+    await supabase.from('content_interaction_logs').insert(interactionLogRow(body, userId));
 
+    const responseData = await dispatchEvent(body, userId);
     return NextResponse.json(responseData);
   } catch (error) {
     return NextResponse.json({ error: (error as Error).message }, { status: 500 });
   }
 }
 
+// One session lookup and one insert for the whole batch; events of unknown sessions are dropped
+async function handleEventBatch(events: any[]) {
+  if (events.length > MAX_EVENT_BATCH) {
+    return NextResponse.json({ error: `At most ${MAX_EVENT_BATCH} events per request` }, { status: 413 });
+  }
+  const valid = events.filter(event => event?.session_id && event?.event_type);
+  if (valid.length === 0) {
+    return NextResponse.json({ success: true, count: 0 });
+  }
+
+  const sessionIds = Array.from(new Set(valid.map(event => event.session_id)));
+  const { data: sessions } = await supabase.from('sessions').select('id, user_id').in('id', sessionIds);
+  const userIds = new Map((sessions || []).map(session => [session.id, session.user_id]));
+  const known = valid.filter(event => userIds.has(event.session_id));
+
+  if (known.length > 0) {
+    await supabase.from('content_interaction_logs').insert(
+      known.map(event => interactionLogRow(event, userIds.get(event.session_id)))
+    );
+    // Analytics side effects, in the order the events happened
+    for (const event of known) {
+      await dispatchEvent(event, userIds.get(event.session_id));
+    }
+  }
+
+  return NextResponse.json({ success: true, count: known.length });
+}
+
+function interactionLogRow(event: any, userId: string) {
+  const { session_id, event_type, phase, component, metadata, client_ts } = event;
+  return {
+    session_id, user_id: userId, interaction_type: event_type,
+    content_type: component, phase, component,
+    interaction_data: client_ts ? { ...metadata, client_ts } : metadata,
+  };
+}
+
+async function dispatchEvent(event: any, userId: string): Promise<any> {
+  const { session_id, event_type, phase, component, metadata } = event;
+  let responseData: any = { success: true };
+
+  switch (event_type) {
+    case 'video_watch_completed':
+      await handleVideoEvent(session_id, userId, phase, metadata);
+      break;
+    case 'chat_started':
+      const chatData = await handleChatStarted(session_id, userId, phase, component);
+      responseData = chatData;
+      break;
+    case 'chat_ended':
+      await handleChatEnded(metadata?.chat_analytics_id, metadata);
+      break;
+    case 'revision_submitted':
+      await handleRevisionEvent(session_id, userId, phase, component, metadata);
+      break;
+    case 'phase_completed':
+      await handlePhaseCompleted(session_id, userId, phase);
+      break;
+  }
+
+  return responseData;
+}
+
 async function handleVideoEvent(sessionId: string, userId: string, phase: string, metadata: any) {
   const { video_title, total_watched_seconds, play_count, pause_count, seek_count } = metadata;
   await supabase.from('user_video_analytics').upsert({
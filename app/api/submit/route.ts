@@ -66,6 +66,8 @@ export async function POST(request: NextRequest) {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          // Lets the backend answer a resent submission with the original response
+          ...(request.headers.get('idempotency-key') ? { 'Idempotency-Key': request.headers.get('idempotency-key')! } : {}),
         },
         body: JSON.stringify(submissionBody),
         signal: controller.signal
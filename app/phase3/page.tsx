@@ -10,6 +10,7 @@ import { PlayCircle, CheckCircle, Brain, MoveRight, Sparkles, BookMarked, Chevro
 import { RadioGroup, RadioGroupItem } from "@/components/ui/radio-group"
 import { Label } from "@/components/ui/label"
 import VideoPlayer from "@/components/video-player"
+import { queueEvent } from "@/lib/event-buffer"
 import KnowledgeCheck from "./knowledge-check"
 import { Bot } from "lucide-react"
 import SolBotChat from "@/components/solbot-chat"
@@ -19,17 +20,13 @@ import ModuleBar from "@/components/module-bar"
 
 // --- Helper function to log events ---
 const logEvent = (sessionId: string, eventType: string, metadata: any) => {
-  fetch('/api/events', {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({
-      session_id: sessionId,
-      event_type: eventType,
-      phase: '3',
-      component: 'learning_strategies',
-      metadata: metadata,
-    }),
-  }).catch(error => console.error(`Failed to log event ${eventType}:`, error));
+  queueEvent({
+    session_id: sessionId,
+    event_type: eventType,
+    phase: '3',
+    component: 'learning_strategies',
+    metadata: metadata,
+  });
 };
 
 // Add a message cleaning function to strip any possible score text
@@ -9,22 +9,19 @@ import { PlayCircle, CheckCircle, Brain, BookMarked, ChevronRight, ChevronLeft,
 import { RadioGroup, RadioGroupItem } from "@/components/ui/radio-group"
 import { Label } from "@/components/ui/label"
 import VideoPlayer from "@/components/video-player"
+import { queueEvent } from "@/lib/event-buffer"
 import ModuleBar from "@/components/module-bar"
 import { VerticalNav } from "@/components/vertical-nav"
 
 // --- Helper function to log events ---
 const logEvent = (sessionId: string, eventType: string, metadata: any) => {
-  fetch('/api/events', {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({
-      session_id: sessionId,
-      event_type: eventType,
-      phase: '5',
-      component: 'monitoring_adaptation',
-      metadata: metadata,
-    }),
-  }).catch(error => console.error(`Failed to log event ${eventType}:`, error));
+  queueEvent({
+    session_id: sessionId,
+    event_type: eventType,
+    phase: '5',
+    component: 'monitoring_adaptation',
+    metadata: metadata,
+  });
 };
 
 const KnowledgeCheckQuestion = ({ 
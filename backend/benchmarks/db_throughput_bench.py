@@ -0,0 +1,129 @@
+"""
+Benchmark: /api/chat database work under concurrent load
+
+Simulates concurrent chat turns doing the database round trips of the original
+/api/chat path (user message insert, history read, assistant message insert, session lookup,
+assessment insert) around a simulated LLM call. The Supabase client is replaced with an
+in-process stand-in whose ``execute()`` blocks for a fixed round-trip time, so the numbers
+isolate how the DB layer uses the event loop:
+
+  - before: DB_EXECUTOR_WORKERS=0, every ``execute()`` runs inline and blocks the loop
+  - after:  ``execute()`` runs on the bounded DB executor
+
+Run from the project root (needs the backend requirements installed):
+    python -m backend.benchmarks.db_throughput_bench [--turns 200] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(os.path.dirname(current_dir)))
+
+from backend.utils import db
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _BlockingQuery:
+    """Chainable stand-in for a postgrest query builder; execute() blocks like an HTTP round trip"""
+
+    def __init__(self, table: str, round_trip: float):
+        self.table = table
+        self.round_trip = round_trip
+        self.row = None
+
+    def insert(self, row):
+        self.row = row
+        return self
+
+    def __getattr__(self, name):
+        # select / eq / order / limit / single ...
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        time.sleep(self.round_trip)
+        if self.row is not None:
+            return _Response([self.row])
+        if self.table == "sessions":
+            return _Response({"id": "session", "user_id": "user"})
+        return _Response([{"role": "user", "content": "hello"}] * 10)
+
+
+class _BlockingClient:
+    def __init__(self, round_trip: float):
+        self.round_trip = round_trip
+
+    def table(self, name: str):
+        return _BlockingQuery(name, self.round_trip)
+
+
+async def chat_turn(llm_latency: float) -> float:
+    start = time.perf_counter()
+    user_message = await db.log_message("session", "user", "My plan for this week...", "2", "task_a")
+    await db.get_messages_for_session("session", limit=10)
+    await asyncio.sleep(llm_latency)  # Claude call
+    assistant_message = await db.log_message("session", "assistant", "Feedback...", "2", "task_a")
+    session = await db.get_session_by_id("session")
+    await db.log_assessment(
+        "session", session["user_id"], user_message["id"], assistant_message["id"],
+        "2", "task_a", 1, {"overall_score": 3}
+    )
+    return time.perf_counter() - start
+
+
+async def run_load(turns: int, concurrency: int, llm_latency: float):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            return await chat_turn(llm_latency)
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[one() for _ in range(turns)])
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def report(label: str, elapsed: float, latencies, turns: int) -> None:
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{label:<34} {turns / elapsed:8.1f} turns/s   "
+        f"p50 {statistics.median(latencies) * 1000:7.0f} ms   p95 {p95 * 1000:7.0f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--round-trip-ms", type=float, default=40.0, help="simulated Supabase round trip")
+    parser.add_argument("--llm-ms", type=float, default=500.0, help="simulated Claude latency")
+    parser.add_argument("--workers", type=int, default=db.DB_EXECUTOR_WORKERS or 16)
+    args = parser.parse_args()
+
+    db._supabase_client = _BlockingClient(args.round_trip_ms / 1000)
+    print(
+        f"{args.turns} chat turns, concurrency {args.concurrency}, "
+        f"{args.round_trip_ms:.0f} ms per DB round trip, {args.llm_ms:.0f} ms LLM\n"
+    )
+
+    db._executor = None
+    elapsed, latencies = asyncio.run(run_load(args.turns, args.concurrency, args.llm_ms / 1000))
+    report("before (blocking, inline)", elapsed, latencies, args.turns)
+
+    db._executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="solbot-db")
+    elapsed, latencies = asyncio.run(run_load(args.turns, args.concurrency, args.llm_ms / 1000))
+    report(f"after (executor, {args.workers} workers)", elapsed, latencies, args.turns)
+    db.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Export a latency profile for the mock LLM provider from recorded llm_interactions
+
+Reads the real (not cached, coalesced or mock) calls logged in llm_interactions and writes
+their duration, output length and time to first token as JSON. Point MOCK_LLM_PROFILE at the
+file and run the backend with LLM_PROVIDER=mock to load-test it with production-like LLM
+timing:
+
+    python -m backend.benchmarks.export_llm_profile --dsn postgresql://... \\
+        [--days 14] [--phase 4] [--limit 20000] [--output llm_profile.json]
+    LLM_PROVIDER=mock MOCK_LLM_PROFILE=llm_profile.json uvicorn backend.main:app
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import asyncpg
+
+from backend.utils.providers import LatencyProfile
+
+SAMPLES_SQL = """
+SELECT (metadata->>'duration_ms')::int AS duration_ms,
+       output_tokens,
+       (metadata->>'ttft_ms')::int AS ttft_ms,
+       metadata->>'phase' AS phase
+FROM llm_interactions
+WHERE created_at > NOW() - make_interval(days => $1)
+  AND coalesce(model_name, '') NOT LIKE 'MOCK_%'
+  AND coalesce((metadata->>'cache_hit')::boolean, false) = false
+  AND coalesce((metadata->>'coalesced')::boolean, false) = false
+  AND (metadata->>'duration_ms') IS NOT NULL
+  AND output_tokens > 0
+  AND ($2::text IS NULL OR metadata->>'phase' = $2)
+ORDER BY created_at DESC
+LIMIT $3
+"""
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def run(args) -> int:
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        records = await conn.fetch(SAMPLES_SQL, args.days, args.phase, args.limit)
+    finally:
+        await conn.close()
+
+    rows: List[Dict[str, Any]] = [dict(record) for record in records]
+    try:
+        profile = LatencyProfile.from_interactions(rows)
+    except ValueError as e:
+        print(f"{e}: nothing to export")
+        return 1
+
+    with open(args.output, "w") as f:
+        json.dump({"samples": profile.samples}, f)
+
+    durations = [sample["duration_ms"] for sample in profile.samples]
+    tokens = [sample["output_tokens"] for sample in profile.samples]
+    streamed = sum(1 for row in rows if row.get("ttft_ms") is not None)
+    print(f"Wrote {len(profile.samples)} samples to {args.output} ({streamed} with a recorded time to first token)")
+    for name, values in (("duration_ms", durations), ("output_tokens", tokens)):
+        print(f"  {name:14} p50={_percentile(values, 0.5):8.0f}  p90={_percentile(values, 0.9):8.0f}  p99={_percentile(values, 0.99):8.0f}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="defaults to DATABASE_URL")
+    parser.add_argument("--days", type=int, default=14, help="only calls from the last N days")
+    parser.add_argument("--phase", default=None, help="only calls made in this phase")
+    parser.add_argument("--limit", type=int, default=20000, help="most recent N calls")
+    parser.add_argument("--output", default="llm_profile.json")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or DATABASE_URL is required")
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark: INSTRUCTOR_METADATA post-processing
+
+Compares the previous two-regex post-processing (one DOTALL search to extract the
+metadata, one DOTALL substitution to strip it) against the single-pass
+InstructorMetadataParser, both on complete responses (the /api/chat path) and fed in
+small chunks (the /api/chat/stream path).
+
+Run from the project root:
+    python -m backend.benchmarks.metadata_parser_bench
+"""
+
+import re
+import sys
+import os
+import timeit
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(os.path.dirname(current_dir)))
+
+from backend.utils.metadata_parser import InstructorMetadataParser, parse_llm_response
+
+METADATA_BLOCK = """
+<!-- INSTRUCTOR_METADATA
+Overall_Score: 5
+Lowest_Category: MEDIUM
+Scaffolding: Targeted suggestions + Template
+Task_Identification: HIGH
+Resource_Specificity: MEDIUM
+-->
+"""
+
+PARAGRAPH = (
+    "## Guidance\nYour plan names the course but not the specific resources. "
+    "<!-- keep --> Consider which chapters map to which objectives, and <b>why</b>.\n\n"
+)
+
+
+def regex_postprocess(raw_content):
+    metadata = {}
+    match = re.search(r"<!-- INSTRUCTOR_METADATA\n(.*?)\n-->", raw_content, re.DOTALL)
+    if match:
+        for line in match.group(1).split('\n'):
+            if ':' in line:
+                key, value = line.split(':', 1)
+                key = key.strip().lower().replace(" ", "_")
+                value = value.strip()
+                try:
+                    value = float(value) if '.' in value else int(value)
+                except (ValueError, TypeError):
+                    pass
+                metadata[key] = value
+    cleaned = re.sub(r"<!-- INSTRUCTOR_METADATA.*?-->", "", raw_content, flags=re.DOTALL).strip()
+    return cleaned, metadata
+
+
+def regex_streamed(chunks):
+    # Without an incremental parser the only option is to re-scan the accumulated text
+    raw = ""
+    for chunk in chunks:
+        raw += chunk
+        regex_postprocess(raw)
+    return regex_postprocess(raw)
+
+
+def parser_streamed(chunks):
+    parser = InstructorMetadataParser()
+    visible = [parser.feed(chunk) for chunk in chunks]
+    visible.append(parser.close())
+    return "".join(visible).strip(), parser.evaluation
+
+
+def main():
+    print(f"{'size':>10} {'regex (full)':>14} {'parser (full)':>14} {'regex (stream)':>15} {'parser (stream)':>16}")
+    for paragraphs in (10, 100, 1000):
+        response = PARAGRAPH * paragraphs + METADATA_BLOCK
+        chunks = [response[i:i + 16] for i in range(0, len(response), 16)]
+        assert regex_postprocess(response) == parse_llm_response(response)
+        assert regex_postprocess(response) == parser_streamed(chunks)
+
+        full_number = max(10, 20000 // paragraphs)
+        stream_number = max(1, 200 // paragraphs)
+        regex_full = timeit.timeit(lambda: regex_postprocess(response), number=full_number) / full_number
+        parser_full = timeit.timeit(lambda: parse_llm_response(response), number=full_number) / full_number
+        regex_stream = timeit.timeit(lambda: regex_streamed(chunks), number=stream_number) / stream_number
+        parser_stream = timeit.timeit(lambda: parser_streamed(chunks), number=stream_number) / stream_number
+        print(f"{len(response):>10} {regex_full * 1e6:>12.1f}us {parser_full * 1e6:>12.1f}us "
+              f"{regex_stream * 1e3:>13.2f}ms {parser_stream * 1e3:>14.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Query-plan regression check for the hot tables
+
+Seeds a local Postgres (with the database/migrations schema applied) with millions of
+synthetic rows, then EXPLAINs every hot query the backend runs and asserts that each one:
+
+  - reads through the expected index (Index Scan / Index Only Scan), never a Seq Scan
+  - gets its ORDER BY from the index (no Sort node)
+  - stays under a cost bound, so the plan does not degrade as the tables grow
+
+Queries are prepared and explained with plan_cache_mode=force_generic_plan, i.e. the plan a
+prepared statement (asyncpg statement cache, PostgREST) ends up reusing.
+
+The plans depend on the data and its statistics. The seed ends with ANALYZE. On small or
+unanalyzed tables, a Seq Scan can rightly be the cheapest plan and the check fails. The
+default cost bound is sized for the default seed: after changing the seed size, re-tune
+--max-cost. backend/tests/test_query_plans.py runs the same check against a smaller seed.
+
+Run from the project root against a throwaway database (needs asyncpg):
+    python -m backend.benchmarks.query_plan_check --dsn postgresql://postgres@localhost/solbot_bench \\
+        [--apply-migrations] [--seed] [--sessions 20000] [--messages-per-session 100] [--reset]
+
+Exits with status 1 if any check fails.
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import asyncpg
+
+MIGRATIONS_DIR = os.path.join(project_root, "database", "migrations")
+SEED_EMAIL_PREFIX = "plan-check-"
+
+# name -> (SQL, parameter types, expected index, ordered by the index)
+HOT_QUERIES: Dict[str, Tuple[str, Tuple[str, ...], str, bool]] = {
+    "chat history (last N user/assistant messages)": (
+        "SELECT id, role, content, phase, component, created_at FROM messages "
+        "WHERE session_id = $1 AND role IN ('user', 'assistant') ORDER BY created_at DESC, id DESC LIMIT $2",
+        ("uuid", "integer"), "idx_messages_session_created", True
+    ),
+    "transcript page (keyset)": (
+        "SELECT id, role, content, phase, component, created_at FROM messages "
+        "WHERE session_id = $1 AND (created_at, id) > ($2, $3) ORDER BY created_at ASC, id ASC LIMIT $4",
+        ("uuid", "timestamptz", "uuid", "integer"), "idx_messages_session_created", True
+    ),
+    "transcript page (phase/component)": (
+        "SELECT id, role, content, phase, component, created_at FROM messages "
+        "WHERE session_id = $1 AND phase = $2 AND component = $3 AND (created_at, id) > ($4, $5) "
+        "ORDER BY created_at ASC, id ASC LIMIT $6",
+        ("uuid", "text", "text", "timestamptz", "uuid", "integer"), "idx_messages_session_phase_component", True
+    ),
+    "assessments by session/phase/component": (
+        "SELECT id, attempt_number, overall_score, scaffolding_level, created_at FROM assessments "
+        "WHERE session_id = $1 AND phase = $2 AND component = $3 ORDER BY created_at DESC",
+        ("uuid", "text", "text"), "idx_assessments_session_phase_component", True
+    ),
+    "user_data by user": (
+        "SELECT * FROM user_data WHERE user_id = $1 ORDER BY created_at DESC",
+        ("uuid",), "idx_user_data_user_created", True
+    ),
+    "user_data by user and type": (
+        "SELECT * FROM user_data WHERE user_id = $1 AND data_type = $2 ORDER BY created_at DESC",
+        ("uuid", "text"), "idx_user_data_user_type_created", True
+    ),
+    "events by session": (
+        "SELECT id, event_type, phase, component, created_at FROM events "
+        "WHERE session_id = $1 ORDER BY created_at LIMIT $2",
+        ("uuid", "integer"), "idx_events_session_created", True
+    ),
+    "session lookup": (
+        "SELECT id, user_id FROM sessions WHERE id = $1",
+        ("uuid",), "sessions_pkey", False
+    ),
+}
+
+PHASES = ("2", "4", "5")
+COMPONENTS = ("task_a", "task_b", "strategy", "reflection")
+
+
+async def apply_migrations(conn) -> None:
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql"))):
+        print(f"  applying {os.path.basename(path)}")
+        with open(path) as f:
+            await conn.execute(f.read())
+
+
+async def seed(conn, sessions: int, messages_per_session: int, assessments_per_session: int, user_data_per_user: int, events_per_session: int) -> None:
+    """Bulk-generate synthetic users, sessions, messages, assessments, user data and events server-side"""
+    started = time.perf_counter()
+    await conn.execute(
+        f"""
+        INSERT INTO users (id, email)
+        SELECT uuid_generate_v4(), '{SEED_EMAIL_PREFIX}' || g || '@example.com'
+        FROM generate_series(1, $1) g
+        """,
+        sessions
+    )
+    await conn.execute(
+        f"""
+        INSERT INTO sessions (id, user_id, created_at)
+        SELECT uuid_generate_v4(), id, NOW() - INTERVAL '30 days'
+        FROM users WHERE email LIKE '{SEED_EMAIL_PREFIX}%'
+        """
+    )
+    print(f"  {sessions} users and sessions")
+    await conn.execute(
+        f"""
+        INSERT INTO messages (session_id, role, content, phase, component, metadata, created_at)
+        SELECT s.id,
+               (ARRAY['user', 'assistant'])[1 + g % 2],
+               repeat('Synthetic message text. ', 20),
+               (ARRAY{list(PHASES)})[1 + (g / 40) % {len(PHASES)}],
+               (ARRAY{list(COMPONENTS)})[1 + (g / 10) % {len(COMPONENTS)}],
+               jsonb_build_object('raw_llm_response', repeat('x', 500), 'api_usage', jsonb_build_object('input_tokens', g)),
+               s.created_at + g * INTERVAL '1 minute'
+        FROM sessions s
+        JOIN users u ON u.id = s.user_id AND u.email LIKE '{SEED_EMAIL_PREFIX}%'
+        CROSS JOIN generate_series(1, $1) g
+        """,
+        messages_per_session
+    )
+    print(f"  {sessions * messages_per_session} messages")
+    await conn.execute(
+        f"""
+        INSERT INTO assessments (session_id, user_id, phase, component, attempt_number, overall_score,
+                                 scaffolding_level, full_evaluation, created_at)
+        SELECT s.id, s.user_id,
+               (ARRAY{list(PHASES)})[1 + g % {len(PHASES)}],
+               (ARRAY{list(COMPONENTS)})[1 + g % {len(COMPONENTS)}],
+               1 + g / {len(COMPONENTS)}, 1 + g % 3, 1 + g % 3,
+               jsonb_build_object('overall_score', 1 + g % 3),
+               s.created_at + g * INTERVAL '1 hour'
+        FROM sessions s
+        JOIN users u ON u.id = s.user_id AND u.email LIKE '{SEED_EMAIL_PREFIX}%'
+        CROSS JOIN generate_series(1, $1) g
+        """,
+        assessments_per_session
+    )
+    print(f"  {sessions * assessments_per_session} assessments")
+    await conn.execute(
+        f"""
+        INSERT INTO user_data (user_id, data_type, value, metadata, created_at)
+        SELECT u.id, (ARRAY['survey', 'reflection', 'goal', 'event'])[1 + g % 4], 'value ' || g,
+               jsonb_build_object('source', 'plan-check'), NOW() - g * INTERVAL '1 hour'
+        FROM users u
+        CROSS JOIN generate_series(1, $1) g
+        WHERE u.email LIKE '{SEED_EMAIL_PREFIX}%'
+        """,
+        user_data_per_user
+    )
+    print(f"  {sessions * user_data_per_user} user_data rows")
+    await conn.execute(
+        f"""
+        INSERT INTO events (session_id, event_type, phase, component, metadata, created_at)
+        SELECT s.id,
+               (ARRAY['video_play', 'video_pause', 'video_progress_milestone', 'knowledge_check_answered'])[1 + g % 4],
+               (ARRAY{list(PHASES)})[1 + (g / 40) % {len(PHASES)}],
+               'video_player',
+               jsonb_build_object('video_title', 'Synthetic video', 'current_time', g),
+               s.created_at + g * INTERVAL '20 seconds'
+        FROM sessions s
+        JOIN users u ON u.id = s.user_id AND u.email LIKE '{SEED_EMAIL_PREFIX}%'
+        CROSS JOIN generate_series(1, $1) g
+        """,
+        events_per_session
+    )
+    print(f"  {sessions * events_per_session} events")
+    for table in ("users", "sessions", "messages", "assessments", "user_data", "events"):
+        await conn.execute(f"ANALYZE {table}")
+    print(f"  seeded in {time.perf_counter() - started:.0f}s")
+
+
+async def reset(conn) -> None:
+    # Events have no foreign key; sessions, messages, assessments and user_data go with their
+    # users (ON DELETE CASCADE)
+    await conn.execute(
+        f"""
+        DELETE FROM events WHERE session_id IN (
+            SELECT s.id FROM sessions s JOIN users u ON u.id = s.user_id WHERE u.email LIKE '{SEED_EMAIL_PREFIX}%'
+        )
+        """
+    )
+    await conn.execute(f"DELETE FROM users WHERE email LIKE '{SEED_EMAIL_PREFIX}%'")
+
+
+async def sample_arguments(conn) -> Dict[str, List[Any]]:
+    """Real keys from the seeded data, from the middle of a session so the keyset has work to do"""
+    row = await conn.fetchrow(
+        f"""
+        SELECT s.id AS session_id, s.user_id
+        FROM sessions s JOIN users u ON u.id = s.user_id
+        WHERE u.email LIKE '{SEED_EMAIL_PREFIX}%'
+        LIMIT 1
+        """
+    )
+    if row is None:
+        raise SystemExit("No seeded data found: run with --seed first")
+    middle = await conn.fetchrow(
+        "SELECT id, created_at, phase, component FROM messages WHERE session_id = $1 "
+        "ORDER BY created_at OFFSET (SELECT COUNT(*) / 2 FROM messages WHERE session_id = $1) LIMIT 1",
+        row["session_id"]
+    )
+    session_id, user_id = str(row["session_id"]), str(row["user_id"])
+    cursor_at, cursor_id = middle["created_at"].isoformat(), str(middle["id"])
+    return {
+        "chat history (last N user/assistant messages)": [session_id, 10],
+        "transcript page (keyset)": [session_id, cursor_at, cursor_id, 50],
+        "transcript page (phase/component)": [session_id, middle["phase"], middle["component"], cursor_at, cursor_id, 50],
+        "assessments by session/phase/component": [session_id, PHASES[0], COMPONENTS[0]],
+        "user_data by user": [user_id],
+        "user_data by user and type": [user_id, "survey"],
+        "events by session": [session_id, 200],
+        "session lookup": [session_id],
+    }
+
+
+def plan_nodes(plan: Dict[str, Any]):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def literal(value: Any) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+async def explain(conn, name: str, sql: str, types: Tuple[str, ...], args: List[Any]) -> Dict[str, Any]:
+    statement = "plan_check_" + "".join(c if c.isalnum() else "_" for c in name)
+    await conn.execute(f"PREPARE {statement} ({', '.join(types)}) AS {sql}")
+    try:
+        raw = await conn.fetchval(
+            f"EXPLAIN (FORMAT JSON) EXECUTE {statement} ({', '.join(literal(a) for a in args)})"
+        )
+    finally:
+        await conn.execute(f"DEALLOCATE {statement}")
+    return (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+
+
+def check(plan: Dict[str, Any], expected_index: str, ordered: bool, max_cost: float) -> List[str]:
+    problems = []
+    nodes = list(plan_nodes(plan))
+    node_types = {node["Node Type"] for node in nodes}
+    indexes = {node.get("Index Name") for node in nodes if node["Node Type"] in ("Index Scan", "Index Only Scan")}
+    if "Seq Scan" in node_types:
+        problems.append("sequential scan")
+    if expected_index not in indexes:
+        problems.append(f"expected an index scan on {expected_index}, got {sorted(i for i in indexes if i) or sorted(node_types)}")
+    if ordered and ({"Sort", "Incremental Sort"} & node_types):
+        problems.append("explicit sort (ORDER BY not served by the index)")
+    if plan["Total Cost"] > max_cost:
+        problems.append(f"total cost {plan['Total Cost']:.0f} > {max_cost:.0f}")
+    return problems
+
+
+async def check_hot_queries(conn, max_cost: float) -> Dict[str, Tuple[Dict[str, Any], List[str]]]:
+    """Plan and problems of every hot query, explained with seeded keys as generic plans"""
+    await conn.execute("SET plan_cache_mode = force_generic_plan")
+    samples = await sample_arguments(conn)
+    results = {}
+    for name, (sql, types, expected_index, ordered) in HOT_QUERIES.items():
+        plan = await explain(conn, name, sql, types, samples[name])
+        results[name] = (plan, check(plan, expected_index, ordered, max_cost))
+    return results
+
+
+async def run(args) -> int:
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        if args.apply_migrations:
+            print("Applying migrations")
+            await apply_migrations(conn)
+        if args.reset:
+            print("Removing previously seeded rows")
+            await reset(conn)
+        if args.seed:
+            print("Seeding")
+            await seed(conn, args.sessions, args.messages_per_session, args.assessments_per_session, args.user_data_per_user, args.events_per_session)
+
+        failures = 0
+        print(f"\n{'query':<42} {'cost':>8}  result")
+        for name, (plan, problems) in (await check_hot_queries(conn, args.max_cost)).items():
+            failures += bool(problems)
+            print(f"{name:<42} {plan['Total Cost']:>8.1f}  {'ok' if not problems else 'FAIL: ' + '; '.join(problems)}")
+            if problems and args.verbose:
+                print(json.dumps(plan, indent=2))
+        print(f"\n{len(HOT_QUERIES) - failures}/{len(HOT_QUERIES)} hot queries use their index")
+        return 1 if failures else 0
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="defaults to DATABASE_URL")
+    parser.add_argument("--apply-migrations", action="store_true", help="run database/migrations/*.sql first (empty database)")
+    parser.add_argument("--seed", action="store_true", help="generate synthetic rows before checking")
+    parser.add_argument("--reset", action="store_true", help="delete previously seeded rows")
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--messages-per-session", type=int, default=100)
+    parser.add_argument("--assessments-per-session", type=int, default=12)
+    parser.add_argument("--user-data-per-user", type=int, default=20)
+    parser.add_argument("--events-per-session", type=int, default=200)
+    parser.add_argument("--max-cost", type=float, default=500.0, help="upper bound on each plan's total cost")
+    parser.add_argument("--verbose", action="store_true", help="print the plan of failing queries")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or DATABASE_URL is required")
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
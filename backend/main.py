@@ -2,6 +2,7 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import uvicorn
+import asyncio
 import os
 import sys
 import logging
@@ -33,15 +34,15 @@ try:
         logger.info("Attempting to import from backend package...")
         from backend.utils.keep_warm import start_warmup_thread
         # If this succeeds, we're likely running from project root
-        from backend.routes.chat import router as main_api_router
-        from backend.utils import db
+        from backend.routes.chat import router as main_api_router, idempotency, summarizer
+        from backend.utils import db, llm
         logger.info("Successfully imported modules from backend package")
     except ImportError as e:
         logger.info(f"Backend package import failed: {e}, trying direct import...")
         # If that fails, try direct import (running from backend dir)
         from utils.keep_warm import start_warmup_thread
-        from routes.chat import router as main_api_router
-        from utils import db
+        from routes.chat import router as main_api_router, idempotency, summarizer
+        from utils import db, llm
         logger.info("Successfully imported modules directly")
 except Exception as e:
     logger.error(f"All import attempts failed: {e}")
@@ -59,13 +60,24 @@ async def lifespan(app: FastAPI):
     
     # Initialize database with error handling
     try:
-        db.get_db()
-        logger.info("Database initialized")
+        await db.connect()
+        logger.info(f"Database initialized ({db.DB_BACKEND})")
     except Exception as db_err:
         logger.error(f"Database initialization failed: {db_err}")
     
     logger.info("Using simplified direct LLM architecture")
     
+    # Reclaim expired LLM cache entries that are never read again
+    cache_sweeper = asyncio.create_task(llm.response_cache.run_sweeper())
+    # ... and stored responses of idempotent requests
+    idempotency_sweeper = asyncio.create_task(idempotency.results.run_sweeper())
+    # Batch inserts of messages, assessments and LLM logs off the request path
+    write_behind_flusher = asyncio.create_task(db.write_behind.run())
+    # Replay rows kept in the local outbox during database outages
+    outbox_replayer = asyncio.create_task(db.outbox.run_replayer(db.row_replayer))
+    # Fold long sessions' older turns into running summaries, off the request path
+    summary_worker = asyncio.create_task(summarizer.run())
+    
     # Start the warmup thread to keep the service from sleeping
     if os.environ.get("ENABLE_WARMUP", "true").lower() == "true":
         logger.info("Starting warmup service...")
@@ -74,6 +86,16 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown: cleanup resources
     logger.info("SoL2LBot backend shutting down...")
+    cache_sweeper.cancel()
+    idempotency_sweeper.cancel()
+    # Flush queued rows before stopping the flusher so nothing is lost on a clean shutdown
+    await db.write_behind.close()
+    write_behind_flusher.cancel()
+    outbox_replayer.cancel()
+    summary_worker.cancel()
+    db.shutdown()
+    await db.close()
+    await llm.tiered_cache.close()
 
 # Initialize FastAPI
 app = FastAPI(
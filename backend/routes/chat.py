@@ -1,26 +1,44 @@
 import logging
 import asyncio
+import base64
+import hashlib
+import re
 import uuid
 from datetime import datetime
 import traceback
 import time
-import re
 import json
 import sys
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Union
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 sys.path.append(os.path.abspath('..'))
 from prompt_engineering.scripts.final_prompts import get_prompt
-from backend.utils import db
-from backend.utils.llm import call_claude
+from backend.utils import db, pg
+from backend.utils.llm import call_claude, stream_claude, get_llm_stats
+from backend.utils.metadata_parser import InstructorMetadataParser, parse_llm_response
+from backend.utils.deadline import Deadline, DeadlineExceeded
+from backend.utils.idempotency import IdempotencyStore, request_key
+from backend.utils.summarizer import ConversationSummarizer, drop_summarized
 
 logger = logging.getLogger("solbot.routes.chat")
 router = APIRouter(prefix="/api", tags=["main"])
 
+MAX_PAGE_SIZE = 200
+MAX_EVENT_BATCH = int(os.getenv("MAX_EVENT_BATCH", "500"))
+
+# Responses of finished /chat, /submit and /events requests, and the ones still running, by
+# idempotency key: proxy retries get the original response instead of a second turn
+idempotency = IdempotencyStore()
+
+# Running summaries of long sessions' older turns (SUMMARY_PHASES), updated in the background
+summarizer = ConversationSummarizer()
+_TIMESTAMP = re.compile(r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d{1,6})?(Z|[+-]\d{2}(:?\d{2})?)?$")
+
 # --- Pydantic Models ---
 class OnboardingRequest(BaseModel):
     name: str
@@ -30,9 +48,14 @@ class OnboardingRequest(BaseModel):
 class EventRequest(BaseModel):
     session_id: str
     event_type: str
-    phase: str
-    component: str
-    metadata: Dict[str, Any]
+    phase: Optional[str] = None
+    component: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+    # When the event happened on the client, for events that were buffered before sending
+    client_ts: Optional[datetime] = None
+
+class EventBatchRequest(BaseModel):
+    events: List[EventRequest]
 
 class ChatRequest(BaseModel):
     session_id: str
@@ -58,12 +81,12 @@ class UserDataRequest(BaseModel):
 # --- API Endpoints ---
 @router.on_event("startup")
 async def startup_event():
-    db.get_db()
+    await db.connect()
 
 @router.post("/onboarding")
 async def handle_onboarding(request: OnboardingRequest):
     try:
-        session_info = db.create_user_and_session(
+        session_info = await db.create_user_and_session(
             name=request.name, email=request.email, profile_data=request.profile_data
         )
         return {"success": True, "data": session_info}
@@ -72,25 +95,64 @@ async def handle_onboarding(request: OnboardingRequest):
         raise HTTPException(status_code=500, detail="Failed to create user session.")
 
 @router.post("/events")
-async def log_event(request: EventRequest):
+async def log_event(
+    request: Union[EventBatchRequest, List[EventRequest], EventRequest],
+    idempotency_key: Optional[str] = Header(None)
+):
+    """
+    Logs UI events to the append-only events table. Accepts one event, a list of events or
+    {"events": [...]}, so clients can buffer events and flush them in one request.
+    A resent batch (same Idempotency-Key, or every event carrying the same client_ts) is
+    acknowledged without being logged again.
+    """
+    if isinstance(request, EventBatchRequest):
+        events = request.events
+    elif isinstance(request, list):
+        events = request
+    else:
+        events = [request]
+    if len(events) > MAX_EVENT_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_EVENT_BATCH} events per request.")
+    rows = [
+        {
+            "session_id": event.session_id,
+            "event_type": event.event_type,
+            "phase": event.phase,
+            "component": event.component,
+            "metadata": event.metadata,
+            "client_ts": event.client_ts.isoformat() if event.client_ts else None
+        }
+        for event in events
+    ]
+
+    async def queue_batch():
+        queued = await db.queue_events(rows)
+        return {"success": True, "data": {"count": len(queued)}}
+
     try:
-        db.log_message(
-            session_id=request.session_id, role="system", content=request.event_type,
-            phase=request.phase, component=request.component, metadata=request.metadata
-        )
-        return {"success": True}
+        # Without a client key, only batches whose events all carry client_ts can be told apart
+        # from a new batch with the same content
+        if idempotency_key or all(row["client_ts"] for row in rows):
+            key, derived = request_key("events", rows, idempotency_key)
+            response, _ = await idempotency.run(key, queue_batch, derived=derived)
+            return response
+        return await queue_batch()
     except Exception as e:
         logger.error(f"Event logging error: {e}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="Failed to log event.")
 
 @router.post("/submit")
-async def handle_submission(request: SubmitRequest):
+async def handle_submission(
+    request: SubmitRequest,
+    x_request_timeout_ms: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None)
+):
     # Compatibility layer for older components
     chat_req = ChatRequest(
         session_id=request.conversation_id, message=request.message,
         phase=request.phase, component=request.component, is_submission=True
     )
-    return await process_chat(chat_req)
+    return await process_chat(chat_req, x_request_timeout_ms, idempotency_key)
 
 @router.post("/user-data/{user_id}")
 async def store_user_data(user_id: str, request: UserDataRequest):
@@ -118,79 +180,302 @@ async def get_user_data(user_id: str, data_type: str = None):
         logger.error(f"User data retrieval error: {e}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="Failed to retrieve user data.")
 
+@router.get("/llm/stats")
+async def llm_stats():
+    return get_llm_stats()
+
+@router.get("/db/stats")
+async def db_stats():
+    stats = {
+        "backend": db.DB_BACKEND,
+        "conversation_cache": db.conversation_cache.stats(),
+        "write_behind": db.write_behind.stats(),
+        "outbox": db.outbox.stats()
+    }
+    if db.USE_POSTGRES:
+        stats["postgres"] = pg.stats()
+    stats["idempotency"] = idempotency.stats()
+    stats["summarizer"] = summarizer.stats()
+    return stats
+
+@router.get("/sessions/{session_id}/messages")
+async def list_session_messages(
+    session_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    phase: Optional[str] = None,
+    component: Optional[str] = None,
+    include_metadata: bool = False,
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Pages through a session's messages for transcript views and research tools.
+
+    Keyset pagination on (created_at, id): pass the previous page's `next_cursor` as `cursor`
+    (also to poll for newer messages once `has_more` is false). Message metadata is only
+    returned with include_metadata=true. Messages are never edited, so a page is identified
+    by its rows: each response has an ETag and If-None-Match gets a 304 for an unchanged page.
+    The ETag is checked first against the page's ids and timestamps alone (an index-only read),
+    so an unchanged page costs neither the content and metadata read nor the transfer.
+    """
+    after = _decode_cursor(cursor) if cursor else None
+
+    async def fetch_page(columns: Tuple[str, ...], with_metadata: bool) -> List[Dict[str, Any]]:
+        return await db.list_messages(
+            session_id, limit=limit + 1, after=after, descending=order == "desc",
+            phase=phase, component=component, include_metadata=with_metadata, columns=columns
+        )
+
+    try:
+        if if_none_match:
+            keys = await fetch_page(("id", "created_at"), False)
+            etag = _page_etag(keys[:limit], include_metadata, len(keys) > limit)
+            if _etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+        rows = await fetch_page(db.MESSAGE_COLUMNS, include_metadata)
+    except Exception as e:
+        logger.error(f"Message history error for session {session_id}: {e}\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve messages.")
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = _encode_cursor(rows[-1]) if rows else cursor
+    etag = _page_etag(rows, include_metadata, has_more)
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return {"success": True, "data": {"messages": rows, "next_cursor": next_cursor, "has_more": has_more}}
+
 @router.post("/chat")
-async def process_chat(request: ChatRequest):
+async def process_chat(
+    request: ChatRequest,
+    x_request_timeout_ms: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None)
+):
+    """
+    Runs one chat turn. A retry of the same request (same Idempotency-Key, or without one the
+    same session, message and submission details within IDEMPOTENCY_DERIVED_TTL) gets the
+    original turn's response - or waits for it if it is still running - so it never logs the
+    message or calls Claude a second time.
+    """
     start_time = time.time()
+    # Every stage gets only what is left of the caller's budget (X-Request-Timeout-Ms)
+    deadline = Deadline.from_header(x_request_timeout_ms)
+    key, derived = request_key("chat", request.model_dump(), idempotency_key)
     try:
-        user_message_record = db.log_message(
-            session_id=request.session_id, role="user", content=request.message,
-            phase=request.phase, component=request.component,
-            metadata={"is_submission": request.is_submission, "attempt_number": request.attempt_number}
-        )
-        chat_history = db.get_messages_for_session(request.session_id, limit=10)
-        formatted_history = [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in chat_history if msg["role"] in ["user", "assistant"]
-        ] if chat_history else []
-        
-        try:
-            prompt_name = f"phase{request.phase}_{request.component}"
-            system_prompt = get_prompt(prompt_name)
-        except ValueError:
-            system_prompt = "You are SoL2LBot, an AI tutor for self-regulated learning."
-        
-        llm_response = await call_claude(
-            system_prompt=system_prompt, user_message=request.message,
-            chat_history=formatted_history, temperature=0.5, max_tokens=800
-        )
-        
-        response_content = llm_response.get("content", "")
-        evaluation_metadata = _extract_evaluation_metadata(response_content)
-        cleaned_content = _clean_message_for_student(response_content)
-        
-        assistant_message_record = db.log_message(
-            session_id=request.session_id, role="assistant", content=cleaned_content,
-            phase=request.phase, component=request.component,
-            metadata={"api_usage": llm_response.get("usage", {}), "evaluation": evaluation_metadata, "raw_llm_response": response_content}
-        )
-        
-        if request.is_submission and evaluation_metadata:
-            session_details = db.get_session_by_id(request.session_id)
-            if session_details:
-                db.log_assessment(
-                    session_id=request.session_id, user_id=session_details["user_id"],
-                    submission_message_id=user_message_record["id"], feedback_message_id=assistant_message_record["id"],
-                    phase=request.phase, component=request.component,
-                    attempt_number=request.attempt_number, evaluation=evaluation_metadata
-                )
-        
-        logger.info(f"Request for session {request.session_id} completed in {time.time() - start_time:.2f}s")
-        return {"success": True, "data": {"message": cleaned_content, "evaluation": evaluation_metadata}}
+        response, outcome = await idempotency.run(key, lambda: _chat_turn(request, deadline), derived=derived)
+        if outcome != "new":
+            logger.info(f"Session {request.session_id}: {outcome} response for a repeated request")
+        else:
+            logger.info(f"Request for session {request.session_id} completed in {time.time() - start_time:.2f}s")
+        return response
 
+    except DeadlineExceeded as e:
+        logger.warning(f"Session {request.session_id}: {e} ({time.time() - start_time:.2f}s)")
+        raise HTTPException(status_code=504, detail="The request took longer than its deadline.")
     except Exception as e:
         logger.error(f"Chat processing error: {e}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="Failed to process chat message.")
 
+@router.post("/chat/stream")
+async def process_chat_stream(request: ChatRequest, x_request_timeout_ms: Optional[str] = Header(None)):
+    """
+    Server-Sent Events variant of /chat.
+
+    Emits `delta` events with student-visible text as Claude generates it, an `evaluation`
+    event as soon as the INSTRUCTOR_METADATA block has been parsed, then a single `done`
+    event with the cleaned message and evaluation (or an `error` event). The deadline
+    (X-Request-Timeout-Ms) bounds setup and the wait for the first token. The turn
+    runs in its own task so that a client disconnect does not abort generation: the
+    assistant message and assessment are still recorded once the stream completes.
+    """
+    deadline = Deadline.from_header(x_request_timeout_ms)
+    try:
+        user_message_record, formatted_history, system_prompt, user_id, summary = await _prepare_chat_turn(request, deadline)
+    except DeadlineExceeded as e:
+        logger.warning(f"Session {request.session_id}: {e}")
+        raise HTTPException(status_code=504, detail="The request took longer than its deadline.")
+    except Exception as e:
+        logger.error(f"Chat stream setup error: {e}\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="Failed to process chat message.")
+
+    events: asyncio.Queue = asyncio.Queue()
+    turn_task = asyncio.create_task(
+        _run_streamed_turn(request, user_message_record, formatted_history, system_prompt, events, deadline, user_id, summary)
+    )
+
+    async def event_source():
+        while True:
+            event_name, payload = await events.get()
+            yield _format_sse(event_name, payload)
+            if event_name in ("done", "error"):
+                break
+
+    response = StreamingResponse(event_source(), media_type="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # Disable proxy buffering so deltas flush immediately
+    # Keep a reference so the turn is not garbage collected if the client goes away
+    _background_turns.add(turn_task)
+    turn_task.add_done_callback(_background_turns.discard)
+    return response
+
 # --- Helper Functions ---
-def _extract_evaluation_metadata(raw_content: str) -> Dict[str, Any]:
-    metadata = {}
-    match = re.search(r"<!-- INSTRUCTOR_METADATA\n(.*?)\n-->", raw_content, re.DOTALL)
-    if not match: return metadata
+# Streamed turns still running after their client disconnected
+_background_turns: set = set()
+
+async def _chat_turn(request: ChatRequest, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """The work of one /chat request: log the message, call Claude, record the reply."""
+    user_message_record, formatted_history, system_prompt, user_id, summary = await _prepare_chat_turn(request, deadline)
+
+    llm_response = await call_claude(
+        system_prompt=system_prompt, user_message=request.message,
+        chat_history=formatted_history, temperature=0.5, max_tokens=800, deadline=deadline,
+        phase=request.phase, component=request.component, summary=summary
+    )
+    if llm_response.get("error") == "deadline_exceeded":
+        raise DeadlineExceeded(llm_response.get("stage", "Claude response"))
+
+    cleaned_content, evaluation_metadata = await _record_chat_turn(request, user_message_record, llm_response, user_id=user_id)
+    return {"success": True, "data": {"message": cleaned_content, "evaluation": evaluation_metadata}}
+
+async def _prepare_chat_turn(request: ChatRequest, deadline: Optional[Deadline] = None):
+    """Log the student's message and gather the history, system prompt, session user and running summary for the LLM call.
+
+    On a cache miss, one database round trip (begin_chat_turn) stores the message and returns the
+    prior history; when the session's recent messages are cached, only the id of the latest stored
+    message is checked. The phase summary is read alongside it, and the history messages it
+    already covers are left out.
+    """
+    turn, summary = await asyncio.gather(
+        db.begin_chat_turn(
+            session_id=request.session_id, content=request.message,
+            phase=request.phase, component=request.component,
+            metadata={"is_submission": request.is_submission, "attempt_number": request.attempt_number},
+            history_limit=10, deadline=deadline
+        ),
+        summarizer.get(request.session_id, request.phase, deadline)
+    )
+    user_message_record = turn["message"]
+    chat_history = drop_summarized(turn["history"], summary)
+    formatted_history = [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in chat_history if msg["role"] in ["user", "assistant"]
+    ] if chat_history else []
+    
+    try:
+        prompt_name = f"phase{request.phase}_{request.component}"
+        system_prompt = get_prompt(prompt_name)
+    except ValueError:
+        system_prompt = "You are SoL2LBot, an AI tutor for self-regulated learning."
+    return user_message_record, formatted_history, system_prompt, turn.get("user_id"), summary["summary"] if summary else None
+
+async def _record_chat_turn(
+    request: ChatRequest,
+    user_message_record: Dict[str, Any],
+    llm_response: Dict[str, Any],
+    parsed: Optional[Tuple[str, Dict[str, Any]]] = None,
+    user_id: Optional[str] = None
+):
+    """Persist the assistant reply (and assessment for submissions); returns the cleaned text and evaluation.
+
+    Not bound by the request deadline: once a response exists it is research data and is kept.
+    `parsed` lets the streaming path pass in the text and evaluation it already extracted.
+    The reply and assessment are written together in one round trip (complete_chat_turn); the
+    session's phase summary is then scheduled for a background update.
+    """
+    response_content = llm_response.get("content", "")
+    cleaned_content, evaluation_metadata = parsed if parsed is not None else parse_llm_response(response_content)
     
-    for line in match.group(1).split('\n'):
-        if ':' in line:
-            key, value = line.split(':', 1)
-            key = key.strip().lower().replace(" ", "_")
-            value = value.strip()
-            try:
-                if '.' in value:
-                    value = float(value)
-                else:
-                    value = int(value)
-            except (ValueError, TypeError):
-                pass
-            metadata[key] = value
-    return metadata
-
-def _clean_message_for_student(raw_content: str) -> str:
-    return re.sub(r"<!-- INSTRUCTOR_METADATA.*?-->", "", raw_content, flags=re.DOTALL).strip()
+    await db.complete_chat_turn(
+        session_id=request.session_id, user_id=user_id,
+        submission_message_id=user_message_record["id"], content=cleaned_content,
+        phase=request.phase, component=request.component,
+        metadata={"api_usage": llm_response.get("usage", {}), "evaluation": evaluation_metadata, "raw_llm_response": response_content},
+        attempt_number=request.attempt_number,
+        evaluation=evaluation_metadata if request.is_submission else None
+    )
+    summarizer.schedule(request.session_id, request.phase)
+    return cleaned_content, evaluation_metadata
+
+async def _run_streamed_turn(
+    request: ChatRequest,
+    user_message_record: Dict[str, Any],
+    formatted_history: List[Dict[str, Any]],
+    system_prompt: str,
+    events: asyncio.Queue,
+    deadline: Optional[Deadline] = None,
+    user_id: Optional[str] = None,
+    summary: Optional[str] = None
+) -> None:
+    start_time = time.time()
+    # Publish the evaluation as soon as the metadata block closes, ahead of the final event
+    parser = InstructorMetadataParser(on_evaluation=lambda evaluation: events.put_nowait(("evaluation", evaluation)))
+    visible_parts: List[str] = []
+    try:
+        llm_response: Dict[str, Any] = {}
+        async for event in stream_claude(
+            system_prompt=system_prompt, user_message=request.message,
+            chat_history=formatted_history, temperature=0.5, max_tokens=800, deadline=deadline,
+            phase=request.phase, component=request.component, summary=summary
+        ):
+            if event["type"] == "text":
+                visible = parser.feed(event["text"])
+                if visible:
+                    visible_parts.append(visible)
+                    await events.put(("delta", {"text": visible}))
+            elif event["type"] == "result":
+                llm_response = event["result"]
+
+        if llm_response.get("error") == "deadline_exceeded":
+            logger.warning(f"Streamed request for session {request.session_id} exceeded its deadline")
+            await events.put(("error", {"detail": "The request took longer than its deadline.", "status": 504}))
+            return
+
+        tail = parser.close()
+        if tail:
+            visible_parts.append(tail)
+            await events.put(("delta", {"text": tail}))
+
+        cleaned_content, evaluation_metadata = await _record_chat_turn(
+            request, user_message_record, llm_response,
+            parsed=("".join(visible_parts).strip(), parser.evaluation), user_id=user_id
+        )
+        await events.put(("done", {"message": cleaned_content, "evaluation": evaluation_metadata}))
+        logger.info(f"Streamed request for session {request.session_id} completed in {time.time() - start_time:.2f}s")
+    except Exception as e:
+        logger.error(f"Chat stream error: {e}\n{traceback.format_exc()}")
+        await events.put(("error", {"detail": "Failed to process chat message."}))
+
+def _encode_cursor(message: Dict[str, Any]) -> str:
+    raw = json.dumps([message["created_at"], message["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    """(created_at, id) from an opaque cursor; validated because it ends up in a query filter"""
+    try:
+        created_at, message_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(created_at, str) or not _TIMESTAMP.fullmatch(created_at):
+            raise ValueError("bad timestamp")
+        if not isinstance(message_id, str):
+            raise ValueError("bad id")
+        return created_at, str(uuid.UUID(message_id))
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+def _page_etag(rows: List[Dict[str, Any]], include_metadata: bool, has_more: bool) -> str:
+    digest = hashlib.sha1(
+        json.dumps([[row.get("id"), row.get("created_at")] for row in rows] + [include_metadata, has_more]).encode()
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/ prefixes are ignored
+    return etag.removeprefix("W/") in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+def _format_sse(event_name: str, payload: Dict[str, Any]) -> str:
+    return f"event: {event_name}\ndata: {json.dumps(payload)}\n\n"
@@ -6,10 +6,11 @@ import logging
 from fastapi import APIRouter, HTTPException
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timezone
 import json
+import uuid
 
-from backend.utils.db import get_db, format_uuid
+from backend.utils.db import get_db, format_uuid, outbox
 
 logger = logging.getLogger("solbot.routes.user_data")
 
@@ -28,32 +29,27 @@ async def save_user_data(user_id: str, data: UserDataItem) -> Dict[str, Any]:
     try:
         logger.info(f"Saving user data for {user_id}: {data.data_type}")
         
+        # Format user ID as UUID
+        uuid_user_id = format_uuid(user_id, "user_")
+        
         # Get database client
         db = get_db()
         
         if db is None:
-            # In-memory fallback if db is not available
-            logger.warning("Database connection not available, using in-memory fallback")
-            return {
-                "id": "memory-id",
-                "user_id": user_id,
-                "data_type": data.data_type,
-                "value": data.value,
-                "metadata": data.metadata,
-                "created_at": datetime.now().isoformat(),
-                "storage_type": "memory"
-            }
-        
-        # Format user ID as UUID
-        uuid_user_id = format_uuid(user_id, "user_")
+            # Keep the row in the durable outbox until the database is available
+            logger.warning("Database connection not available, storing in the outbox")
+            return _store_in_outbox(user_id, uuid_user_id, data, "Database connection not available")
         
         # Check if user exists, create if not - with error handling
+        user_exists = False
         try:
             user_response = db.table("users").select("id").eq("id", uuid_user_id).execute()
-            if not user_response.data:
+            user_exists = bool(user_response.data)
+            if not user_exists:
                 logger.info(f"Creating new user: {uuid_user_id}")
                 try:
                     db.table("users").insert({"id": uuid_user_id}).execute()
+                    user_exists = True
                 except Exception as user_err:
                     # Continue even if user creation fails
                     logger.warning(f"Failed to create user, continuing: {user_err}")
@@ -69,7 +65,7 @@ async def save_user_data(user_id: str, data: UserDataItem) -> Dict[str, Any]:
             "function",  # SQL function
             "direct",    # Direct table insert
             "minimal",   # Minimal fields insert
-            "memory"     # In-memory fallback
+            "outbox"     # Durable local outbox, replayed later
         ]
         
         result = None
@@ -173,56 +169,44 @@ async def save_user_data(user_id: str, data: UserDataItem) -> Dict[str, Any]:
                         logger.warning(f"Minimal insert failed, using in-memory fallback: {minimal_err}")
                         error_details = minimal_err
                 
-                elif method == "memory":
-                    # Ultimate fallback - just return something in memory
-                    result = {
-                        "id": f"memory-{user_id}-{datetime.now().timestamp()}",
-                        "user_id": user_id,
-                        "data_type": data.data_type,
-                        "value": data.value,
-                        "metadata": data.metadata,
-                        "created_at": datetime.now().isoformat(),
-                        "storage_type": "memory",
-                        "error": str(error_details) if error_details else "Using memory fallback"
-                    }
-                    logger.info("Using in-memory fallback storage")
-                    db_success = True
+                elif method == "outbox":
+                    # Ultimate fallback - keep the row on disk and replay it once the database is back
+                    result = _store_in_outbox(
+                        user_id, uuid_user_id, data,
+                        str(error_details) if error_details else "Database inserts failed",
+                        user_exists=user_exists
+                    )
+                    logger.info("Stored user data in the outbox for later replay")
+                    db_success = result["storage_type"] == "outbox"
                     break
             
             except Exception as method_err:
                 logger.warning(f"Error with storage method {method}: {method_err}")
                 error_details = method_err
         
-        # If all methods failed, use the absolute final fallback
         if not db_success:
-            logger.error("All storage methods failed, returning memory fallback")
+            logger.error("All storage methods failed, including the outbox")
+        
+        return result
+    
+    except Exception as e:
+        logger.error(f"Error saving user data: {e}")
+        # Even in case of a total failure, keep the data for replay rather than raise an exception
+        # This ensures the app continues to function even with database errors
+        try:
+            return _store_in_outbox(user_id, format_uuid(user_id, "user_"), data, str(e))
+        except Exception as outbox_err:
+            logger.error(f"Could not store user data in the outbox: {outbox_err}")
             return {
-                "id": f"fallback-{datetime.now().timestamp()}",
+                "id": None,
                 "user_id": user_id,
                 "data_type": data.data_type,
                 "value": data.value,
                 "metadata": data.metadata,
                 "created_at": datetime.now().isoformat(),
-                "storage_type": "emergency-fallback",
-                "error": str(error_details) if error_details else "All storage methods failed"
+                "storage_type": "not-stored",
+                "error": str(e)
             }
-        
-        return result
-    
-    except Exception as e:
-        logger.error(f"Error saving user data: {e}")
-        # Even in case of a total failure, return something rather than raise an exception
-        # This ensures the app continues to function even with database errors
-        return {
-            "id": f"error-{datetime.now().timestamp()}",
-            "user_id": user_id,
-            "data_type": data.data_type,
-            "value": data.value,
-            "metadata": data.metadata,
-            "created_at": datetime.now().isoformat(),
-            "storage_type": "error-fallback",
-            "error": str(e)
-        }
 
 @router.get("/{user_id}")
 async def get_user_data(user_id: str, data_type: Optional[str] = None) -> List[Dict[str, Any]]:
@@ -275,4 +259,41 @@ async def get_user_data(user_id: str, data_type: Optional[str] = None) -> List[D
     except Exception as e:
         logger.error(f"Error retrieving user data: {e}")
         # Return empty list instead of raising exception
-        return [] 
\ No newline at end of file
+        return [] 
+
+def _store_in_outbox(
+    user_id: str,
+    uuid_user_id: str,
+    data: UserDataItem,
+    reason: str,
+    user_exists: bool = False
+) -> Dict[str, Any]:
+    """
+    Append the row to the durable outbox; it is inserted when the replayer next reaches the database
+
+    The row gets its id and created_at now, so the caller can be given the id and the replayed
+    row keeps the time it was saved. Unless the user row is known to exist it is queued first:
+    replay writes users before user_data (and ignores a user that already exists).
+    """
+    if not user_exists:
+        outbox.add("users", {"id": uuid_user_id})
+    row = {
+        "id": str(uuid.uuid4()),
+        "user_id": uuid_user_id,
+        "data_type": data.data_type,
+        "value": data.value,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    if data.metadata:
+        row["metadata"] = json.dumps(data.metadata)
+    stored = outbox.add("user_data", row)
+    return {
+        "id": row["id"] if stored else None,
+        "user_id": user_id,
+        "data_type": data.data_type,
+        "value": data.value,
+        "metadata": data.metadata,
+        "created_at": row["created_at"],
+        "storage_type": "outbox" if stored else "not-stored",
+        "error": reason
+    }
@@ -0,0 +1,109 @@
+"""
+Tests for the L1 response cache and the Redis L2 behind it
+
+The L2 tests need a Redis-protocol server: set TEST_REDIS_URL (or LLM_CACHE_REDIS_URL), e.g.
+redis://localhost:6379/15. Keys are written under a unique prefix and removed afterwards.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+
+from backend.utils import cache
+from backend.utils.cache import RedisCacheBackend, ResponseCache, TieredCache
+
+REDIS_URL = os.getenv("TEST_REDIS_URL") or os.getenv("LLM_CACHE_REDIS_URL")
+
+requires_redis_package = pytest.mark.skipif(cache.redis_asyncio is None, reason="redis package not installed")
+requires_redis = pytest.mark.skipif(
+    cache.redis_asyncio is None or not REDIS_URL, reason="TEST_REDIS_URL not set"
+)
+
+RESPONSE = {"content": "Well structured goals.", "usage": {"input_tokens": 120, "output_tokens": 30}}
+
+
+def test_l1_entries_expire():
+    l1 = ResponseCache(ttl_seconds=0.05)
+    l1.put("key", RESPONSE)
+    assert l1.get("key") == RESPONSE
+    time.sleep(0.06)
+    assert l1.get("key") is None
+    assert l1.stats()["expirations"] == 1
+
+
+def test_l1_evicts_least_recently_used():
+    l1 = ResponseCache(max_entries=2)
+    l1.put("a", RESPONSE)
+    l1.put("b", RESPONSE)
+    l1.get("a")
+    l1.put("c", RESPONSE)
+    assert "a" in l1 and "c" in l1 and "b" not in l1
+
+
+async def _with_backend(test):
+    backend = RedisCacheBackend(REDIS_URL, prefix=f"solbot:test:{uuid.uuid4().hex}:")
+    try:
+        await test(backend)
+    finally:
+        keys = await backend._client.keys(backend.prefix + "*")
+        if keys:
+            await backend._client.delete(*keys)
+        await backend.close()
+
+
+@requires_redis
+def test_l2_read_through_promotes_into_l1():
+    async def test(backend):
+        writer = TieredCache(ResponseCache(), backend)
+        reader = TieredCache(ResponseCache(), backend)
+        await writer.put("key", RESPONSE)
+
+        # Another worker misses L1, hits L2 and keeps the response in its own L1
+        assert "key" not in reader.l1
+        assert await reader.get("key") == RESPONSE
+        assert "key" in reader.l1
+        assert backend.hits == 1
+        assert await reader.get("key") == RESPONSE
+        assert backend.hits == 1
+
+        assert await reader.get("missing") is None
+        assert backend.misses == 1
+
+    asyncio.run(_with_backend(test))
+
+
+@requires_redis
+def test_l2_entries_expire():
+    async def test(backend):
+        await backend.set("key", RESPONSE, ttl_seconds=1)
+        assert await backend.get("key") == RESPONSE
+        await asyncio.sleep(1.5)
+        assert await backend.get("key") is None
+
+    asyncio.run(_with_backend(test))
+
+
+@requires_redis_package
+def test_unreachable_l2_falls_back_to_l1():
+    async def test():
+        # Nothing listens on port 1: every L2 call fails fast
+        backend = RedisCacheBackend("redis://127.0.0.1:1/0", timeout=0.2)
+        tiered = TieredCache(ResponseCache(), backend)
+        try:
+            assert await tiered.get("key") is None
+            assert backend.errors == 1
+            assert backend.stats()["available"] is False
+
+            # While L2 is bypassed, nothing waits on it and L1 keeps serving
+            started = time.monotonic()
+            await tiered.put("key", RESPONSE)
+            assert await tiered.get("key") == RESPONSE
+            assert time.monotonic() - started < 0.1
+            assert backend.errors == 1
+        finally:
+            await backend.close()
+
+    asyncio.run(test())
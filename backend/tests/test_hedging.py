@@ -0,0 +1,96 @@
+"""
+Tests for hedged requests: when a hedge is sent and what happens to the losing request
+"""
+
+import asyncio
+
+from backend.utils.hedging import Hedger, LatencyTracker
+from backend.utils.retry import RetryBudget
+
+KEY = "goal_setting/general"
+
+
+def hedger(**kwargs) -> Hedger:
+    tracker = LatencyTracker(min_samples=1)
+    tracker.record(KEY, 0.01)
+    kwargs.setdefault("budget", RetryBudget(ratio=1.0, min_per_second=0.0))
+    return Hedger("test", percentile=95, min_delay=0.01, tracker=tracker, **kwargs)
+
+
+class Requests:
+    """Each call takes the next delay in turn; records which calls were cancelled"""
+
+    def __init__(self, *delays: float):
+        self.delays = list(delays)
+        self.calls = 0
+        self.cancelled = []
+
+    async def __call__(self):
+        index = self.calls
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delays[index])
+        except asyncio.CancelledError:
+            self.cancelled.append(index)
+            raise
+        return f"response {index}"
+
+
+def test_fast_call_is_not_hedged():
+    hedge = hedger()
+    requests = Requests(0.0)
+    assert asyncio.run(hedge.run(KEY, requests)) == ("response 0", False)
+    assert requests.calls == 1
+    assert hedge.hedges == 0
+
+
+def test_no_hedge_without_latency_history():
+    hedge = Hedger("test", min_delay=0.01, tracker=LatencyTracker(min_samples=1))
+    requests = Requests(0.05)
+    assert asyncio.run(hedge.run(KEY, requests)) == ("response 0", False)
+    assert requests.calls == 1
+
+
+def test_winning_hedge_cancels_the_slow_primary():
+    async def scenario():
+        hedge = hedger()
+        requests = Requests(10.0, 0.0)
+        result = await hedge.run(KEY, requests)
+        await asyncio.sleep(0)
+        return hedge, requests, result
+
+    hedge, requests, result = asyncio.run(scenario())
+    assert result == ("response 1", True)
+    assert requests.cancelled == [0]
+    assert hedge.hedges == 1
+    assert hedge.hedge_wins == 1
+
+
+def test_winning_primary_cancels_the_hedge():
+    async def scenario():
+        hedge = hedger()
+        requests = Requests(0.05, 10.0)
+        result = await hedge.run(KEY, requests)
+        await asyncio.sleep(0)
+        return hedge, requests, result
+
+    hedge, requests, result = asyncio.run(scenario())
+    assert result == ("response 0", True)
+    assert requests.cancelled == [1]
+    assert hedge.primary_wins == 1
+
+
+def test_no_hedge_when_the_caller_refuses():
+    hedge = hedger()
+    requests = Requests(0.05)
+    assert asyncio.run(hedge.run(KEY, requests, can_hedge=lambda: False)) == ("response 0", False)
+    assert requests.calls == 1
+    assert hedge.skipped == 1
+
+
+def test_no_hedge_when_the_budget_is_spent():
+    hedge = hedger(budget=RetryBudget(ratio=0.0, min_per_second=0.0, capacity=0.0))
+    requests = Requests(0.05)
+    assert asyncio.run(hedge.run(KEY, requests)) == ("response 0", False)
+    assert requests.calls == 1
+    assert hedge.skipped == 1
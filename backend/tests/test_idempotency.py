@@ -0,0 +1,87 @@
+"""
+Tests for idempotent request handling: stored replays and requests that repeat while in flight
+"""
+
+import asyncio
+
+import pytest
+
+from backend.utils.idempotency import IdempotencyStore, request_key
+
+PAYLOAD = {"user_id": "student-1", "message": "My goal is to finish the essay by Friday."}
+
+
+class Turn:
+    """A chat turn that blocks until released, counting how often it ran"""
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.runs = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {"content": "feedback", "run": self.runs}
+
+
+def test_keys_include_the_request_body():
+    key, derived = request_key("chat", PAYLOAD)
+    assert derived
+    assert request_key("chat", PAYLOAD) == (key, True)
+    assert request_key("chat", {**PAYLOAD, "message": "Something else"})[0] != key
+    client_key, derived = request_key("chat", PAYLOAD, client_key="retry-1")
+    assert not derived
+    assert client_key != key
+    assert request_key("chat", {**PAYLOAD, "message": "Something else"}, client_key="retry-1")[0] != client_key
+
+
+def test_repeat_of_an_in_flight_request_joins_it():
+    async def scenario():
+        store = IdempotencyStore()
+        turn = Turn()
+        original = asyncio.ensure_future(store.run("key", turn))
+        await asyncio.sleep(0)
+        repeat = asyncio.ensure_future(store.run("key", turn))
+        await asyncio.sleep(0)
+        turn.release.set()
+        assert await original == ({"content": "feedback", "run": 1}, "new")
+        assert await repeat == ({"content": "feedback", "run": 1}, "joined")
+        assert await store.run("key", turn) == ({"content": "feedback", "run": 1}, "replayed")
+        assert turn.runs == 1
+        assert store.joined == 1
+        assert store.replayed == 1
+
+    asyncio.run(scenario())
+
+
+def test_disconnected_original_still_completes_for_the_repeat():
+    async def scenario():
+        store = IdempotencyStore()
+        turn = Turn()
+        original = asyncio.ensure_future(store.run("key", turn))
+        await asyncio.sleep(0)
+        repeat = asyncio.ensure_future(store.run("key", turn))
+        await asyncio.sleep(0)
+        original.cancel()
+        turn.release.set()
+        assert await repeat == ({"content": "feedback", "run": 1}, "joined")
+        assert store.results.get("key") == {"content": "feedback", "run": 1}
+
+    asyncio.run(scenario())
+
+
+def test_failures_are_not_stored():
+    async def scenario():
+        store = IdempotencyStore()
+        failing = Turn(error=ConnectionError("provider down"))
+        failing.release.set()
+        with pytest.raises(ConnectionError):
+            await store.run("key", failing)
+        turn = Turn()
+        turn.release.set()
+        assert await store.run("key", turn) == ({"content": "feedback", "run": 1}, "new")
+
+    asyncio.run(scenario())
@@ -0,0 +1,64 @@
+"""
+Tests for the adaptive concurrency window: which outcomes shrink it and which leave it alone
+"""
+
+import asyncio
+
+import pytest
+
+from backend.utils.deadline import DeadlineExceeded
+from backend.utils.limiter import AdaptiveConcurrencyLimiter, is_overload_error
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def run_in_slot(limiter: AdaptiveConcurrencyLimiter, error: Exception) -> None:
+    async def body():
+        async with limiter.slot():
+            raise error
+
+    with pytest.raises(type(error)):
+        asyncio.run(body())
+
+
+def test_full_attempt_timeout_halves_the_window():
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=8)
+    run_in_slot(limiter, asyncio.TimeoutError())
+    assert limiter.limit == 4
+    assert limiter.overloads == 1
+    assert limiter.in_flight == 0
+
+
+def test_deadline_cut_attempt_leaves_the_window():
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=8)
+    run_in_slot(limiter, DeadlineExceeded("Claude response"))
+    assert limiter.limit == 8
+    assert limiter.overloads == 0
+    assert limiter.in_flight == 0
+
+
+def test_overload_statuses_are_overload_errors():
+    assert is_overload_error(ProviderError(429))
+    assert is_overload_error(ProviderError(529))
+    assert not is_overload_error(ProviderError(400))
+    assert not is_overload_error(DeadlineExceeded("Claude response"))
+
+
+def test_queue_wait_timeout_takes_no_slot():
+    limiter = AdaptiveConcurrencyLimiter("test", initial_limit=1)
+
+    async def scenario():
+        await limiter.acquire()
+        with pytest.raises(asyncio.TimeoutError):
+            async with limiter.slot(timeout=0.01):
+                pass
+        assert limiter.queue_depth == 0
+        limiter.release()
+
+    asyncio.run(scenario())
+    assert limiter.in_flight == 0
+    assert limiter.overloads == 0
@@ -0,0 +1,86 @@
+"""
+Tests for the incremental INSTRUCTOR_METADATA parser
+"""
+
+import pytest
+
+from backend.utils.metadata_parser import InstructorMetadataParser, parse_llm_response
+
+RESPONSE = (
+    "Your goal is specific and measurable.\n\n"
+    "Consider adding a deadline.\n"
+    "<!-- INSTRUCTOR_METADATA\n"
+    "Overall_Score: 3\n"
+    "Lowest Category: MEDIUM\n"
+    "Confidence: 0.85\n"
+    "-->\n"
+    "Keep going!"
+)
+
+EVALUATION = {"overall_score": 3, "lowest_category": "MEDIUM", "confidence": 0.85}
+
+
+def feed_in_chunks(text: str, size: int):
+    received = []
+    parser = InstructorMetadataParser(on_evaluation=received.append)
+    visible = "".join(parser.feed(text[i:i + size]) for i in range(0, len(text), size))
+    visible += parser.close()
+    return visible, parser, received
+
+
+def test_full_response_is_split_into_text_and_evaluation():
+    cleaned, evaluation = parse_llm_response(RESPONSE)
+    assert "INSTRUCTOR_METADATA" not in cleaned
+    assert cleaned.startswith("Your goal is specific")
+    assert cleaned.endswith("Keep going!")
+    assert evaluation == EVALUATION
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 13, 24, 64])
+def test_chunk_boundaries_match_the_full_parse(size):
+    cleaned, evaluation = parse_llm_response(RESPONSE)
+    visible, parser, received = feed_in_chunks(RESPONSE, size)
+    assert visible.strip() == cleaned
+    assert parser.evaluation == evaluation
+    assert received == [evaluation]
+
+
+def test_marker_prefix_in_visible_text_is_released():
+    visible, parser, _ = feed_in_chunks("Compare <!-- a note and <!-- INSTRUCT", 4)
+    assert visible == "Compare <!-- a note and <!-- INSTRUCT"
+    assert parser.evaluation == {}
+
+
+def test_unterminated_block_is_dropped():
+    text = "Good work.\n<!-- INSTRUCTOR_METADATA\nOverall_Score: 2\n"
+    cleaned, evaluation = parse_llm_response(text)
+    assert cleaned == "Good work."
+    assert evaluation == {}
+
+    visible, parser, received = feed_in_chunks(text, 3)
+    assert visible.strip() == "Good work."
+    assert not parser.complete
+    assert received == []
+
+
+def test_single_line_block_is_parsed():
+    cleaned, evaluation = parse_llm_response(
+        "Nice plan. <!-- INSTRUCTOR_METADATA Overall_Score: 4 --> See you next time."
+    )
+    assert cleaned == "Nice plan.  See you next time."
+    assert evaluation == {"overall_score": 4}
+
+
+def test_only_the_first_block_sets_the_evaluation():
+    cleaned, evaluation = parse_llm_response(
+        RESPONSE + "\n<!-- INSTRUCTOR_METADATA\nOverall_Score: 1\n-->"
+    )
+    assert "INSTRUCTOR_METADATA" not in cleaned
+    assert evaluation == EVALUATION
+
+
+def test_feed_after_close_is_rejected():
+    parser = InstructorMetadataParser()
+    parser.close()
+    with pytest.raises(ValueError):
+        parser.feed("more")
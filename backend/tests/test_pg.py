@@ -0,0 +1,154 @@
+"""
+Tests for the asyncpg backend against a real database
+
+Set TEST_DATABASE_URL to a Postgres database with the database/migrations schema applied
+(001-013); otherwise the tests are skipped. Each test creates its own user and session and
+deletes them afterwards (messages and assessments go with them).
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.utils import pg
+
+DSN = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(pg.asyncpg is None or not DSN, reason="TEST_DATABASE_URL not set")
+
+START = datetime(2026, 1, 5, 9, 0, tzinfo=timezone.utc)
+
+
+def _run(test):
+    async def run():
+        pool = await pg.init_pool(DSN)
+        user_id, session_id = str(uuid.uuid4()), str(uuid.uuid4())
+        await pool.execute("INSERT INTO users (id, email) VALUES ($1, $2)", user_id, f"{user_id}@test.invalid")
+        await pool.execute("INSERT INTO sessions (id, user_id) VALUES ($1, $2)", session_id, user_id)
+        try:
+            await test(pool, user_id, session_id)
+        finally:
+            await pool.execute("DELETE FROM users WHERE id = $1", user_id)
+            await pg.close_pool()
+
+    asyncio.run(run())
+
+
+def _message(session_id, role, content, created_at, **extra):
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "role": role,
+        "content": content,
+        "created_at": created_at.isoformat(),
+        **extra
+    }
+
+
+def test_chat_turn_functions():
+    async def test(pool, user_id, session_id):
+        first = str(uuid.uuid4())
+        turn = await pg.call_function("begin_chat_turn", {
+            "p_session_id": session_id,
+            "p_message_id": first,
+            "p_content": "My goal is to finish the essay.",
+            "p_phase": "4",
+            "p_component": "long_term_goals",
+            "p_metadata": {"is_submission": True},
+            "p_history_limit": 10,
+            "p_created_at": START.isoformat()
+        })
+        assert turn["history"] == []
+        assert turn["user_id"] == user_id
+        assert turn["message"]["id"] == first
+
+        reply, assessment = str(uuid.uuid4()), str(uuid.uuid4())
+        await pg.call_function("complete_chat_turn", {
+            "p_session_id": session_id,
+            "p_message_id": reply,
+            "p_content": "Try making it measurable.",
+            "p_phase": "4",
+            "p_component": "long_term_goals",
+            "p_metadata": {"evaluation": {"overall_score": 2}},
+            "p_assessment": {
+                "id": assessment, "user_id": user_id, "submission_message_id": first,
+                "attempt_number": 1, "overall_score": 2, "full_evaluation": {"overall_score": 2},
+                "created_at": (START + timedelta(seconds=5)).isoformat()
+            },
+            "p_created_at": (START + timedelta(seconds=5)).isoformat()
+        })
+
+        stored = await pool.fetchrow(
+            "SELECT feedback_message_id, phase, created_at FROM assessments WHERE id = $1", assessment
+        )
+        assert str(stored["feedback_message_id"]) == reply
+        assert stored["phase"] == "4"
+        assert stored["created_at"] == START + timedelta(seconds=5)
+
+        # The next turn sees both messages, oldest first, and not itself
+        second = await pg.call_function("begin_chat_turn", {
+            "p_session_id": session_id,
+            "p_message_id": str(uuid.uuid4()),
+            "p_content": "Finish the essay by Friday.",
+            "p_created_at": (START + timedelta(seconds=10)).isoformat()
+        })
+        assert [message["id"] for message in second["history"]] == [first, reply]
+
+    _run(test)
+
+
+def test_copy_rows_and_replay():
+    async def test(pool, user_id, session_id):
+        rows = [
+            _message(session_id, "user", f"message {i}", START + timedelta(seconds=i), metadata={"i": i})
+            for i in range(5)
+        ]
+        # A different column set goes in its own COPY
+        rows.append(_message(session_id, "assistant", "no metadata", START + timedelta(seconds=5)))
+        copies = pg.stats()["copies"]
+        await pg.copy_rows("messages", rows)
+        assert pg.stats()["copies"] == copies + 1
+
+        stored = await pool.fetch(
+            "SELECT id, metadata, created_at FROM messages WHERE session_id = $1 ORDER BY created_at", session_id
+        )
+        assert [str(row["id"]) for row in stored] == [row["id"] for row in rows]
+        assert stored[2]["metadata"] == {"i": 2}
+        assert stored[5]["metadata"] is None
+        assert stored[3]["created_at"] == START + timedelta(seconds=3)
+
+        # Replay skips rows that already made it in
+        extra = _message(session_id, "user", "replayed", START + timedelta(seconds=6))
+        await pg.replay_rows("messages", rows[:2] + [extra])
+        assert await pool.fetchval("SELECT COUNT(*) FROM messages WHERE session_id = $1", session_id) == 7
+
+    _run(test)
+
+
+def test_keyset_pages_and_recent_messages():
+    async def test(pool, user_id, session_id):
+        rows = [_message(session_id, "user", f"message {i}", START + timedelta(seconds=i)) for i in range(7)]
+        # Two messages with the same timestamp are ordered by id
+        rows.append(_message(session_id, "assistant", "tie", START + timedelta(seconds=5)))
+        await pg.copy_rows("messages", rows)
+        expected = [row["id"] for row in sorted(rows, key=lambda row: (row["created_at"], row["id"]))]
+        columns = ("id", "created_at")
+
+        for descending in (False, True):
+            seen, after = [], None
+            while True:
+                page = await pg.fetch_messages_page(session_id, 3, columns, after, descending)
+                if not page:
+                    break
+                seen.extend(row["id"] for row in page)
+                after = (page[-1]["created_at"], page[-1]["id"])
+            assert seen == (expected[::-1] if descending else expected)
+
+        recent = await pg.fetch_recent_messages(session_id, 4, ("id", "content"))
+        # The tie falls inside the window, so its order comes from the id
+        assert [row["id"] for row in recent] == expected[-4:]
+
+    _run(test)
@@ -0,0 +1,48 @@
+"""
+Query-plan regression check (backend/benchmarks/query_plan_check.py) as a test
+
+Set TEST_DATABASE_URL to a Postgres database with the database/migrations schema applied;
+otherwise the test is skipped. The test seeds synthetic rows, runs ANALYZE on the hot tables
+and removes the rows afterwards, so use a database you can spare (not production).
+
+Plans depend on the data: the seed is the smallest that still makes every hot query's index
+scan cheaper than a Seq Scan, and MAX_COST is sized for it. Re-tune both together.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("asyncpg")
+
+from backend.benchmarks import query_plan_check  # noqa: E402
+
+DSN = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not DSN, reason="TEST_DATABASE_URL not set")
+
+SEED = {
+    "sessions": 2000,
+    "messages_per_session": 40,
+    "assessments_per_session": 12,
+    "user_data_per_user": 10,
+    "events_per_session": 50,
+}
+MAX_COST = 200.0
+
+
+def test_hot_queries_use_their_indexes():
+    async def run():
+        conn = await query_plan_check.asyncpg.connect(DSN)
+        try:
+            await query_plan_check.reset(conn)
+            await query_plan_check.seed(conn, **SEED)
+            return await query_plan_check.check_hot_queries(conn, MAX_COST)
+        finally:
+            await query_plan_check.reset(conn)
+            await conn.close()
+
+    results = asyncio.run(run())
+    failures = {name: problems for name, (_, problems) in results.items() if problems}
+    assert not failures, failures
@@ -0,0 +1,107 @@
+"""
+Tests for the retry policy: error classification, retry-after and the shared retry budget
+"""
+
+import asyncio
+
+import pytest
+
+from backend.utils.retry import RetryBudget, RetryPolicy, is_retryable, retry_after_seconds
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class Flaky:
+    """Fails with the given errors in turn, then succeeds"""
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def policy(**kwargs) -> RetryPolicy:
+    kwargs.setdefault("base_delay", 0.0)
+    return RetryPolicy("test", **kwargs)
+
+
+def test_errors_are_classified():
+    assert is_retryable(ProviderError(429))
+    assert is_retryable(ProviderError(529))
+    assert is_retryable(ProviderError(503))
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(ProviderError(400))
+    assert not is_retryable(ProviderError(401))
+    assert not is_retryable(ValueError("bad prompt"))
+
+
+def test_transient_failures_are_retried():
+    call = Flaky(ProviderError(529), ProviderError(503))
+    assert asyncio.run(policy(max_attempts=3).run(call)) == "ok"
+    assert call.calls == 3
+
+
+def test_fatal_errors_are_not_retried():
+    retry = policy(max_attempts=3)
+    call = Flaky(ProviderError(400))
+    with pytest.raises(ProviderError):
+        asyncio.run(retry.run(call))
+    assert call.calls == 1
+    assert retry.fatal == 1
+
+
+def test_exhausted_budget_stops_retries():
+    retry = policy(max_attempts=5, budget=RetryBudget(ratio=0.0, min_per_second=0.0, capacity=0.0))
+    call = Flaky(ProviderError(529))
+    with pytest.raises(ProviderError):
+        asyncio.run(retry.run(call))
+    assert call.calls == 1
+    assert retry.budget.exhausted == 1
+    assert retry.budget.retries == 0
+
+
+def test_budget_allows_retries_until_its_tokens_run_out():
+    budget = RetryBudget(ratio=0.0, min_per_second=0.0, capacity=2.0)
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    assert budget.stats()["retries"] == 2
+    assert budget.stats()["exhausted"] == 1
+
+
+def test_retry_after_headers_are_read():
+    assert retry_after_seconds(ProviderError(429, {"retry-after": "3"})) == 3.0
+    assert retry_after_seconds(ProviderError(429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(ProviderError(429, {"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"})) is None
+    assert retry_after_seconds(ProviderError(429)) is None
+
+
+def test_retry_after_takes_precedence_over_backoff():
+    retry = policy(max_attempts=3, base_delay=100.0, max_delay=100.0)
+    assert retry.next_delay(1, ProviderError(429, {"retry-after": "2"})) == 2.0
+
+
+def test_long_retry_after_fails_fast():
+    retry = policy(max_attempts=3, max_retry_after=5.0)
+    assert retry.next_delay(1, ProviderError(429, {"retry-after": "60"})) is None
+    assert retry.gave_up == 1
+
+
+def test_no_retry_after_the_last_attempt():
+    retry = policy(max_attempts=2)
+    call = Flaky(ProviderError(529), ProviderError(529))
+    with pytest.raises(ProviderError):
+        asyncio.run(retry.run(call))
+    assert call.calls == 2
+    assert retry.gave_up == 1
@@ -0,0 +1,115 @@
+"""
+Tests for single-flight coalescing: cancellation of one waiter and failure of the shared call
+"""
+
+import asyncio
+
+import pytest
+
+from backend.utils.singleflight import SingleFlight
+
+
+class Call:
+    """A shared call that blocks until released, counting how often it was started"""
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.started = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.started += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {"content": "feedback"}
+
+
+def test_followers_share_the_leaders_result():
+    async def scenario():
+        flights = SingleFlight()
+        call = Call()
+        leader = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0)
+        call.release.set()
+        assert await leader == ({"content": "feedback"}, False)
+        assert await follower == ({"content": "feedback"}, True)
+        assert call.started == 1
+        assert flights.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 1}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_follower_does_not_cancel_the_call():
+    async def scenario():
+        flights = SingleFlight()
+        call = Call()
+        leader = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        call.release.set()
+        assert await leader == ({"content": "feedback"}, False)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_leader_does_not_cancel_the_call():
+    async def scenario():
+        flights = SingleFlight()
+        call = Call()
+        leader = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        call.release.set()
+        assert await follower == ({"content": "feedback"}, True)
+        assert call.started == 1
+
+    asyncio.run(scenario())
+
+
+def test_leader_failure_reaches_every_waiter_and_releases_the_key():
+    async def scenario():
+        flights = SingleFlight()
+        call = Call(error=ConnectionError("database down"))
+        leader = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0)
+        call.release.set()
+        for waiter in (leader, follower):
+            with pytest.raises(ConnectionError):
+                await waiter
+        assert flights.join("key") is None
+
+        retry = Call()
+        retry.release.set()
+        assert await flights.do("key", retry) == ({"content": "feedback"}, False)
+        assert retry.started == 1
+
+    asyncio.run(scenario())
+
+
+def test_join_attaches_only_to_an_in_flight_call():
+    async def scenario():
+        flights = SingleFlight()
+        assert flights.join("key") is None
+        call = Call()
+        leader = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0)
+        joined = flights.join("key")
+        call.release.set()
+        assert await joined == {"content": "feedback"}
+        await leader
+        assert flights.stats()["coalesced"] == 1
+
+    asyncio.run(scenario())
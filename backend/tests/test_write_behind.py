@@ -0,0 +1,117 @@
+"""
+Tests for the write-behind queue and the outbox it hands failed batches to
+
+A fake writer stands in for the database: it records every insert and fails any batch that
+contains a row marked ``bad`` (a constraint violation), or every batch while ``down`` is set.
+"""
+
+import asyncio
+
+import pytest
+
+from backend.utils import outbox as outbox_module
+from backend.utils.outbox import Outbox
+from backend.utils.write_behind import WriteBehindQueue
+
+TABLE_ORDER = ("sessions", "messages", "assessments")
+
+
+class FakeWriter:
+    def __init__(self):
+        self.down = False
+        self.calls = []
+        self.rows = []
+
+    def __call__(self, table, rows):
+        self.calls.append((table, [row["id"] for row in rows]))
+        if self.down:
+            raise ConnectionError("database unreachable")
+        if any(row.get("bad") for row in rows):
+            raise ValueError("violates foreign key constraint")
+        self.rows.extend((table, row["id"]) for row in rows)
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    box = Outbox(path=str(tmp_path / "outbox.sqlite3"), table_order=TABLE_ORDER)
+    yield box
+    box.close()
+
+
+def test_flush_writes_parents_first():
+    writer = FakeWriter()
+    queue = WriteBehindQueue(writer, table_order=TABLE_ORDER, batch_size=10)
+
+    async def scenario():
+        await queue.put("assessments", {"id": "a1"})
+        await queue.put("messages", {"id": "m1"})
+        await queue.put("sessions", {"id": "s1"})
+        await queue.put("messages", {"id": "m2"})
+        return await queue.flush()
+
+    assert asyncio.run(scenario()) == 4
+    assert writer.rows == [("sessions", "s1"), ("messages", "m1"), ("messages", "m2"), ("assessments", "a1")]
+    assert len(queue) == 0
+
+
+def test_failed_batch_is_handed_to_the_outbox(outbox):
+    writer = FakeWriter()
+    queue = WriteBehindQueue(
+        writer, table_order=TABLE_ORDER, batch_size=10,
+        on_failure=lambda table, rows, error: outbox.add_many(table, rows)
+    )
+
+    async def scenario():
+        await queue.put("messages", {"id": "m1"})
+        await queue.put("messages", {"id": "m2", "bad": True})
+        await queue.put("assessments", {"id": "a1"})
+        await queue.flush()
+
+    asyncio.run(scenario())
+    assert writer.rows == [("assessments", "a1")]
+    assert queue.failed == 2
+    assert queue.written == 1
+    assert outbox.pending() == 2
+    assert len(queue) == 0
+
+
+def test_replay_parks_only_the_bad_rows(outbox, monkeypatch):
+    monkeypatch.setattr(outbox_module, "DEFAULT_MAX_ATTEMPTS", 1)
+    writer = FakeWriter()
+    outbox.add_many("messages", [{"id": f"m{i}", "bad": i == 3} for i in range(6)])
+
+    replayed = asyncio.run(outbox.replay_once(writer))
+
+    assert replayed == 5
+    assert sorted(row_id for _, row_id in writer.rows) == ["m0", "m1", "m2", "m4", "m5"]
+    assert outbox.pending() == 0
+    assert outbox.stats()["dead"] == 1
+
+
+def test_replay_writes_parents_first(outbox):
+    writer = FakeWriter()
+    outbox.add("assessments", {"id": "a1"})
+    outbox.add("messages", {"id": "m1"})
+    outbox.add("sessions", {"id": "s1"})
+
+    assert asyncio.run(outbox.replay_once(writer)) == 3
+    assert writer.rows == [("sessions", "s1"), ("messages", "m1"), ("assessments", "a1")]
+
+
+def test_replay_during_an_outage_stops_early(outbox):
+    writer = FakeWriter()
+    writer.down = True
+    outbox.add_many("messages", [{"id": f"m{i}"} for i in range(32)])
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(outbox.replay_once(writer))
+
+    # A few bisection steps and two single-row failures, not one round trip per row
+    assert len(writer.calls) < 10
+    assert sum(len(ids) == 1 for _, ids in writer.calls) == 2
+    assert outbox.pending() == 32
+    assert outbox.stats()["dead"] == 0
+
+    writer.down = False
+    assert asyncio.run(outbox.replay_once(writer)) == 32
+    assert outbox.pending() == 0
@@ -0,0 +1,300 @@
+"""
+Response caches for the LLM layer
+
+L1 is a bounded in-process LRU cache: every operation is O(1) (an OrderedDict keeps LRU
+order), entries expire on access after ``ttl_seconds`` and a background sweep reclaims
+expired entries that are never read again. Capacity is bounded both by entry count and by an
+approximate byte budget, so raising the limit to tens of thousands of entries never triggers
+a full sort.
+
+L2 is an optional shared backend (Redis protocol) so that every uvicorn worker and every
+instance reuses the same responses. It sits behind L1 and is only consulted on an L1 miss.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger("solbot.cache")
+
+# Defaults, overridable from the environment
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+DEFAULT_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 64 MB
+DEFAULT_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL", "1200"))  # 20 minutes
+DEFAULT_SWEEP_INTERVAL = float(os.getenv("LLM_CACHE_SWEEP_INTERVAL", "60"))
+
+# Shared L2 cache; disabled unless a Redis URL is configured
+L2_REDIS_URL = os.getenv("LLM_CACHE_REDIS_URL") or os.getenv("REDIS_URL")
+L2_KEY_PREFIX = os.getenv("LLM_CACHE_REDIS_PREFIX", "solbot:llm:")
+L2_TIMEOUT_SECONDS = float(os.getenv("LLM_CACHE_REDIS_TIMEOUT", "0.25"))
+L2_RETRY_AFTER_SECONDS = 30.0  # Back off from a failing L2 instead of paying its timeout on every call
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # Optional dependency - only needed when an L2 cache is configured
+    redis_asyncio = None
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate the memory held by a cached value from its serialized length"""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(str(value))
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache bounded by entry count and approximate size in bytes
+
+    Entries are stored as ``key -> (value, expires_at, size)``. ``get`` moves a hit to the
+    most-recently-used end; ``put`` evicts from the least-recently-used end until both
+    budgets are satisfied.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[1] <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Insert or replace an entry, evicting least-recently-used entries as needed"""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            logger.debug(f"Not caching {key[:8]}...: {size} bytes exceeds the cache budget")
+            return
+        if key in self._entries:
+            self._remove(key)
+        expires_at = time.monotonic() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def sweep(self, max_checks: int = 1000) -> int:
+        """
+        Remove expired entries, starting from the least-recently-used end
+
+        At most ``max_checks`` entries are inspected so a single sweep never stalls the
+        event loop; anything missed is caught by the next sweep or on access.
+        """
+        now = time.monotonic()
+        expired = []
+        for checked, (key, entry) in enumerate(self._entries.items()):
+            if checked >= max_checks:
+                break
+            if entry[1] <= now:
+                expired.append(key)
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    async def run_sweeper(self, interval: float = DEFAULT_SWEEP_INTERVAL, max_checks: int = 1000) -> None:
+        """Periodically sweep expired entries; run as a background task"""
+        logger.info(f"Cache sweeper started (interval={interval}s)")
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = self.sweep(max_checks)
+                # Keep going in small batches while the sweep keeps finding expired entries
+                while removed == max_checks:
+                    await asyncio.sleep(0)
+                    removed = self.sweep(max_checks)
+            except Exception as e:
+                logger.error(f"Cache sweep failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+
+class CacheBackend:
+    """Interface for a shared (second-level) cache backend; values are JSON-serializable dicts"""
+
+    name = "base"
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Shared cache over the Redis protocol (Redis, Valkey, KeyDB, ...)
+
+    Failures never propagate: a failed or slow operation counts as a miss and the backend is
+    skipped for ``L2_RETRY_AFTER_SECONDS`` so an unavailable server does not add its timeout
+    to every request.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = L2_KEY_PREFIX, timeout: float = L2_TIMEOUT_SECONDS):
+        if redis_asyncio is None:
+            raise ImportError("The 'redis' package is required for the Redis L2 cache")
+        self.url = url
+        self.prefix = prefix
+        self.timeout = timeout
+        self._client = redis_asyncio.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._unavailable_until = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["RedisCacheBackend"]:
+        if not L2_REDIS_URL:
+            return None
+        try:
+            backend = cls(L2_REDIS_URL)
+            logger.info(f"Shared L2 response cache enabled (prefix={backend.prefix})")
+            return backend
+        except Exception as e:
+            logger.error(f"Could not initialise Redis L2 cache: {e}")
+            return None
+
+    async def get(self, key: str) -> Optional[Any]:
+        if time.monotonic() < self._unavailable_until:
+            return None
+        try:
+            raw = await asyncio.wait_for(self._client.get(self.prefix + key), timeout=self.timeout)
+        except Exception as e:
+            self._mark_unavailable(e)
+            return None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        if time.monotonic() < self._unavailable_until:
+            return
+        try:
+            payload = json.dumps(value, default=str)
+            await asyncio.wait_for(
+                self._client.set(self.prefix + key, payload, ex=max(1, int(ttl_seconds))),
+                timeout=self.timeout
+            )
+        except Exception as e:
+            self._mark_unavailable(e)
+
+    async def close(self) -> None:
+        try:
+            await self._client.aclose()
+        except AttributeError:  # redis-py < 5
+            await self._client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "available": time.monotonic() >= self._unavailable_until
+        }
+
+    def _mark_unavailable(self, error: Exception) -> None:
+        self.errors += 1
+        self._unavailable_until = time.monotonic() + L2_RETRY_AFTER_SECONDS
+        logger.warning(f"L2 cache error, bypassing for {L2_RETRY_AFTER_SECONDS:.0f}s: {error}")
+
+
+class TieredCache:
+    """In-process L1 in front of an optional shared L2; L2 hits are promoted into L1"""
+
+    def __init__(self, l1: ResponseCache, l2: Optional[CacheBackend] = None):
+        self.l1 = l1
+        self.l2 = l2
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.l1.get(key)
+        if value is not None or self.l2 is None:
+            return value
+        value = await self.l2.get(key)
+        if value is not None:
+            self.l1.put(key, value)
+        return value
+
+    async def put(self, key: str, value: Any) -> None:
+        self.l1.put(key, value)
+        if self.l2 is not None:
+            await self.l2.set(key, value, self.l1.ttl_seconds)
+
+    async def close(self) -> None:
+        if self.l2 is not None:
+            await self.l2.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"l1": self.l1.stats(), "l2": self.l2.stats() if self.l2 else None}
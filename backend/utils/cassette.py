@@ -0,0 +1,279 @@
+"""
+Record/replay cassettes for LLM calls
+
+A cassette stores LLM responses by request fingerprint (a hash of the Messages API
+parameters) together with their timing, so evaluation and regression runs can be replayed
+offline, deterministically, and as fast or as slow as the original calls:
+
+  - record: call the provider and store every response (re-recording overwrites)
+  - replay: serve stored responses only; a request that was never recorded fails
+  - auto: replay what is stored, record what is missing
+
+The same request made several times in a run is stored once per occurrence and replayed in
+the same order. Replay reproduces the recorded time to first token, the stream chunk timing
+and the total duration, multiplied by LLM_CASSETTE_LATENCY_SCALE (0 = instant).
+
+The file is a small SQLite database indexed by fingerprint, with zlib-compressed JSON
+responses. Enabled with LLM_CASSETTE=<path>; CassetteProvider wraps the configured provider.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from backend.utils.providers import LLMProvider
+
+logger = logging.getLogger("solbot.cassette")
+
+LLM_CASSETTE = os.getenv("LLM_CASSETTE")
+DEFAULT_MODE = os.getenv("LLM_CASSETTE_MODE", "replay").lower()
+DEFAULT_LATENCY_SCALE = float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "1.0"))
+MODES = ("record", "replay", "auto")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    fingerprint TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    model TEXT,
+    recorded_at REAL NOT NULL,
+    response BLOB NOT NULL,
+    PRIMARY KEY (fingerprint, occurrence)
+) WITHOUT ROWID;
+"""
+
+
+class CassetteMiss(Exception):
+    """A replayed request that is not on the cassette (not retryable)"""
+
+
+def _strip_cache_control(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _strip_cache_control(v) for k, v in value.items() if k != "cache_control"}
+    if isinstance(value, list):
+        return [_strip_cache_control(v) for v in value]
+    return value
+
+
+def request_fingerprint(params: Dict[str, Any]) -> str:
+    """
+    Hash of the request parameters; prompt cache breakpoints are ignored since they do not
+    change the response
+    """
+    canonical = json.dumps(_strip_cache_control(params), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Recorded responses by (fingerprint, occurrence)
+
+    Thread-safe and synchronous (SQLite lookups take microseconds), so it can be used from
+    plain scripts as well as through CassetteProvider. Occurrences are counted per
+    fingerprint from the start of the process, i.e. of the run being recorded or replayed.
+    """
+
+    def __init__(self, path: str, mode: str = DEFAULT_MODE):
+        if mode not in MODES:
+            raise ValueError(f"LLM_CASSETTE_MODE must be one of {', '.join(MODES)}, not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._occurrences: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def next_occurrence(self, fingerprint: str) -> int:
+        """Claim the next occurrence number of a request in this run"""
+        with self._lock:
+            occurrence = self._occurrences.get(fingerprint, 0)
+            self._occurrences[fingerprint] = occurrence + 1
+            return occurrence
+
+    def get(self, fingerprint: str, occurrence: int) -> Optional[Dict[str, Any]]:
+        """
+        The recording of a request's occurrence; in replay mode extra occurrences cycle
+        through the ones recorded
+        """
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response FROM recordings WHERE fingerprint = ? AND occurrence = ?",
+                (fingerprint, occurrence)
+            ).fetchone()
+            if row is None and self.mode == "replay":
+                count = conn.execute("SELECT COUNT(*) FROM recordings WHERE fingerprint = ?", (fingerprint,)).fetchone()[0]
+                if count:
+                    row = conn.execute(
+                        "SELECT response FROM recordings WHERE fingerprint = ? AND occurrence = ?",
+                        (fingerprint, occurrence % count)
+                    ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, fingerprint: str, occurrence: int, recording: Dict[str, Any], model: Optional[str] = None) -> None:
+        blob = zlib.compress(json.dumps(recording, separators=(",", ":"), default=str).encode("utf-8"))
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO recordings (fingerprint, occurrence, model, recorded_at, response) VALUES (?, ?, ?, ?, ?)",
+                    (fingerprint, occurrence, model, time.time(), blob)
+                )
+        self.recorded += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stored = self._connect().execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+        return {
+            "path": self.path,
+            "mode": self.mode,
+            "recordings": stored,
+            "hits": self.hits,
+            "misses": self.misses,
+            "recorded": self.recorded
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened lazily so importing the module never touches the filesystem
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+
+class CassetteProvider(LLMProvider):
+    """
+    Wraps a provider with a cassette
+
+    Recordings hold the response (content, usage, stop_reason), the time to first token, the
+    total duration and, for streamed calls, each chunk's offset from the start of the call.
+    A streamed recording can be replayed by complete() and vice versa.
+    """
+
+    name = "cassette"
+
+    def __init__(self, inner: LLMProvider, cassette: Cassette, latency_scale: float = DEFAULT_LATENCY_SCALE):
+        super().__init__(inner.model)
+        self.inner = inner
+        self.cassette = cassette
+        self.latency_scale = max(latency_scale, 0.0)
+        self.is_mock = inner.is_mock
+
+    async def complete(self, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        fingerprint, occurrence, recording = await self._lookup(params)
+        if recording is not None:
+            await self._sleep(recording["duration_ms"])
+            return self._response(recording)
+
+        start = time.monotonic()
+        response = await self.inner.complete(params, timeout)
+        duration_ms = (time.monotonic() - start) * 1000
+        await self._store(fingerprint, occurrence, {
+            "content": response["content"],
+            "usage": response["usage"],
+            "stop_reason": response.get("stop_reason"),
+            "ttft_ms": None,
+            "duration_ms": duration_ms,
+            "chunks": None
+        })
+        return response
+
+    async def stream(self, params: Dict[str, Any], timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        fingerprint, occurrence, recording = await self._lookup(params)
+        if recording is not None:
+            # Complete() recordings arrive as one chunk at the end
+            chunks = recording.get("chunks") or [[recording["duration_ms"], recording["content"]]]
+            elapsed = 0.0
+            for offset_ms, text in chunks:
+                await self._sleep(offset_ms - elapsed)
+                elapsed = max(elapsed, offset_ms)
+                yield {"type": "text", "text": text}
+            await self._sleep(recording["duration_ms"] - elapsed)
+            yield {"type": "final", **self._response(recording)}
+            return
+
+        start = time.monotonic()
+        chunks: List[List[Any]] = []
+        final: Dict[str, Any] = {}
+        async for event in self.inner.stream(params, timeout):
+            if event["type"] == "text":
+                chunks.append([round((time.monotonic() - start) * 1000, 1), event["text"]])
+            else:
+                final = event
+            yield event
+        await self._store(fingerprint, occurrence, {
+            "content": "".join(text for _, text in chunks),
+            "usage": final.get("usage"),
+            "stop_reason": final.get("stop_reason"),
+            "ttft_ms": chunks[0][0] if chunks else None,
+            "duration_ms": (time.monotonic() - start) * 1000,
+            "chunks": chunks
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "latency_scale": self.latency_scale,
+            "cassette": self.cassette.stats(),
+            "inner": self.inner.stats()
+        }
+
+    async def _lookup(self, params: Dict[str, Any]):
+        fingerprint = request_fingerprint(params)
+        occurrence = self.cassette.next_occurrence(fingerprint)
+        recording = None
+        if self.cassette.mode != "record":
+            recording = await asyncio.to_thread(self.cassette.get, fingerprint, occurrence)
+            if recording is None and self.cassette.mode == "replay":
+                raise CassetteMiss(f"No recording for request {fingerprint[:12]} on {self.cassette.path}")
+        return fingerprint, occurrence, recording
+
+    async def _store(self, fingerprint: str, occurrence: int, recording: Dict[str, Any]) -> None:
+        try:
+            await asyncio.to_thread(self.cassette.put, fingerprint, occurrence, recording, self.inner.model)
+        except Exception as e:
+            # A failed recording must not fail the call
+            logger.error(f"Could not record response {fingerprint[:12]}: {e}")
+
+    async def _sleep(self, milliseconds: Optional[float]) -> None:
+        if milliseconds and milliseconds > 0 and self.latency_scale > 0:
+            await asyncio.sleep(milliseconds * self.latency_scale / 1000)
+
+    @staticmethod
+    def _response(recording: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "content": recording["content"],
+            "usage": recording["usage"],
+            "stop_reason": recording.get("stop_reason")
+        }
+
+
+def with_cassette(provider: LLMProvider, path: Optional[str] = LLM_CASSETTE) -> LLMProvider:
+    """Wrap the provider with the LLM_CASSETTE cassette, if one is configured"""
+    if not path:
+        return provider
+    cassette = Cassette(path)
+    logger.info(f"LLM cassette {path} in {cassette.mode} mode (latency x{DEFAULT_LATENCY_SCALE})")
+    return CassetteProvider(provider, cassette)
@@ -0,0 +1,119 @@
+"""
+Token-budgeted context assembly for chat turns
+
+Builds the Anthropic ``messages`` list for a turn from the session history and the current
+student message:
+
+  - the current message is sent once, even when the history already ends with it (it is
+    logged before the history is read on some paths)
+  - only user/assistant messages with text are kept, and consecutive messages of the same
+    role are merged into one (the API expects alternating turns)
+  - history is added from newest to oldest while it fits the phase's token budget, so a few
+    pasted essays cannot blow up the input size; the current message is always sent
+
+Tokens are estimated locally (about four characters per token for English text) - close
+enough to bound the input, and free compared to a count_tokens round trip.
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("solbot.context")
+
+# Input token budget for the conversation (history + current message; the system prompt and
+# tools are not counted), overridable per phase with e.g. CONTEXT_TOKEN_BUDGETS="4=6000,5=6000"
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+CHARS_PER_TOKEN = 4
+# Role markers and separators the API adds per message
+MESSAGE_OVERHEAD_TOKENS = 4
+CONTEXT_ROLES = ("user", "assistant")
+
+
+def _parse_budgets(value: str) -> Dict[str, int]:
+    budgets = {}
+    for item in value.split(","):
+        phase, _, tokens = item.partition("=")
+        if phase.strip() and tokens.strip():
+            try:
+                budgets[phase.strip()] = int(tokens)
+            except ValueError:
+                logger.warning(f"Ignoring invalid CONTEXT_TOKEN_BUDGETS entry: {item!r}")
+    return budgets
+
+PHASE_TOKEN_BUDGETS = _parse_budgets(os.getenv("CONTEXT_TOKEN_BUDGETS", ""))
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a message's text, including the per-message overhead"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def token_budget(phase: Optional[str] = None) -> int:
+    """The conversation token budget for a phase"""
+    if phase is not None:
+        return PHASE_TOKEN_BUDGETS.get(str(phase), DEFAULT_TOKEN_BUDGET)
+    return DEFAULT_TOKEN_BUDGET
+
+
+def build_messages(
+    user_message: str,
+    chat_history: Optional[List[Dict[str, Any]]] = None,
+    phase: Optional[str] = None,
+    budget: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Build the messages list for a turn: as much recent history as fits the budget, oldest
+    first, followed by the current user message
+
+    Args:
+        user_message: The current student message
+        chat_history: Prior messages (dicts with role and content), oldest first
+        phase: Selects the token budget (CONTEXT_TOKEN_BUDGETS, else CONTEXT_TOKEN_BUDGET)
+        budget: Explicit token budget, overriding the phase's
+    """
+    if budget is None:
+        budget = token_budget(phase)
+    history = _merge_roles(_context_messages(chat_history or []))
+
+    # The current turn may already be the last logged message
+    if history and history[-1]["role"] == "user" and history[-1]["content"] == user_message.strip():
+        history.pop()
+
+    # A trailing student message that never got a reply is sent together with the current one
+    current = {"role": "user", "content": user_message}
+    if history and history[-1]["role"] == "user":
+        current["content"] = f"{history.pop()['content']}\n\n{user_message}"
+
+    remaining = budget - estimate_tokens(current["content"])
+    start = len(history)
+    while start > 0:
+        cost = estimate_tokens(history[start - 1]["content"])
+        if cost > remaining:
+            break
+        remaining -= cost
+        start -= 1
+    if start:
+        logger.debug(f"Context budget {budget}: kept {len(history) - start} of {len(history)} history messages")
+
+    return history[start:] + [current]
+
+
+def _context_messages(chat_history: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    messages = []
+    for msg in chat_history:
+        role = msg.get("role", "user")
+        content = (msg.get("content") or "").strip()
+        if role in CONTEXT_ROLES and content:
+            messages.append({"role": role, "content": content})
+    return messages
+
+
+def _merge_roles(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    merged: List[Dict[str, str]] = []
+    for msg in messages:
+        if merged and merged[-1]["role"] == msg["role"]:
+            merged[-1]["content"] = f"{merged[-1]['content']}\n\n{msg['content']}"
+        else:
+            merged.append(dict(msg))
+    return merged
@@ -0,0 +1,202 @@
+"""
+Per-session conversation window cache
+
+Each chat turn needs the last few user/assistant messages of its session as LLM context.
+Instead of reading them back from the database every turn (rows that also carry large
+metadata: raw LLM responses, API usage), the process keeps a small window of compact records
+per session. Windows are filled from the database on a miss and kept current write-through
+by the code that logs messages, so a session that stays on this process is read from the
+database once.
+
+Bounded by message count per session (``window``), by session count and by an approximate
+byte budget, with LRU eviction across sessions. Windows expire after ``ttl_seconds``.
+
+The cache is per process. With several workers or instances, a session's turns can land on
+different processes, and a window would miss the messages logged elsewhere. With ``validate``
+on (MESSAGE_CACHE_VALIDATE, the default), the caller checks a cached window against the id of
+the session's latest stored message. This is an index-only read instead of the history, and a
+window that does not contain that id is dropped and reloaded. Turn it off only for a single
+worker, or when sessions stick to one worker.
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+logger = logging.getLogger("solbot.conversation_cache")
+
+# Defaults, overridable from the environment; MESSAGE_CACHE_SESSIONS=0 disables the cache
+DEFAULT_MAX_SESSIONS = int(os.getenv("MESSAGE_CACHE_SESSIONS", "5000"))
+DEFAULT_WINDOW = int(os.getenv("MESSAGE_CACHE_WINDOW", "10"))
+DEFAULT_MAX_BYTES = int(os.getenv("MESSAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # 32 MB
+DEFAULT_TTL_SECONDS = float(os.getenv("MESSAGE_CACHE_TTL", "1800"))  # 30 minutes
+DEFAULT_VALIDATE = os.getenv("MESSAGE_CACHE_VALIDATE", "true").lower() == "true"
+
+# Only these roles are sent to the LLM
+CONTEXT_ROLES = ("user", "assistant")
+
+
+class MessageRecord:
+    """The fields of a message the LLM context needs"""
+
+    __slots__ = ("id", "role", "content", "phase", "component")
+
+    def __init__(self, id: Optional[str], role: str, content: str, phase: Optional[str] = None, component: Optional[str] = None):
+        self.id = id
+        self.role = role
+        self.content = content
+        self.phase = phase
+        self.component = component
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "MessageRecord":
+        return cls(row.get("id"), row.get("role"), row.get("content") or "", row.get("phase"), row.get("component"))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "role": self.role,
+            "content": self.content,
+            "phase": self.phase,
+            "component": self.component
+        }
+
+    def size(self) -> int:
+        # Approximate: the text dominates
+        return len(self.content) + 128
+
+
+class SessionWindow:
+    """The most recent messages of one session, oldest first, and the session's user"""
+
+    __slots__ = ("messages", "user_id", "expires_at", "bytes")
+
+    def __init__(self, window: int, user_id: Optional[str], expires_at: float):
+        self.messages: Deque[MessageRecord] = deque(maxlen=window)
+        self.user_id = user_id
+        self.expires_at = expires_at
+        self.bytes = 0
+
+    def history(self, limit: int) -> List[Dict[str, Any]]:
+        """The last ``limit`` messages as dicts, oldest first"""
+        return [record.as_dict() for record in list(self.messages)[-limit:]] if limit > 0 else []
+
+    def contains(self, message_id: str) -> bool:
+        return any(record.id == message_id for record in self.messages)
+
+    def append(self, record: MessageRecord) -> int:
+        """Add a record and return the change in bytes (the oldest record may drop out)"""
+        dropped = self.messages[0].size() if len(self.messages) == self.messages.maxlen else 0
+        self.messages.append(record)
+        delta = record.size() - dropped
+        self.bytes += delta
+        return delta
+
+
+class ConversationCache:
+    """
+    LRU of per-session message windows
+
+    ``get`` returns None on a miss; ``fill`` loads a window read from the database and
+    ``append`` adds a newly logged message to a window that is already loaded (a session that
+    is not cached is left alone - its earlier history is unknown).
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        window: int = DEFAULT_WINDOW,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        validate: bool = DEFAULT_VALIDATE
+    ):
+        self.max_sessions = max_sessions
+        self.window = window
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.validate = validate
+        self._sessions: "OrderedDict[str, SessionWindow]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_sessions > 0 and self.window > 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str, limit: int) -> Optional[SessionWindow]:
+        """The session's window, or None if it is not cached or cannot serve ``limit`` messages"""
+        entry = self._sessions.get(session_id)
+        if entry is None or limit > self.window:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(session_id)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._sessions.move_to_end(session_id)
+        self.hits += 1
+        return entry
+
+    def fill(self, session_id: str, rows: Iterable[Dict[str, Any]], user_id: Optional[str] = None) -> None:
+        """Load a window from database rows (oldest first); rows of other roles are skipped"""
+        if not self.enabled:
+            return
+        if session_id in self._sessions:
+            self._remove(session_id)
+        entry = SessionWindow(self.window, user_id, time.monotonic() + self.ttl_seconds)
+        for row in rows:
+            if row.get("role") in CONTEXT_ROLES:
+                entry.append(MessageRecord.from_row(row))
+        self._sessions[session_id] = entry
+        self._bytes += entry.bytes
+        self._evict()
+
+    def append(self, session_id: str, row: Dict[str, Any]) -> None:
+        """Write-through for a newly logged message"""
+        entry = self._sessions.get(session_id)
+        if entry is None or row.get("role") not in CONTEXT_ROLES:
+            return
+        self._bytes += entry.append(MessageRecord.from_row(row))
+        self._evict()
+
+    def invalidate(self, session_id: str) -> None:
+        """Drop a window found to be stale (another process logged messages to the session)"""
+        if session_id in self._sessions:
+            self._remove(session_id)
+            self.stale += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "window": self.window,
+            "ttl_seconds": self.ttl_seconds,
+            "validate": self.validate,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "stale": self.stale
+        }
+
+    def _evict(self) -> None:
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._sessions)))
+            self.evictions += 1
+
+    def _remove(self, session_id: str) -> None:
+        self._bytes -= self._sessions.pop(session_id).bytes
@@ -1,13 +1,22 @@
 import os
+import asyncio
+import functools
 import logging
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, Optional, Sequence, Tuple
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+from backend.utils import pg
+from backend.utils.conversation_cache import CONTEXT_ROLES, ConversationCache
+from backend.utils.deadline import Deadline, DeadlineExceeded
+from backend.utils.write_behind import WriteBehindQueue
+from backend.utils.outbox import Outbox
+
 load_dotenv()
 
 logger = logging.getLogger("solbot.db")
@@ -29,27 +38,129 @@ def get_db() -> Client:
         logger.info("Supabase client initialized successfully.")
     return _supabase_client
 
+# --- Backend selection ---
+# DB_BACKEND=postgres sends the hot queries (messages, sessions, assessments, write-behind
+# batches, outbox replay) straight to Postgres over a pooled asyncpg connection instead of
+# PostgREST; see backend/utils/pg.py. Other routes keep using the Supabase client.
+DB_BACKEND = os.getenv("DB_BACKEND", "supabase").lower()
+USE_POSTGRES = DB_BACKEND == "postgres"
+# begin_chat_turn / complete_chat_turn (migration 009): one round trip before and one after
+# the LLM call. If a call fails, the turn falls back to separate queued inserts and reads.
+CHAT_TURN_FUNCTIONS = os.getenv("DB_CHAT_TURN_FUNCTIONS", "true").lower() == "true"
+
+async def connect() -> None:
+    """Initializes the configured backend (Postgres pool or Supabase client)."""
+    if USE_POSTGRES:
+        await pg.init_pool()
+    else:
+        get_db()
+
+async def close() -> None:
+    """Closes the Postgres pool, if one was opened."""
+    await pg.close_pool()
+
+# --- Async access ---
+# supabase-py is synchronous, so every .execute() runs on a bounded, dedicated thread pool
+# instead of blocking the event loop. Background flushes and outbox replay use the default
+# pool, so they can never starve request-path queries. DB_EXECUTOR_WORKERS=0 runs inline.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "16"))
+_executor: Optional[ThreadPoolExecutor] = (
+    ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="solbot-db")
+    if DB_EXECUTOR_WORKERS > 0 else None
+)
+
+async def run_sync(fn: Callable[..., Any], *args: Any, deadline: Optional[Deadline] = None, stage: str = "database call") -> Any:
+    """
+    Runs a blocking call on the DB executor and awaits it.
+    With a deadline, waits at most the remaining time (the thread finishes on its own).
+    """
+    if deadline is not None:
+        deadline.check(stage)
+    if _executor is None:
+        return fn(*args)
+    future = asyncio.get_running_loop().run_in_executor(_executor, functools.partial(fn, *args))
+    if deadline is None:
+        return await future
+    try:
+        return await asyncio.wait_for(future, timeout=deadline.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage) from None
+
+async def _execute(query: Any, deadline: Optional[Deadline] = None, stage: str = "database call") -> Any:
+    """Awaitable `query.execute()`."""
+    return await run_sync(query.execute, deadline=deadline, stage=stage)
+
+async def _pg_call(fn: Callable[..., Any], *args: Any, deadline: Optional[Deadline] = None, stage: str = "database call") -> Any:
+    """Awaits a pg query, bounded by the remaining time of `deadline` (the query is cancelled)."""
+    if deadline is None:
+        return await fn(*args)
+    deadline.check(stage)
+    try:
+        return await asyncio.wait_for(fn(*args), timeout=deadline.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage) from None
+
+async def _insert(table: str, row: Dict[str, Any], deadline: Optional[Deadline] = None, stage: str = "database call") -> Optional[Dict[str, Any]]:
+    """Inserts one row and returns the stored record (None if the database returned nothing)."""
+    if USE_POSTGRES:
+        return await _pg_call(pg.insert_row, table, row, deadline=deadline, stage=stage)
+    response = await _execute(get_db().table(table).insert(row), deadline, stage)
+    return response.data[0] if response.data else None
+
+def shutdown() -> None:
+    """Stops the DB executor; queued calls are allowed to finish."""
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+
+# Message columns for history reads; `metadata` (raw LLM responses, API usage) is most of a
+# row's size and is only read by callers that ask for it
+MESSAGE_COLUMNS = ("id", "role", "content", "phase", "component", "created_at")
+
+WRITE_ORDER = ("users", "sessions", "messages", "assessments", "llm_interactions", "user_data", "events")
+
+def insert_rows(table: str, rows: List[Dict[str, Any]]) -> None:
+    """Multi-row insert used by the write-behind queue."""
+    get_db().table(table).insert(rows).execute()
+
+def replay_rows(table: str, rows: List[Dict[str, Any]]) -> None:
+    """Idempotent multi-row insert for outbox replay: rows that already made it in are skipped."""
+    get_db().table(table).upsert(rows, ignore_duplicates=True).execute()
+
+# With DB_BACKEND=postgres, batches are loaded with COPY and replay skips existing ids natively
+row_writer: Callable[[str, List[Dict[str, Any]]], Any] = pg.copy_rows if USE_POSTGRES else insert_rows
+row_replayer: Callable[[str, List[Dict[str, Any]]], Any] = pg.replay_rows if USE_POSTGRES else replay_rows
+
+# Rows that could not be written are kept on disk (OUTBOX_PATH) and replayed once the database is back
+outbox = Outbox(table_order=WRITE_ORDER)
+
+# Rows whose results a request does not need are queued and flushed in batches, parents first
+write_behind = WriteBehindQueue(
+    row_writer, table_order=WRITE_ORDER,
+    on_failure=lambda table, rows, error: outbox.add_many(table, rows)
+)
+
+# Recent user/assistant messages per session, kept write-through so chat turns skip the history read
+conversation_cache = ConversationCache()
+
 # --- Core Functions ---
 
-def create_user_and_session(name: str, email: str, profile_data: Dict[str, Any]) -> Dict[str, str]:
+async def create_user_and_session(name: str, email: str, profile_data: Dict[str, Any]) -> Dict[str, str]:
     """
     Creates a new user and a new session for that user.
     Returns a dictionary with the new user_id and session_id.
     """
-    db = get_db()
-    
     # 1. Create the User
     new_user_id = str(uuid.uuid4())
     user_insert_data = {
         "id": new_user_id,
         "name": name,
         "email": email,
-        "profile_data": json.dumps(profile_data) if profile_data else None
+        "profile_data": _json_column(profile_data)
     }
     
     try:
-        user_response = db.table("users").insert(user_insert_data).execute()
-        if user_response.data:
+        user_record = await _insert("users", user_insert_data)
+        if user_record:
             logger.info(f"Successfully created new user with ID: {new_user_id}")
         else:
             logger.error(f"Failed to create user, but continuing to session creation.")
@@ -63,12 +174,12 @@ def create_user_and_session(name: str, email: str, profile_data: Dict[str, Any])
     session_insert_data = {
         "id": new_session_id,
         "user_id": new_user_id,
-        "metadata": json.dumps({"initial_profile": profile_data})
+        "metadata": _json_column({"initial_profile": profile_data})
     }
     
     try:
-        session_response = db.table("sessions").insert(session_insert_data).execute()
-        if session_response.data:
+        session_record = await _insert("sessions", session_insert_data)
+        if session_record:
              logger.info(f"Successfully created new session with ID: {new_session_id} for user {new_user_id}")
         else:
             raise Exception("Session creation returned no data.")
@@ -77,49 +188,53 @@ def create_user_and_session(name: str, email: str, profile_data: Dict[str, Any])
         logger.error(f"Error creating session in database: {e}")
         raise e
 
+    # A new session has no history yet
+    conversation_cache.fill(new_session_id, [], user_id=new_user_id)
     return {"user_id": new_user_id, "session_id": new_session_id}
 
 
-def get_session_by_id(session_id: str) -> Optional[Dict[str, Any]]:
+async def get_session_by_id(session_id: str, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
     """Retrieves a session and its associated user_id."""
-    db = get_db()
+    if deadline is not None:
+        deadline.check("get_session_by_id")
     try:
-        response = db.table("sessions").select("id, user_id").eq("id", session_id).single().execute()
+        if USE_POSTGRES:
+            return await _pg_call(pg.fetch_session, session_id, deadline=deadline, stage="get_session_by_id")
+        response = await _execute(
+            get_db().table("sessions").select("id, user_id").eq("id", session_id).single(),
+            deadline, "get_session_by_id"
+        )
         return response.data
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving session {session_id}: {e}")
         return None
 
 
-def log_message(session_id: str, role: str, content: str, phase: Optional[str] = None, component: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+async def log_message(session_id: str, role: str, content: str, phase: Optional[str] = None, component: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
     """
     Logs a message (from user, assistant, or system) to the database.
     Returns the newly created message record.
+    Raises DeadlineExceeded if `deadline` passes first (the insert may still complete).
     """
-    db = get_db()
-    new_message_id = str(uuid.uuid4())
-    
-    message_data = {
-        "id": new_message_id,
-        "session_id": session_id,
-        "role": role,
-        "content": content,
-        "phase": phase,
-        "component": component,
-        "metadata": json.dumps(metadata) if metadata else None
-    }
+    if deadline is not None:
+        deadline.check("log_message")
+    message_data = _message_row(session_id, role, content, phase, component, metadata)
+    new_message_id = message_data["id"]
     
     try:
-        response = db.table("messages").insert(message_data).execute()
-        if not response.data:
+        record = await _insert("messages", message_data, deadline, "log_message")
+        if not record:
             raise Exception("Inserting message returned no data.")
         logger.info(f"Logged message {new_message_id} for session {session_id}")
-        return response.data[0]
+        conversation_cache.append(session_id, message_data)
+        return record
     except Exception as e:
         logger.error(f"Error logging message: {e}")
         raise e
 
-def log_assessment(
+async def log_assessment(
     session_id: str,
     user_id: str,
     submission_message_id: str,
@@ -133,45 +248,356 @@ def log_assessment(
     Logs a full assessment record for research purposes.
     `evaluation` should be the full metadata blob from the LLM.
     """
-    db = get_db()
-    new_assessment_id = str(uuid.uuid4())
-    
-    assessment_data = {
-        "id": new_assessment_id,
-        "session_id": session_id,
-        "user_id": user_id,
-        "submission_message_id": submission_message_id,
-        "feedback_message_id": feedback_message_id,
-        "phase": phase,
-        "component": component,
-        "attempt_number": attempt_number,
-        "overall_score": evaluation.get("overall_score"),
-        "lowest_category": evaluation.get("lowest_category"),
-        "scaffolding_level": evaluation.get("scaffolding_level"),
-        "rationale": evaluation.get("rationale"),
-        "full_evaluation": json.dumps(evaluation) if evaluation else None,
-    }
+    assessment_data = _assessment_row(
+        session_id, user_id, submission_message_id, feedback_message_id,
+        phase, component, attempt_number, evaluation
+    )
+    new_assessment_id = assessment_data["id"]
 
     try:
-        response = db.table("assessments").insert(assessment_data).execute()
-        if not response.data:
+        record = await _insert("assessments", assessment_data)
+        if not record:
             raise Exception("Inserting assessment returned no data.")
         logger.info(f"Logged assessment {new_assessment_id} for session {session_id}")
-        return response.data[0]
+        return record
     except Exception as e:
         logger.error(f"Error logging assessment: {e}")
         raise e
 
 
-def get_messages_for_session(session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+async def get_messages_for_session(session_id: str, limit: int = 10, deadline: Optional[Deadline] = None, columns: Sequence[str] = MESSAGE_COLUMNS) -> List[Dict[str, Any]]:
     """
-    Retrieves the most recent messages for a given session.
+    Retrieves the most recent user/assistant messages for a given session, oldest first.
+    Only `columns` are read; pass MESSAGE_COLUMNS + ("metadata",) when the metadata is needed.
     """
-    db = get_db()
+    if deadline is not None:
+        deadline.check("get_messages_for_session")
     try:
-        response = db.table("messages").select("*").eq("session_id", session_id).order("created_at", desc=True).limit(limit).execute()
+        if USE_POSTGRES:
+            return await _pg_call(
+                pg.fetch_recent_messages, session_id, limit, tuple(columns),
+                deadline=deadline, stage="get_messages_for_session"
+            )
+        response = await _execute(
+            get_db().table("messages").select(", ".join(columns)).eq("session_id", session_id).in_("role", list(CONTEXT_ROLES))
+            .order("created_at", desc=True).order("id", desc=True).limit(limit),
+            deadline, "get_messages_for_session"
+        )
         # The history needs to be oldest-first for the LLM
         return list(reversed(response.data))
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving messages for session {session_id}: {e}")
-        return [] 
\ No newline at end of file
+        return [] 
+
+
+async def list_messages(
+    session_id: str,
+    limit: int = 50,
+    after: Optional[Tuple[str, str]] = None,
+    descending: bool = False,
+    phase: Optional[str] = None,
+    component: Optional[str] = None,
+    include_metadata: bool = False,
+    deadline: Optional[Deadline] = None,
+    columns: Sequence[str] = MESSAGE_COLUMNS
+) -> List[Dict[str, Any]]:
+    """
+    One page of a session's messages in (created_at, id) order.
+    `after` is the (created_at, id) of the last message of the previous page (keyset
+    pagination: the cost of a page does not grow with its position in the session).
+    Only `columns` (plus metadata with include_metadata) are read. Errors are raised to the caller.
+    """
+    columns = tuple(columns) + (("metadata",) if include_metadata else ())
+    if USE_POSTGRES:
+        return await _pg_call(
+            pg.fetch_messages_page, session_id, limit, columns, after, descending, phase, component,
+            deadline=deadline, stage="list_messages"
+        )
+    query = get_db().table("messages").select(", ".join(columns)).eq("session_id", session_id)
+    if phase is not None:
+        query = query.eq("phase", phase)
+    if component is not None:
+        query = query.eq("component", component)
+    if after is not None:
+        created_at, message_id = after
+        op = "lt" if descending else "gt"
+        query = query.or_(f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",id.{op}.{message_id})')
+    query = query.order("created_at", desc=descending).order("id", desc=descending).limit(limit)
+    response = await _execute(query, deadline, "list_messages")
+    return response.data or []
+
+
+# --- Session summaries ---
+
+async def get_session_summary(session_id: str, phase: Optional[str], deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+    """
+    The running summary of a session's older turns in a phase (summary, through_created_at,
+    through_message_id, message_count), or None. Errors are raised to the caller.
+    """
+    if USE_POSTGRES:
+        return await _pg_call(pg.fetch_session_summary, session_id, phase or "", deadline=deadline, stage="get_session_summary")
+    response = await _execute(
+        get_db().table("session_summaries").select("summary, through_created_at, through_message_id, message_count")
+        .eq("session_id", session_id).eq("phase", phase or "").limit(1),
+        deadline, "get_session_summary"
+    )
+    return response.data[0] if response.data else None
+
+async def save_session_summary(session_id: str, phase: Optional[str], summary: str, through_created_at: str, through_message_id: str, message_count: int) -> None:
+    """Stores (inserts or replaces) the running summary of a session's phase."""
+    row = {
+        "session_id": session_id,
+        "phase": phase or "",
+        "summary": summary,
+        "through_created_at": through_created_at,
+        "through_message_id": through_message_id,
+        "message_count": message_count,
+        "updated_at": _now()
+    }
+    if USE_POSTGRES:
+        await pg.upsert_row("session_summaries", row, ("session_id", "phase"))
+        return
+    # Written by the background summarizer: the default pool, not the request-path executor
+    await asyncio.to_thread(get_db().table("session_summaries").upsert(row, on_conflict="session_id,phase").execute)
+
+
+# --- Chat turns ---
+
+async def begin_chat_turn(session_id: str, content: str, phase: Optional[str] = None, component: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None, history_limit: int = 10, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """
+    Records the student's message and loads what the LLM call needs.
+    Returns {"message": record, "history": [...], "user_id": session user or None}; `history` is
+    the last `history_limit` messages before this one, oldest first.
+    When the session's window is cached, the message is queued and only the id of the latest
+    stored message is read, to check that no other worker has logged to the session since.
+    """
+    message_data = _message_row(session_id, "user", content, phase, component, metadata)
+    window = conversation_cache.get(session_id, history_limit)
+    if window is not None and conversation_cache.validate and not await _window_is_current(session_id, window, deadline):
+        conversation_cache.invalidate(session_id)
+        window = None
+    if window is not None:
+        history = window.history(history_limit)
+        await _queue("messages", message_data, deadline)
+        conversation_cache.append(session_id, message_data)
+        return {"message": message_data, "history": history, "user_id": window.user_id}
+
+    if CHAT_TURN_FUNCTIONS:
+        try:
+            turn = await _call_function("begin_chat_turn", {
+                "p_session_id": session_id,
+                "p_message_id": message_data["id"],
+                "p_content": content,
+                "p_phase": phase,
+                "p_component": component,
+                "p_metadata": message_data["metadata"],
+                "p_history_limit": history_limit,
+                "p_created_at": message_data["created_at"]
+            }, deadline)
+            conversation_cache.fill(session_id, turn["history"] + [turn["message"]], turn.get("user_id"))
+            return turn
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning(f"begin_chat_turn failed for session {session_id}, using separate queries: {e}")
+
+    # Same id as above, so a message the function did store is deduplicated on outbox replay
+    await _queue("messages", message_data, deadline)
+    history = await get_messages_for_session(session_id, limit=history_limit, deadline=deadline)
+    history = [msg for msg in history if msg.get("id") != message_data["id"]]
+    conversation_cache.fill(session_id, history + [message_data])
+    return {"message": message_data, "history": history, "user_id": None}
+
+async def _window_is_current(session_id: str, window: Any, deadline: Optional[Deadline] = None) -> bool:
+    """
+    Whether a cached window holds the session's latest stored message. Newer messages in the
+    window are this process's own, still queued.
+    """
+    latest = await get_messages_for_session(session_id, limit=1, deadline=deadline, columns=("id",))
+    return not latest or window.contains(latest[0]["id"])
+
+async def complete_chat_turn(
+    session_id: str,
+    user_id: Optional[str],
+    submission_message_id: str,
+    content: str,
+    phase: Optional[str],
+    component: Optional[str],
+    metadata: Optional[Dict[str, Any]] = None,
+    attempt_number: Optional[int] = None,
+    evaluation: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Records the assistant's reply and, when `evaluation` is given, the assessment.
+    Returns the assistant message record. `user_id` is looked up if the caller does not have it.
+    """
+    message_data = _message_row(session_id, "assistant", content, phase, component, metadata)
+    assessment_data = None
+    if evaluation:
+        if user_id is None:
+            session_details = await get_session_by_id(session_id)
+            user_id = session_details["user_id"] if session_details else None
+        if user_id:
+            assessment_data = _assessment_row(
+                session_id, user_id, submission_message_id, message_data["id"],
+                phase, component, attempt_number, evaluation
+            )
+
+    # The assessment references the submission, which is only queued when begin_chat_turn used
+    # the cached window: the function would fail on the foreign key, so queue both rows instead
+    # (the queue writes messages before assessments)
+    submission_pending = assessment_data is not None and write_behind.is_pending("messages", submission_message_id)
+    if CHAT_TURN_FUNCTIONS and not submission_pending:
+        try:
+            await _call_function("complete_chat_turn", {
+                "p_session_id": session_id,
+                "p_message_id": message_data["id"],
+                "p_content": content,
+                "p_phase": phase,
+                "p_component": component,
+                "p_metadata": message_data["metadata"],
+                "p_assessment": assessment_data,
+                "p_created_at": message_data["created_at"]
+            })
+            conversation_cache.append(session_id, message_data)
+            return message_data
+        except Exception as e:
+            logger.warning(f"complete_chat_turn failed for session {session_id}, queueing the rows: {e}")
+
+    await _queue("messages", message_data)
+    conversation_cache.append(session_id, message_data)
+    if assessment_data:
+        await _queue("assessments", assessment_data)
+    return message_data
+
+async def _call_function(name: str, params: Dict[str, Any], deadline: Optional[Deadline] = None) -> Any:
+    """One database function call: asyncpg with DB_BACKEND=postgres, otherwise a PostgREST RPC."""
+    if USE_POSTGRES:
+        return await _pg_call(pg.call_function, name, params, deadline=deadline, stage=name)
+    response = await _execute(get_db().rpc(name, params), deadline, name)
+    return response.data
+
+
+# --- Write-behind variants ---
+# Same rows as log_message/log_assessment, but queued: the caller gets the record (with its
+# client-generated id) immediately and only waits if the queue is full.
+
+async def queue_message(session_id: str, role: str, content: str, phase: Optional[str] = None, component: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """
+    Queues a message for insertion and returns its record.
+    Raises DeadlineExceeded if `deadline` passes while waiting for queue space.
+    """
+    message_data = _message_row(session_id, role, content, phase, component, metadata)
+    await _queue("messages", message_data, deadline)
+    conversation_cache.append(session_id, message_data)
+    return message_data
+
+async def queue_events(events: List[Dict[str, Any]], deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+    """
+    Queues UI events for insertion into the append-only events table and returns their rows.
+    Each event has session_id and event_type, and optionally phase, component, metadata and
+    client_ts (when the client recorded it). A batch is written with the next flush.
+    """
+    rows = [_event_row(**event) for event in events]
+    for row in rows:
+        await _queue("events", row, deadline)
+    return rows
+
+async def queue_assessment(
+    session_id: str,
+    user_id: str,
+    submission_message_id: str,
+    feedback_message_id: str,
+    phase: str,
+    component: str,
+    attempt_number: int,
+    evaluation: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Queues an assessment record for insertion and returns it."""
+    assessment_data = _assessment_row(
+        session_id, user_id, submission_message_id, feedback_message_id,
+        phase, component, attempt_number, evaluation
+    )
+    await _queue("assessments", assessment_data)
+    return assessment_data
+
+async def _queue(table: str, row: Dict[str, Any], deadline: Optional[Deadline] = None) -> None:
+    if deadline is None:
+        await write_behind.put(table, row)
+        return
+    deadline.check(f"queue {table} row")
+    try:
+        await asyncio.wait_for(write_behind.put(table, row), timeout=deadline.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"queue {table} row") from None
+
+def _message_row(session_id: str, role: str, content: str, phase: Optional[str], component: Optional[str], metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "role": role,
+        "content": content,
+        "phase": phase,
+        "component": component,
+        "metadata": _json_column(metadata),
+        "created_at": _now()
+    }
+
+def _event_row(
+    session_id: str,
+    event_type: str,
+    phase: Optional[str] = None,
+    component: Optional[str] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+    client_ts: Optional[str] = None
+) -> Dict[str, Any]:
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "event_type": event_type,
+        "phase": phase,
+        "component": component,
+        "metadata": _json_column(metadata),
+        "client_ts": client_ts,
+        "created_at": _now()
+    }
+
+def _assessment_row(
+    session_id: str,
+    user_id: str,
+    submission_message_id: str,
+    feedback_message_id: str,
+    phase: str,
+    component: str,
+    attempt_number: int,
+    evaluation: Dict[str, Any]
+) -> Dict[str, Any]:
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "user_id": user_id,
+        "submission_message_id": submission_message_id,
+        "feedback_message_id": feedback_message_id,
+        "phase": phase,
+        "component": component,
+        "attempt_number": attempt_number,
+        "overall_score": evaluation.get("overall_score"),
+        "lowest_category": evaluation.get("lowest_category"),
+        "scaffolding_level": evaluation.get("scaffolding_level"),
+        "rationale": evaluation.get("rationale"),
+        "full_evaluation": _json_column(evaluation),
+        "created_at": _now()
+    }
+
+def _now() -> str:
+    # Rows are stamped when they are built, not when a batch is flushed (or replayed): rows
+    # of one flush would otherwise share a timestamp and history order would be arbitrary
+    return datetime.now(timezone.utc).isoformat()
+
+def _json_column(value: Optional[Dict[str, Any]]) -> Any:
+    # asyncpg writes dicts as native jsonb; PostgREST rows keep the existing JSON-text format
+    if not value:
+        return None
+    return value if USE_POSTGRES else json.dumps(value)
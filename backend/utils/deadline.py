@@ -0,0 +1,63 @@
+"""
+Per-request deadlines
+
+A Deadline is created once per incoming request (optionally from the client's
+``X-Request-Timeout-Ms`` header) and passed down to the DB and LLM layers. Each stage asks
+for the time that is left instead of using its own fixed timeout, so timeouts and retries no
+longer stack past the point where the caller (e.g. the Vercel proxy) has already given up.
+"""
+
+import logging
+import os
+import time
+from typing import Optional
+
+logger = logging.getLogger("solbot.deadline")
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+DEFAULT_REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "90"))
+MAX_REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT_MAX_SECONDS", "300"))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage cannot start or finish before the request deadline"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded before {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Absolute point in (monotonic) time by which a request must be answered"""
+
+    def __init__(self, timeout_seconds: float):
+        self.timeout_seconds = timeout_seconds
+        self.expires_at = time.monotonic() + timeout_seconds
+
+    @classmethod
+    def from_header(cls, header_value: Optional[str]) -> "Deadline":
+        """Build a deadline from a client-supplied budget in milliseconds, clamped to the server maximum"""
+        timeout = DEFAULT_REQUEST_TIMEOUT
+        if header_value:
+            try:
+                timeout = min(float(header_value) / 1000, MAX_REQUEST_TIMEOUT)
+            except ValueError:
+                logger.warning(f"Ignoring invalid {DEADLINE_HEADER} header: {header_value!r}")
+        return cls(max(0.0, timeout))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self, stage: str) -> None:
+        """Raise DeadlineExceeded if there is no time left to start ``stage``"""
+        if self.expired:
+            raise DeadlineExceeded(stage)
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Time available for the next operation: what is left, capped at the stage's own timeout"""
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
@@ -0,0 +1,165 @@
+"""
+Hedged requests for LLM tail latency
+
+A few Anthropic calls stall far beyond the median and dominate p99. When hedging is enabled,
+a call that has not finished by a high percentile of the recent latency for the same
+phase/component gets a second identical request; whichever succeeds first is used and the
+other is cancelled. Hedges draw from a budget (a fraction of calls) so the extra token spend
+stays bounded, and hedge/win counters make that cost visible.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from backend.utils.retry import RetryBudget
+
+logger = logging.getLogger("solbot.hedging")
+
+ENABLE_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+DEFAULT_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Hedges may be at most this fraction of calls, which bounds the extra token spend
+DEFAULT_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.05"))
+# Don't hedge until there is enough latency history for the phase/component
+DEFAULT_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+DEFAULT_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2.0"))
+LATENCY_WINDOW = 200
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies per key (e.g. phase/component)"""
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = DEFAULT_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, key: str, seconds: float) -> None:
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, key: str, percentile: float) -> Optional[float]:
+        """Latency at ``percentile`` (0-100) for ``key``, or None with too few samples"""
+        samples = self._samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, int(round(percentile / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            key: {
+                "samples": len(samples),
+                "p50_ms": round(sorted(samples)[len(samples) // 2] * 1000)
+            }
+            for key, samples in self._samples.items()
+        }
+
+
+class Hedger:
+    """
+    Run a call, and if it is slower than usual, race it against one identical hedge
+
+    ``attempt_fn`` must be safe to call twice concurrently. The first *successful* result
+    wins; if one request fails while the other is still running, the other is awaited.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        percentile: float = DEFAULT_HEDGE_PERCENTILE,
+        min_delay: float = DEFAULT_MIN_DELAY,
+        budget: Optional[RetryBudget] = None,
+        tracker: Optional[LatencyTracker] = None
+    ):
+        self.name = name
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.budget = budget or RetryBudget(ratio=DEFAULT_HEDGE_MAX_RATIO, min_per_second=0.05)
+        self.tracker = tracker or LatencyTracker()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.skipped = 0
+        # The losing request is cancelled, so its real usage is unknown: callers add the
+        # winner's input tokens, which is what the loser costs at most
+        self.extra_input_tokens_upper_bound = 0
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        delay = self.tracker.percentile(key, self.percentile)
+        return None if delay is None else max(self.min_delay, delay)
+
+    async def run(
+        self,
+        key: str,
+        attempt_fn: Callable[[], Awaitable[Any]],
+        can_hedge: Optional[Callable[[], bool]] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Returns:
+            (result, hedged) where hedged is True if a second request was sent
+        """
+        self.calls += 1
+        self.budget.record_request()
+        delay = self.hedge_delay(key)
+        primary = asyncio.ensure_future(self._timed(key, attempt_fn))
+        if delay is None:
+            return await primary, False
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result(), False
+            if (can_hedge is not None and not can_hedge()) or not self.budget.try_spend():
+                self.skipped += 1
+                return await primary, False
+
+            logger.info(f"{self.name}: {key} call exceeded p{self.percentile:g} ({delay:.1f}s), sending hedge")
+            self.hedges += 1
+            hedge = asyncio.ensure_future(self._timed(key, attempt_fn))
+            tasks.add(hedge)
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                # Both may finish together: any success wins over a failure
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is not None:
+                    if winner is hedge:
+                        self.hedge_wins += 1
+                    else:
+                        self.primary_wins += 1
+                    return winner.result(), True
+                if not tasks:
+                    # Both failed - surface the last error
+                    raise done.pop().exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "percentile": self.percentile,
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_rate": round(self.hedges / self.calls, 4) if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+            "hedge_win_rate": round(self.hedge_wins / self.hedges, 4) if self.hedges else 0.0,
+            "skipped": self.skipped,
+            "extra_input_tokens_upper_bound": self.extra_input_tokens_upper_bound,
+            "budget": self.budget.stats(),
+            "latency": self.tracker.stats()
+        }
+
+    async def _timed(self, key: str, attempt_fn: Callable[[], Awaitable[Any]]) -> Any:
+        start = time.monotonic()
+        result = await attempt_fn()
+        self.tracker.record(key, time.monotonic() - start)
+        return result
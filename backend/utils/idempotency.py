@@ -0,0 +1,95 @@
+"""
+Idempotent request handling
+
+The Next.js proxy retries backend calls it thinks failed, and a slow chat turn is often still
+running (or already recorded) when the retry arrives. Without deduplication every retry logs
+the student's message again and pays for another LLM generation.
+
+A request is identified by an idempotency key: the client's Idempotency-Key header when it
+sends one, otherwise a key derived from the request body. A repeat of a finished request gets
+the stored response; a repeat that arrives while the original is still running attaches to it
+(SingleFlight) instead of starting its own. Completed responses are kept in a bounded TTL
+store (ResponseCache); failures are not stored, so a retry after an error runs again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from backend.utils.cache import ResponseCache
+from backend.utils.singleflight import SingleFlight
+
+logger = logging.getLogger("solbot.idempotency")
+
+# Defaults, overridable from the environment
+DEFAULT_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+DEFAULT_MAX_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(16 * 1024 * 1024)))  # 16 MB
+DEFAULT_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL", "600"))  # 10 minutes
+# Derived keys cannot tell a retry from a student deliberately sending the same text again,
+# so they are only remembered for about as long as the proxy keeps retrying
+DEFAULT_DERIVED_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_DERIVED_TTL", "60"))
+MAX_KEY_LENGTH = 255
+
+
+def request_key(scope: str, payload: Any, client_key: Optional[str] = None) -> Tuple[str, bool]:
+    """
+    Build the store key for a request
+
+    The request body is always part of the key, so a client key reused for a different
+    request never replays the wrong response. Returns (key, derived) where derived is True
+    when the client sent no key of its own.
+    """
+    fingerprint = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    client_key = (client_key or "").strip()[:MAX_KEY_LENGTH]
+    digest = hashlib.sha256(f"{scope}\x00{client_key}\x00{fingerprint}".encode("utf-8")).hexdigest()
+    return f"{scope}:{digest}", not client_key
+
+
+class IdempotencyStore:
+    """
+    Completed responses by key (LRU + TTL) plus the computations still in flight
+
+    ``run`` returns ``(response, outcome)`` where outcome is "new" (this call computed it),
+    "joined" (it waited on an in-flight computation) or "replayed" (a stored response).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        derived_ttl_seconds: float = DEFAULT_DERIVED_TTL_SECONDS
+    ):
+        self.results = ResponseCache(max_entries=max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        self.flights = SingleFlight()
+        self.derived_ttl_seconds = derived_ttl_seconds
+        self.replayed = 0
+        self.joined = 0
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]], derived: bool = False) -> Tuple[Any, str]:
+        stored = self.results.get(key)
+        if stored is not None:
+            self.replayed += 1
+            logger.info(f"Replaying stored response for {key[:16]}...")
+            return stored, "replayed"
+        ttl_seconds = self.derived_ttl_seconds if derived else None
+        result, coalesced = await self.flights.do(key, lambda: self._run_and_store(key, fn, ttl_seconds))
+        if coalesced:
+            self.joined += 1
+            logger.info(f"Attached to in-flight request {key[:16]}...")
+        return result, "joined" if coalesced else "new"
+
+    async def _run_and_store(self, key: str, fn: Callable[[], Awaitable[Any]], ttl_seconds: Optional[float]) -> Any:
+        result = await fn()
+        self.results.put(key, result, ttl_seconds=ttl_seconds)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "store": self.results.stats(),
+            "in_flight": self.flights.stats(),
+            "replayed": self.replayed,
+            "joined": self.joined
+        }
@@ -0,0 +1,175 @@
+"""
+Adaptive (AIMD) concurrency limiter for outbound Anthropic calls
+
+During a full lab session every student submits at once. Without a limit the burst hits the
+provider's rate limits and every request then backs off and retries together. The limiter
+caps concurrent calls with a window that grows additively while calls succeed and shrinks
+multiplicatively on overload signals (429, 529 and timeouts), like TCP congestion control.
+Requests above the window wait in a FIFO queue; queue depth and wait times are recorded so
+deployments can be sized from real traffic.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+logger = logging.getLogger("solbot.limiter")
+
+DEFAULT_INITIAL_LIMIT = float(os.getenv("LLM_CONCURRENCY_INITIAL", "8"))
+DEFAULT_MIN_LIMIT = float(os.getenv("LLM_CONCURRENCY_MIN", "1"))
+DEFAULT_MAX_LIMIT = float(os.getenv("LLM_CONCURRENCY_MAX", "64"))
+
+# HTTP statuses that mean "slow down": rate limited, and Anthropic's overloaded_error
+OVERLOAD_STATUS_CODES = {429, 529}
+
+
+def is_overload_error(error: Optional[BaseException]) -> bool:
+    """
+    True for errors that signal provider overload rather than a bad request
+
+    A timeout only counts when the attempt ran its full time; callers raise DeadlineExceeded
+    instead when the request deadline cut the attempt short, and that leaves the window alone.
+    """
+    if error is None:
+        return False
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if type(error).__name__ in ("APITimeoutError", "RateLimitError", "OverloadedError"):
+        return True
+    return getattr(error, "status_code", None) in OVERLOAD_STATUS_CODES
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency window with a FIFO wait queue
+
+    - success: ``limit += increase / limit`` (about +1 per window of successful calls)
+    - overload: ``limit *= decrease_factor``, at most once per ``decrease_cooldown`` seconds
+      so a single burst of failures does not collapse the window to the minimum
+    - other errors leave the window unchanged
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float = DEFAULT_INITIAL_LIMIT,
+        min_limit: float = DEFAULT_MIN_LIMIT,
+        max_limit: float = DEFAULT_MAX_LIMIT,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        decrease_cooldown: float = 1.0
+    ):
+        self.name = name
+        self.min_limit = max(1.0, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        # Counters
+        self.acquired = 0
+        self.successes = 0
+        self.overloads = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent_waits: Deque[float] = deque(maxlen=1000)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> float:
+        """Wait for a slot; returns the time spent queued in seconds"""
+        start = time.monotonic()
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was granted just as we were cancelled - hand it on
+                    self.in_flight -= 1
+                    self._wake()
+                else:
+                    self._waiters.remove(waiter)
+                raise
+        waited = time.monotonic() - start
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self._recent_waits.append(waited)
+        return waited
+
+    def release(self, error: Optional[BaseException] = None) -> None:
+        """Free the slot and adapt the window to the call's outcome"""
+        self.in_flight -= 1
+        if error is None:
+            self.successes += 1
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+        elif is_overload_error(error):
+            self.overloads += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self.decrease_cooldown:
+                self._last_decrease = now
+                previous = self.limit
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                logger.warning(
+                    f"{self.name}: overload ({type(error).__name__}), concurrency {previous:.1f} -> {self.limit:.1f}"
+                )
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Hold a slot for the duration of the block; the block's exception drives the window
+
+        ``timeout`` bounds the time spent queued (asyncio.TimeoutError, no slot is taken).
+        """
+        if timeout is None:
+            await self.acquire()
+        else:
+            await asyncio.wait_for(self.acquire(), timeout=timeout)
+        try:
+            yield
+        except BaseException as e:
+            # Cancellation and generator shutdown are not a signal about the provider
+            self.release(e if isinstance(e, Exception) else Exception("cancelled"))
+            raise
+        else:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._recent_waits)
+        return {
+            "limit": round(self.limit, 2),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "acquired": self.acquired,
+            "successes": self.successes,
+            "overloads": self.overloads,
+            "avg_wait_ms": round(self.total_wait / self.acquired * 1000, 1) if self.acquired else 0.0,
+            "p95_wait_ms": round(waits[int(len(waits) * 0.95) - 1] * 1000, 1) if waits else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1)
+        }
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
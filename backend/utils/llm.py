@@ -5,9 +5,9 @@ LLM utility for interacting with Claude
 import logging
 import os
 import json
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, AsyncIterator
 import asyncio
-from anthropic import AsyncAnthropic
+from anthropic import APIConnectionError
 from dotenv import load_dotenv
 import hashlib
 import time
@@ -16,6 +16,15 @@ import traceback
 import uuid
 import datetime
 
+from backend.utils.cache import ResponseCache, RedisCacheBackend, TieredCache
+from backend.utils.context import build_messages
+from backend.utils.singleflight import SingleFlight
+from backend.utils.limiter import AdaptiveConcurrencyLimiter
+from backend.utils.retry import RetryPolicy
+from backend.utils.deadline import Deadline, DeadlineExceeded
+from backend.utils.hedging import Hedger, ENABLE_HEDGING
+from backend.utils.cassette import with_cassette
+from backend.utils.providers import create_provider, extract_usage
 
 # Load environment variables
 load_dotenv()
@@ -31,50 +40,160 @@ CLAUDE_MODEL = "claude-sonnet-4-20250514"
 
 logger.info(f"Using Claude model: {CLAUDE_MODEL}")
 
-# Initialize Anthropic client with robust timeout for educational use
-client = None
-if ANTHROPIC_API_KEY:
-    try:
-        client = AsyncAnthropic(
-            api_key=ANTHROPIC_API_KEY,
-            timeout=90.0  # Generous timeout for complex educational prompts - users need quality feedback
-        )
-        logger.info(f"Anthropic client initialized with model: {CLAUDE_MODEL}")
-    except Exception as e:
-        logger.error(f"Error initializing Anthropic client: {e}")
-        client = None
+# The provider behind every call: Anthropic, or the local mock (LLM_PROVIDER=mock, or no API key),
+# recorded to / replayed from LLM_CASSETTE if set.
+# Generous timeout for complex educational prompts - users need quality feedback
+provider = with_cassette(create_provider(CLAUDE_MODEL, api_key=ANTHROPIC_API_KEY, timeout=90.0))
+if provider.name == "mock":
+    logger.warning(f"Using the mock LLM provider ({provider.profile.describe()['source']} latency) - responses are canned")
 else:
-    logger.warning("ANTHROPIC_API_KEY not found - using mock responses for testing")
-
-# Simple in-memory LRU cache with expiry
-response_cache = {}
-cache_size_limit = 150  # Increased from 100 to 150 to store more responses
-cache_ttl = 1200  # Increased from 600 (10 minutes) to 1200 (20 minutes)
-
-# Local memory DB fallback for logging
-local_memory_db = {
-    "llm_interactions": []
-}
-
-def create_cache_key(system_prompt: str, user_message: str, tools: Optional[List[Dict[str, Any]]] = None, chat_history: Optional[List[Dict[str, Any]]] = None) -> str:
-    """Create a cache key for the given parameters with fuzzy matching"""
-    # Create a string representation of parameters that's more likely to match similar requests
-    # Truncate the system prompt to first 800 chars to increase cache hits
-    system_truncated = system_prompt[:800] if system_prompt else ""
+    logger.info(f"LLM provider {provider.name} initialized with model: {CLAUDE_MODEL}")
+
+# In-memory LRU cache with TTL expiry and a byte budget
+# (sized by LLM_CACHE_MAX_ENTRIES / LLM_CACHE_MAX_BYTES / LLM_CACHE_TTL)
+response_cache = ResponseCache()
+# ...in front of an optional cache shared by all workers (LLM_CACHE_REDIS_URL)
+tiered_cache = TieredCache(response_cache, RedisCacheBackend.from_env())
+
+# Identical requests that are already in flight share one API call (keyed by cache key)
+inflight_requests = SingleFlight()
+
+# Outbound concurrency window for Anthropic calls: grows while calls succeed, halves on
+# 429/529/timeouts (LLM_CONCURRENCY_INITIAL / LLM_CONCURRENCY_MIN / LLM_CONCURRENCY_MAX)
+anthropic_limiter = AdaptiveConcurrencyLimiter("anthropic")
+
+# Retries for transient errors only: full-jitter backoff, honours retry-after, and a
+# process-wide budget keeps retries to a small fraction of traffic (LLM_MAX_ATTEMPTS, LLM_RETRY_*)
+anthropic_retry = RetryPolicy("anthropic")
+# Opt-in hedging (LLM_HEDGING): a call slower than the recent p95 for its phase/component gets
+# one identical backup request, within a budget of LLM_HEDGE_MAX_RATIO of calls
+anthropic_hedger = Hedger("anthropic")
+# Per-attempt timeout - generous for complex educational content
+ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "80"))
+
+# Bump CACHE_KEY_VERSION when the key format changes, PROMPT_VERSION when prompts are revised
+CACHE_KEY_VERSION = 2
+PROMPT_VERSION = os.getenv("PROMPT_VERSION", "1")
+
+# Anthropic prompt caching: the phase system prompts are several KB of static rubric text,
+# so mark them as a cache breakpoint and pay full input price only on the first turn
+ENABLE_PROMPT_CACHING = os.getenv("ENABLE_PROMPT_CACHING", "true").lower() == "true"
+# Also add a breakpoint at the end of the (stable) chat history prefix. The phase prompts alone
+# are close to the model's minimum cacheable length, so including history is what makes later
+# turns of a session reliably hit the cache
+PROMPT_CACHE_HISTORY = os.getenv("PROMPT_CACHE_HISTORY", "true").lower() == "true"
+
+
+def create_cache_key(
+    system_prompt: str,
+    user_message: str,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    chat_history: Optional[List[Dict[str, Any]]] = None,
+    model: str = CLAUDE_MODEL,
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    phase: Optional[str] = None,
+    summary: Optional[str] = None
+) -> str:
+    """
+    Create an exact cache key for a request
+
+    The key is a SHA-256 over a canonical JSON document of everything that influences the
+    response: the full system prompt, the exact messages that will be sent, tools, model,
+    temperature and max_tokens, plus the key-format and prompt versions. Bumping
+    PROMPT_VERSION (or editing a prompt) therefore never serves stale entries.
+    """
+    canonical = json.dumps(
+        {
+            "v": CACHE_KEY_VERSION,
+            "prompt_version": PROMPT_VERSION,
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "system": system_prompt or "",
+            "summary": summary or None,
+            "messages": _build_messages(user_message, chat_history, phase),
+            "tools": tools or None
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def _build_messages(user_message: str, chat_history: Optional[List[Dict[str, Any]]] = None, phase: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Build the Anthropic messages list: as much recent history as fits the phase's token budget, then the current user message"""
+    return build_messages(user_message, chat_history, phase=phase)
+
+def _build_request_params(
+    system_prompt: str,
+    user_message: str,
+    tools: Optional[List[Dict[str, Any]]],
+    chat_history: Optional[List[Dict[str, Any]]],
+    temperature: float,
+    max_tokens: int,
+    cache_history: Optional[bool] = None,
+    phase: Optional[str] = None,
+    summary: Optional[str] = None
+) -> Dict[str, Any]:
+    """Assemble the messages.create / messages.stream parameters, including prompt cache breakpoints"""
+    messages = _build_messages(user_message, chat_history, phase)
+    params = {
+        "model": CLAUDE_MODEL,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "system": system_prompt,
+        "messages": messages
+    }
     
-    # Only use essential parts for the key
-    key_parts = [
-        system_truncated,
-        user_message.strip(),  # Remove whitespace for better matching
-        # Only include tools if actually present
-        json.dumps(tools) if tools else "",
-        # Only use the last message from chat history for caching to increase cache hits
-        json.dumps(chat_history[-1:]) if chat_history else ""
-    ]
+    # Add tools if provided
+    if tools:
+        params["tools"] = tools
+    
+    if ENABLE_PROMPT_CACHING and system_prompt:
+        # Tools and system prompt form the cached prefix (tools are rendered first)
+        params["system"] = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+        if summary:
+            # After the breakpoint: the summary changes as the session goes on
+            params["system"].append({"type": "text", "text": _summary_text(summary)})
+        
+        if cache_history is None:
+            cache_history = PROMPT_CACHE_HISTORY
+        if cache_history and len(messages) > 1:
+            # Everything before the current user message is identical on the next turn
+            prefix_end = messages[-2]
+            prefix_end["content"] = [{"type": "text", "text": prefix_end["content"], "cache_control": {"type": "ephemeral"}}]
+    elif summary:
+        params["system"] = f"{system_prompt}\n\n{_summary_text(summary)}" if system_prompt else _summary_text(summary)
     
-    # Create a hash of the key parts
-    key = hashlib.md5("".join(key_parts).encode()).hexdigest()
-    return key
+    return params
+
+def _summary_text(summary: str) -> str:
+    return f"Summary of the earlier conversation in this phase (the recent messages follow in full):\n{summary}"
+
+def _attempt_timeout(deadline: Optional[Deadline]) -> float:
+    """Timeout for one API attempt: the per-attempt cap, or less if the deadline is closer"""
+    return deadline.timeout(ATTEMPT_TIMEOUT_SECONDS) if deadline else ATTEMPT_TIMEOUT_SECONDS
+
+def _raise_if_deadline_cut(error: Exception, timeout: float, stage: str) -> None:
+    """
+    Raise DeadlineExceeded for an attempt timeout that the request deadline cut short
+
+    Only a timeout after the full ATTEMPT_TIMEOUT_SECONDS says anything about provider load;
+    raised inside the limiter slot, this keeps the request's own budget out of the AIMD window,
+    the retry policy and the hedging budget.
+    """
+    timed_out = isinstance(error, asyncio.TimeoutError) or type(error).__name__ == "APITimeoutError"
+    if timed_out and timeout < ATTEMPT_TIMEOUT_SECONDS:
+        raise DeadlineExceeded(stage) from None
+
+def _deadline_exceeded_result(error: DeadlineExceeded) -> Dict[str, Any]:
+    return {
+        "error": "deadline_exceeded",
+        "stage": error.stage,
+        "content": "I wasn't able to finish your feedback in time. Your work has been saved - please try again.",
+        "retry_suggested": True
+    }
 
 async def log_llm_interaction(
     user_id: Optional[str] = None,
@@ -91,116 +210,66 @@ async def log_llm_interaction(
     max_tokens: int = 750,
     input_tokens: int = 0,
     output_tokens: int = 0,
+    cache_creation_input_tokens: int = 0,
+    cache_read_input_tokens: int = 0,
     request_timestamp: Optional[float] = None,
     response_timestamp: Optional[float] = None,
     duration_ms: Optional[int] = None,
     cache_hit: bool = False,
+    coalesced: bool = False,
     metadata: Optional[Dict[str, Any]] = None
 ) -> None:
     """
     Log an LLM interaction to the database
     
     This function will save all details of an LLM interaction to the llm_interactions table
-    for analysis, debugging, and auditing purposes.
+    for analysis, debugging, and auditing purposes. ``coalesced`` marks a caller that shared
+    another request's in-flight API call, so it can be counted separately from real calls.
     """
-    # Declare global at the top of the function
-    global local_memory_db
-    
     # Import here to avoid circular imports
     try:
-        from backend.utils.db import get_db
-    except ImportError:
-        logger.warning("Could not import get_db, using memory storage only")
-        local_memory_db["llm_interactions"].append({
-            "id": str(uuid.uuid4()),
-            "error": "db_import_error",
-            "raw_llm_response": raw_llm_response[:100] + "..." if raw_llm_response else "",
-            "timestamp": datetime.datetime.now().isoformat()
-        })
+        from backend.utils.db import write_behind, outbox
+    except ImportError as e:
+        logger.warning(f"Could not import the database layer, not logging LLM interaction: {e}")
         return
     
     try:
         # Calculate duration if timestamps are provided
         if request_timestamp and response_timestamp and not duration_ms:
             duration_ms = int((response_timestamp - request_timestamp) * 1000)
-            
-        # Create interaction record
-        interaction = {
+        
+        # Minimal fields, focusing on essential data that shouldn't cause schema issues
+        minimal_data = {
             "id": str(uuid.uuid4()),
-            "user_id": user_id,
-            "conversation_id": conversation_id,
-            "message_id": message_id,
-            "phase": phase or "unknown",
-            "component": component,
-            "system_prompt": system_prompt,
-            "user_message": user_message,
-            "raw_llm_response": raw_llm_response,
-            "processed_response": processed_response,
             "model_name": model_name,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
             "input_tokens": input_tokens,
             "output_tokens": output_tokens,
-            "request_timestamp": datetime.datetime.fromtimestamp(request_timestamp or time.time()).isoformat(),
-            "response_timestamp": datetime.datetime.fromtimestamp(response_timestamp or time.time()).isoformat(),
-            "duration_ms": duration_ms,
-            "cache_hit": cache_hit,
-            "metadata": json.dumps(metadata or {}) if metadata else "{}"
+            # When the call finished, not when the write-behind batch is flushed
+            "created_at": datetime.datetime.fromtimestamp(response_timestamp or time.time(), datetime.timezone.utc).isoformat(),
+            "metadata": json.dumps({
+                "phase": phase,
+                "component": component,
+                "duration_ms": duration_ms,
+                "cache_hit": cache_hit,
+                "coalesced": coalesced,
+                "cache_creation_input_tokens": cache_creation_input_tokens,
+                "cache_read_input_tokens": cache_read_input_tokens,
+                # Time to first token of streamed calls (latency profiles for the mock provider)
+                "ttft_ms": (metadata or {}).get("ttft_ms")
+            }, default=str)
         }
+        if user_id:
+            minimal_data["user_id"] = user_id
         
-        # First determine if we should use memory storage
-        use_memory_storage = True
-        try:
-            # Get DB client
-            db = get_db()
-            use_memory_storage = db is None
-        except (ImportError, Exception) as db_err:
-            logger.warning(f"Error checking DB availability: {db_err}, using memory storage")
-            use_memory_storage = True
-        
-        # Use memory storage if needed
-        if use_memory_storage:
-            # Store in local memory DB
-            local_memory_db["llm_interactions"].append(interaction)
-            logger.debug(f"Stored LLM interaction in memory: {interaction['id']}")
-            return
-            
-        # If we reach here, attempt to use the database but don't fail if it doesn't work
         try:
-            # Try minimal fields first, focusing on essential data
-            minimal_data = {
-                "id": interaction["id"],
-                "model_name": model_name,
-                "input_tokens": input_tokens,
-                "output_tokens": output_tokens
-            }
-            
-            # Try to add important fields that shouldn't cause schema issues
-            try:
-                if user_id:
-                    minimal_data["user_id"] = user_id
-            except:
-                pass
-                
-            try:
-                # Add metadata field if it won't cause issues
-                minimal_data["metadata"] = json.dumps({
-                    "phase": phase,
-                    "component": component,
-                    "duration_ms": duration_ms,
-                    "cache_hit": cache_hit
-                })
-            except:
-                pass
-            
-            # Try to insert the minimal version
-            db.table("llm_interactions").insert(minimal_data).execute()
-            logger.debug(f"Logged minimal LLM interaction to database: {interaction['id']}")
-            
-        except Exception as db_error:
-            logger.warning(f"Error saving to database: {db_error}")
-            # Fallback to memory storage but don't let it interrupt the main thread
-            local_memory_db["llm_interactions"].append(interaction)
+            # Queue it; it is inserted in the next write-behind batch (and spills to the
+            # outbox if the database is unreachable)
+            await write_behind.put("llm_interactions", minimal_data)
+            logger.debug(f"Queued minimal LLM interaction for the database: {minimal_data['id']}")
+        except Exception as queue_error:
+            logger.warning(f"Error queueing LLM interaction: {queue_error}")
+            # Keep it on disk for replay rather than losing it
+            outbox.add("llm_interactions", minimal_data)
             
     except Exception as e:
         # Make sure this function never fails and interrupts the main application flow
@@ -219,7 +288,11 @@ async def call_claude(
     conversation_id: Optional[str] = None,
     message_id: Optional[str] = None,
     phase: Optional[str] = None,
-    component: Optional[str] = None
+    component: Optional[str] = None,
+    cache_history: Optional[bool] = None,
+    deadline: Optional[Deadline] = None,
+    hedge: Optional[bool] = None,
+    summary: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Call Claude with the specified prompts and parameters
@@ -232,283 +305,134 @@ async def call_claude(
         temperature: The temperature (0.0-1.0)
         max_tokens: Maximum tokens to generate
         use_cache: Whether to use caching (default: True)
-        stream: Whether to stream the response (default: False)
+        stream: Whether to use the streaming API internally (default: False); the assembled response is still returned
         user_id: Optional user ID for logging
         conversation_id: Optional conversation ID for logging
         message_id: Optional message ID for logging
         phase: Optional phase for logging
         component: Optional component for logging
+        cache_history: Also place a prompt cache breakpoint after the chat history
+            (default: PROMPT_CACHE_HISTORY); the system prompt is always cached when
+            ENABLE_PROMPT_CACHING is on
+        deadline: Optional request deadline; each attempt gets only the remaining time and no
+            retry is made that could not finish in time
+        hedge: Send a backup request if this call is slower than usual for its phase/component
+            (default: LLM_HEDGING); not applied to streamed calls
+        summary: Optional running summary of the turns no longer in chat_history, sent as an
+            extra system block after the cached system prompt
         
     Returns:
-        Dictionary containing the model's response
+        Dictionary containing the model's response; ``usage`` includes the prompt cache
+        creation/read token counts. If the deadline is exceeded, ``error`` is
+        ``"deadline_exceeded"``
     """
+    if stream:
+        # Consume the token stream and hand back the assembled result
+        result: Dict[str, Any] = {}
+        async for event in stream_claude(
+            system_prompt=system_prompt, user_message=user_message, tools=tools,
+            chat_history=chat_history, temperature=temperature, max_tokens=max_tokens,
+            use_cache=use_cache, user_id=user_id, conversation_id=conversation_id,
+            message_id=message_id, phase=phase, component=component, cache_history=cache_history,
+            deadline=deadline, summary=summary
+        ):
+            if event["type"] == "result":
+                result = event["result"]
+        return result
+
     # Track request start time
     request_timestamp = time.time()
-    cache_hit = False
+    cache_key = None
     
     try:
         # Optimize: Cache for temperatures up to 0.6 for more cache hits
         if use_cache and temperature <= 0.6:
-            cache_key = create_cache_key(system_prompt, user_message, tools, chat_history)
+            cache_key = create_cache_key(
+                system_prompt, user_message, tools, chat_history,
+                model=provider.model, temperature=temperature, max_tokens=max_tokens, phase=phase,
+                summary=summary
+            )
             
-            # Check if we have a cached response
-            if cache_key in response_cache:
-                cache_entry = response_cache[cache_key]
+            # Check if we have a cached (and unexpired) response
+            cached_result = await tiered_cache.get(cache_key)
+            if cached_result is not None:
+                logger.info(f"Using cached response for {cache_key[:8]}...")
                 
-                # Check if cache entry is still valid
-                if time.time() - cache_entry["timestamp"] < cache_ttl:
-                    logger.info(f"Using cached response for {cache_key[:8]}...")
-                    
-                    # Extract response from cache
-                    result = cache_entry["response"]
-                    cache_hit = True
-                    
-                    # Calculate response time for logging
-                    response_timestamp = time.time()
-                    
-                    # Log the cached interaction
-                    await log_llm_interaction(
-                        user_id=user_id,
-                        conversation_id=conversation_id,
-                        message_id=message_id,
-                        phase=phase,
-                        component=component,
-                        system_prompt=system_prompt,
-                        user_message=user_message,
-                        raw_llm_response=result.get("content", ""),
-                        processed_response=result.get("content", ""),
-                        model_name=result.get("model", CLAUDE_MODEL),
-                        temperature=temperature,
-                        max_tokens=max_tokens,
-                        input_tokens=result.get("usage", {}).get("input_tokens", 0),
-                        output_tokens=result.get("usage", {}).get("output_tokens", 0),
-                        request_timestamp=request_timestamp,
-                        response_timestamp=response_timestamp,
-                        duration_ms=int((response_timestamp - request_timestamp) * 1000),
-                        cache_hit=True,
-                        metadata={
-                            "tools": tools,
-                            "cache_key": cache_key,
-                            "chat_history_length": len(chat_history) if chat_history else 0
-                        }
-                    )
-                    
-                    return result
-                else:
-                    # Remove expired cache entry
-                    del response_cache[cache_key]
-        
-        # Format messages - use up to 8 recent messages for full context
-        messages = []
-        
-        # Add chat history if provided (up to last 8 messages)
-        if chat_history:
-            for msg in chat_history[-8:]:  # Use last 8 messages
-                # Add each message to the context
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                if role in ["user", "assistant"] and content:
-                    messages.append({"role": role, "content": content})
-
-        # Add current user message
-        messages.append({"role": "user", "content": user_message})
-        
-        # Prepare API call parameters
-        params = {
-            "model": CLAUDE_MODEL,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "system": system_prompt,
-            "messages": messages
-        }
+                result = cached_result
+                
+                # Calculate response time for logging
+                response_timestamp = time.time()
+                
+                # Log the cached interaction
+                await log_llm_interaction(
+                    user_id=user_id,
+                    conversation_id=conversation_id,
+                    message_id=message_id,
+                    phase=phase,
+                    component=component,
+                    system_prompt=system_prompt,
+                    user_message=user_message,
+                    raw_llm_response=result.get("content", ""),
+                    processed_response=result.get("content", ""),
+                    model_name=result.get("model", provider.model),
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    input_tokens=result.get("usage", {}).get("input_tokens", 0),
+                    output_tokens=result.get("usage", {}).get("output_tokens", 0),
+                    request_timestamp=request_timestamp,
+                    response_timestamp=response_timestamp,
+                    duration_ms=int((response_timestamp - request_timestamp) * 1000),
+                    cache_hit=True,
+                    metadata={
+                        "tools": tools,
+                        "cache_key": cache_key,
+                        "chat_history_length": len(chat_history) if chat_history else 0
+                    }
+                )
+                
+                return result
         
-        # Add tools if provided
-        if tools:
-            params["tools"] = tools
+        if cache_key is None:
+            return await _call_claude_uncached(
+                system_prompt, user_message, tools, chat_history, temperature, max_tokens,
+                cache_history, None, request_timestamp, user_id, conversation_id, message_id, phase, component,
+                deadline, hedge, summary
+            )
         
-        # Check if we have a valid client
-        if not client:
-            logger.warning("No Anthropic client available - returning mock response")
-            # Return a helpful mock response for testing
-            mock_content = f"""Thank you for your response! 
-
-I'm currently running in test mode without access to the AI service. Here's some general feedback:
-
-**Your input**: "{user_message[:100]}{'...' if len(user_message) > 100 else ''}"
-
-**Phase**: {phase or 'Unknown'}
-**Component**: {component or 'Unknown'}
-
-This is a mock response to help you test the system. To get real AI feedback, please ensure the ANTHROPIC_API_KEY is configured on the backend service.
-
-<!-- INSTRUCTOR_METADATA
-Overall_Score: 2
-Scaffolding_Level: MEDIUM
-Task_Completion: 2
-Content_Quality: 2
--->"""
-
-            result = {
-                "content": mock_content,
-                "model": CLAUDE_MODEL,
-                "usage": {
-                    "input_tokens": len(system_prompt + user_message) // 4,  # Rough estimate
-                    "output_tokens": len(mock_content) // 4
-                }
-            }
-            
-            # Calculate response time for logging
-            response_timestamp = time.time()
-            
-            # Log the mock interaction
-            await log_llm_interaction(
-                user_id=user_id,
-                conversation_id=conversation_id,
-                message_id=message_id,
-                phase=phase,
-                component=component,
-                system_prompt=system_prompt,
-                user_message=user_message,
-                raw_llm_response=mock_content,
-                processed_response=mock_content,
-                model_name="MOCK_" + CLAUDE_MODEL,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                input_tokens=result["usage"]["input_tokens"],
-                output_tokens=result["usage"]["output_tokens"],
-                request_timestamp=request_timestamp,
-                response_timestamp=response_timestamp,
-                duration_ms=int((response_timestamp - request_timestamp) * 1000),
-                cache_hit=False,
-                metadata={
-                    "mock_response": True,
-                    "reason": "no_api_key"
-                }
+        # Coalesce identical concurrent requests: the first caller makes the API call (under its
+        # own deadline) and everyone else arriving before it finishes awaits the same result
+        shared_call = inflight_requests.do(
+            cache_key,
+            lambda: _call_claude_uncached(
+                system_prompt, user_message, tools, chat_history, temperature, max_tokens,
+                cache_history, cache_key, request_timestamp, user_id, conversation_id, message_id, phase, component,
+                deadline, hedge, summary
             )
-            
-            return result
-
-        # Make API call with robust timeout handling for educational use
+        )
         try:
-            # Set a generous timeout for educational prompts that need quality feedback
-            api_timeout = 80  # Generous timeout for complex educational content
-            
-            logger.info(f"Calling Claude API with model={CLAUDE_MODEL}, temperature={temperature}")
-            
-            # Create the API call as a task
-            if stream:
-                # Streaming logic - not implemented in this edit for simplicity
-                # Would need to implement client-side streaming reception
-                logger.warning("Streaming requested but not implemented yet")
-            
-            # Implement robust retry logic for educational reliability
-            max_retries = 3  # More retries for educational systems - users need the feedback
-            retry_count = 0
-            last_error = None
-            
-            while retry_count <= max_retries:
+            if deadline is None:
+                result, coalesced = await shared_call
+            else:
+                # Waiting is bounded by this caller's deadline; the shared call itself is shielded
                 try:
-                    # Create the API call as a task
-                    api_task = client.messages.create(**params)
-                    
-                    # Wait for the task with a timeout
-                    response = await asyncio.wait_for(api_task, timeout=api_timeout)
-                    
-                    # If we get here, the call succeeded
-                    break
-                    
+                    result, coalesced = await asyncio.wait_for(shared_call, timeout=deadline.remaining())
                 except asyncio.TimeoutError:
-                    retry_count += 1
-                    last_error = "timeout"
-                    logger.warning(f"API call timed out (attempt {retry_count}/{max_retries})")
-                    if retry_count <= max_retries:
-                        # Exponential backoff for educational reliability
-                        wait_time = min(retry_count * 2, 10)  # 2s, 4s, 6s max
-                        logger.info(f"Waiting {wait_time}s before retry...")
-                        await asyncio.sleep(wait_time)
-                    else:
-                        # Max retries reached, re-raise
-                        raise
-                        
-                except aiohttp.ClientError as e:
-                    retry_count += 1
-                    last_error = f"connection: {str(e)}"
-                    logger.warning(f"API connection error (attempt {retry_count}/{max_retries}): {e}")
-                    if retry_count <= max_retries:
-                        # Exponential backoff for connection issues
-                        wait_time = min(retry_count * 2, 10)  # 2s, 4s, 6s max
-                        logger.info(f"Waiting {wait_time}s before retry...")
-                        await asyncio.sleep(wait_time)
-                    else:
-                        # Max retries reached, re-raise
-                        raise
-                        
-                except Exception as e:
-                    retry_count += 1
-                    last_error = f"other: {str(e)}"
-                    logger.warning(f"API call error (attempt {retry_count}/{max_retries}): {e}")
-                    if retry_count <= max_retries:
-                        # Exponential backoff for other errors
-                        wait_time = min(retry_count * 2, 10)  # 2s, 4s, 6s max
-                        logger.info(f"Waiting {wait_time}s before retry...")
-                        await asyncio.sleep(wait_time)
-                    else:
-                        # Max retries reached, re-raise
-                        raise
-            
-            # Check if we exhausted all retries
-            if retry_count > max_retries:
-                raise Exception(f"Failed after {max_retries} retries. Last error: {last_error}")
-            
-        except asyncio.TimeoutError:
-            logger.error(f"API call timed out after {api_timeout} seconds and {max_retries} retries")
-            result = {
-                "error": "timeout_after_retries", 
-                "content": "I'm taking longer than usual to provide feedback on your response. This often happens with complex educational content that requires careful analysis.\n\n**Your work has been saved** and you can:\n\n1. **Try again** - Click the retry button to get your feedback\n2. **Continue anyway** - Your responses are saved and you can proceed to the next task\n3. **Simplify your response** - Consider making your answer more concise if you're comfortable doing so\n\nYour learning progress is not lost - the system is designed to handle these situations gracefully.",
-                "retry_suggested": True
-            }
-            
-            # Calculate response time for logging
-            response_timestamp = time.time()
-            
-            # Log the timed out interaction
-            await log_llm_interaction(
-                user_id=user_id,
-                conversation_id=conversation_id,
-                message_id=message_id,
-                phase=phase,
-                component=component,
-                system_prompt=system_prompt,
-                user_message=user_message,
-                raw_llm_response="TIMEOUT",
-                model_name=CLAUDE_MODEL,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                request_timestamp=request_timestamp,
-                response_timestamp=response_timestamp,
-                duration_ms=int((response_timestamp - request_timestamp) * 1000),
-                cache_hit=False,
-                metadata={
-                    "error": "timeout",
-                    "tools": tools,
-                    "chat_history_length": len(chat_history) if chat_history else 0,
-                    "timeout_seconds": api_timeout
-                }
+                    raise DeadlineExceeded("Claude response") from None
+        except DeadlineExceeded:
+            if deadline is not None and deadline.expired:
+                raise
+            # The leader's deadline ran out, not this caller's: make its own call with the time left
+            logger.info(f"In-flight request {cache_key[:8]}... ran out of time, calling again")
+            return await _call_claude_uncached(
+                system_prompt, user_message, tools, chat_history, temperature, max_tokens,
+                cache_history, cache_key, request_timestamp, user_id, conversation_id, message_id, phase, component,
+                deadline, hedge, summary
             )
-            
-            return result
-        except aiohttp.ClientError as e:
-            logger.error(f"API connection error after {max_retries} retries: {e}")
-            result = {
-                "error": "connection_issues", 
-                "content": "I'm experiencing connectivity issues while trying to provide feedback on your educational content.\n\n**Your work is safely saved** and you have these options:\n\n1. **Try again** - Often connectivity issues resolve quickly\n2. **Wait a moment** - Sometimes the system just needs a minute to stabilize\n3. **Continue to next task** - Your responses are preserved and you can return for feedback later\n\nThis is a temporary technical issue and doesn't affect your learning progress.",
-                "retry_suggested": True
-            }
-            
-            # Calculate response time for logging
+        
+        if coalesced:
+            logger.info(f"Coalesced with in-flight request {cache_key[:8]}...")
             response_timestamp = time.time()
-            
-            # Log the connection error
+            # No tokens are recorded: the leader's interaction already accounts for them
             await log_llm_interaction(
                 user_id=user_id,
                 conversation_id=conversation_id,
@@ -517,49 +441,29 @@ Content_Quality: 2
                 component=component,
                 system_prompt=system_prompt,
                 user_message=user_message,
-                raw_llm_response=f"CONNECTION_ERROR: {str(e)}",
-                model_name=CLAUDE_MODEL,
+                raw_llm_response=result.get("content", ""),
+                processed_response=result.get("content", ""),
+                model_name=result.get("model", provider.model),
                 temperature=temperature,
                 max_tokens=max_tokens,
                 request_timestamp=request_timestamp,
                 response_timestamp=response_timestamp,
-                duration_ms=int((response_timestamp - request_timestamp) * 1000),
                 cache_hit=False,
+                coalesced=True,
                 metadata={
-                    "error": "connection",
-                    "error_details": str(e),
                     "tools": tools,
-                    "chat_history_length": len(chat_history) if chat_history else 0
+                    "cache_key": cache_key,
+                    "chat_history_length": len(chat_history) if chat_history else 0,
+                    "leader_error": result.get("error")
                 }
             )
-            
-            return result
         
-        # Record response timestamp
+        return result
+    
+    except DeadlineExceeded as e:
+        logger.warning(f"Claude call abandoned: {e}")
+        result = _deadline_exceeded_result(e)
         response_timestamp = time.time()
-        
-        # Extract content from response
-        content = ""
-        if response.content:
-            for block in response.content:
-                if block.type == "text":
-                    content += block.text
-        
-        # Create result object
-        result = {
-            "content": content,
-            "model": CLAUDE_MODEL,
-            "usage": {
-                "input_tokens": response.usage.input_tokens,
-                "output_tokens": response.usage.output_tokens
-            }
-        }
-        
-        # Add tool calls if present
-        if hasattr(response, "tool_calls") and response.tool_calls:
-            result["tool_calls"] = response.tool_calls
-        
-        # Log the successful interaction
         await log_llm_interaction(
             user_id=user_id,
             conversation_id=conversation_id,
@@ -568,41 +472,21 @@ Content_Quality: 2
             component=component,
             system_prompt=system_prompt,
             user_message=user_message,
-            raw_llm_response=content,
-            processed_response=content,
-            model_name=CLAUDE_MODEL,
+            raw_llm_response="DEADLINE_EXCEEDED",
+            model_name=provider.model,
             temperature=temperature,
             max_tokens=max_tokens,
-            input_tokens=response.usage.input_tokens,
-            output_tokens=response.usage.output_tokens,
             request_timestamp=request_timestamp,
             response_timestamp=response_timestamp,
             duration_ms=int((response_timestamp - request_timestamp) * 1000),
             cache_hit=False,
             metadata={
-                "has_tool_calls": hasattr(response, "tool_calls") and len(response.tool_calls) > 0,
-                "tools": tools,
+                "error": "deadline_exceeded",
+                "stage": e.stage,
+                "deadline_seconds": deadline.timeout_seconds if deadline else None,
                 "chat_history_length": len(chat_history) if chat_history else 0
             }
         )
-        
-        # Cache the result if caching is enabled
-        if use_cache and temperature <= 0.6:
-            # Add to cache with compression
-            response_cache[cache_key] = {
-                "response": result,
-                "timestamp": time.time()
-            }
-            
-            # Prune cache if necessary
-            if len(response_cache) > cache_size_limit:
-                # Remove oldest 10% of entries at once for efficiency
-                prune_count = max(1, int(cache_size_limit * 0.1))
-                oldest_keys = sorted(response_cache.keys(), 
-                                    key=lambda k: response_cache[k]["timestamp"])[:prune_count]
-                for key in oldest_keys:
-                    del response_cache[key]
-        
         return result
     
     except Exception as e:
@@ -622,7 +506,7 @@ Content_Quality: 2
             system_prompt=system_prompt,
             user_message=user_message,
             raw_llm_response=f"ERROR: {str(e)}",
-            model_name=CLAUDE_MODEL,
+            model_name=provider.model,
             temperature=temperature,
             max_tokens=max_tokens,
             request_timestamp=request_timestamp,
@@ -640,6 +524,430 @@ Content_Quality: 2
         
         return result
 
+async def _call_claude_uncached(
+    system_prompt: str,
+    user_message: str,
+    tools: Optional[List[Dict[str, Any]]],
+    chat_history: Optional[List[Dict[str, Any]]],
+    temperature: float,
+    max_tokens: int,
+    cache_history: Optional[bool],
+    cache_key: Optional[str],
+    request_timestamp: float,
+    user_id: Optional[str],
+    conversation_id: Optional[str],
+    message_id: Optional[str],
+    phase: Optional[str],
+    component: Optional[str],
+    deadline: Optional[Deadline] = None,
+    hedge: Optional[bool] = None,
+    summary: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Make the actual provider call for call_claude, log it and fill the cache
+
+    Raises DeadlineExceeded when the deadline runs out; call_claude turns it into a result.
+    """
+    # Prepare API call parameters - budgeted recent history plus prompt cache breakpoints
+    params = _build_request_params(
+        system_prompt, user_message, tools, chat_history, temperature, max_tokens, cache_history, phase, summary
+    )
+    
+    # Make API call with robust timeout handling for educational use
+    try:
+        logger.info(f"Calling {provider.name} with model={provider.model}, temperature={temperature}")
+
+        async def attempt():
+            # Queue for a slot in the adaptive concurrency window, then call with a timeout;
+            # both are bounded by whatever is left of the request deadline
+            try:
+                async with anthropic_limiter.slot(timeout=deadline.remaining() if deadline else None):
+                    timeout = _attempt_timeout(deadline)
+                    try:
+                        return await asyncio.wait_for(provider.complete(params, timeout), timeout=timeout)
+                    except Exception as e:
+                        _raise_if_deadline_cut(e, timeout, "Claude response")
+                        raise
+            except asyncio.TimeoutError:
+                if deadline is not None:
+                    deadline.check("Claude response")
+                raise
+
+        hedged = False
+
+        async def hedged_attempt():
+            nonlocal hedged
+            # Never hedge while calls are already queueing for the concurrency window
+            response, hedged = await anthropic_hedger.run(
+                f"{phase or 'unknown'}/{component or 'general'}", attempt,
+                can_hedge=lambda: anthropic_limiter.queue_depth == 0
+            )
+            return response
+
+        use_hedging = ENABLE_HEDGING if hedge is None else hedge
+
+        # Transient failures are retried with jittered backoff within the shared retry budget,
+        # and only while a retry could still finish before the deadline
+        response = await anthropic_retry.run(hedged_attempt if use_hedging else attempt, deadline)
+
+    except asyncio.TimeoutError:
+        logger.error(f"API call timed out after {ATTEMPT_TIMEOUT_SECONDS} seconds per attempt")
+        result = {
+            "error": "timeout_after_retries", 
+            "content": "I'm taking longer than usual to provide feedback on your response. This often happens with complex educational content that requires careful analysis.\n\n**Your work has been saved** and you can:\n\n1. **Try again** - Click the retry button to get your feedback\n2. **Continue anyway** - Your responses are saved and you can proceed to the next task\n3. **Simplify your response** - Consider making your answer more concise if you're comfortable doing so\n\nYour learning progress is not lost - the system is designed to handle these situations gracefully.",
+            "retry_suggested": True
+        }
+        
+        # Calculate response time for logging
+        response_timestamp = time.time()
+        
+        # Log the timed out interaction
+        await log_llm_interaction(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            message_id=message_id,
+            phase=phase,
+            component=component,
+            system_prompt=system_prompt,
+            user_message=user_message,
+            raw_llm_response="TIMEOUT",
+            model_name=provider.model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            request_timestamp=request_timestamp,
+            response_timestamp=response_timestamp,
+            duration_ms=int((response_timestamp - request_timestamp) * 1000),
+            cache_hit=False,
+            metadata={
+                "error": "timeout",
+                "tools": tools,
+                "chat_history_length": len(chat_history) if chat_history else 0,
+                "timeout_seconds": ATTEMPT_TIMEOUT_SECONDS
+            }
+        )
+        
+        return result
+    except (aiohttp.ClientError, APIConnectionError) as e:
+        logger.error(f"API connection error: {e}")
+        result = {
+            "error": "connection_issues", 
+            "content": "I'm experiencing connectivity issues while trying to provide feedback on your educational content.\n\n**Your work is safely saved** and you have these options:\n\n1. **Try again** - Often connectivity issues resolve quickly\n2. **Wait a moment** - Sometimes the system just needs a minute to stabilize\n3. **Continue to next task** - Your responses are preserved and you can return for feedback later\n\nThis is a temporary technical issue and doesn't affect your learning progress.",
+            "retry_suggested": True
+        }
+        
+        # Calculate response time for logging
+        response_timestamp = time.time()
+        
+        # Log the connection error
+        await log_llm_interaction(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            message_id=message_id,
+            phase=phase,
+            component=component,
+            system_prompt=system_prompt,
+            user_message=user_message,
+            raw_llm_response=f"CONNECTION_ERROR: {str(e)}",
+            model_name=provider.model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            request_timestamp=request_timestamp,
+            response_timestamp=response_timestamp,
+            duration_ms=int((response_timestamp - request_timestamp) * 1000),
+            cache_hit=False,
+            metadata={
+                "error": "connection",
+                "error_details": str(e),
+                "tools": tools,
+                "chat_history_length": len(chat_history) if chat_history else 0
+            }
+        )
+        
+        return result
+    
+    # Record response timestamp
+    response_timestamp = time.time()
+    
+    content = response["content"]
+    result = {
+        "content": content,
+        "model": provider.model,
+        "usage": response["usage"]
+    }
+    
+    # Add tool calls if present
+    if response.get("tool_calls"):
+        result["tool_calls"] = response["tool_calls"]
+
+    if hedged:
+        # The cancelled twin was billed for at most as much prompt as the winner (nothing if it
+        # was cancelled before the API processed it)
+        anthropic_hedger.extra_input_tokens_upper_bound += result["usage"]["input_tokens"]
+    
+    # Log the successful interaction
+    await log_llm_interaction(
+        user_id=user_id,
+        conversation_id=conversation_id,
+        message_id=message_id,
+        phase=phase,
+        component=component,
+        system_prompt=system_prompt,
+        user_message=user_message,
+        raw_llm_response=content,
+        processed_response=content,
+        model_name=provider.model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        input_tokens=result["usage"]["input_tokens"],
+        output_tokens=result["usage"]["output_tokens"],
+        cache_creation_input_tokens=result["usage"]["cache_creation_input_tokens"],
+        cache_read_input_tokens=result["usage"]["cache_read_input_tokens"],
+        request_timestamp=request_timestamp,
+        response_timestamp=response_timestamp,
+        duration_ms=int((response_timestamp - request_timestamp) * 1000),
+        cache_hit=False,
+        metadata={
+            "has_tool_calls": "tool_calls" in result,
+            "hedged": hedged,
+            "provider": provider.name,
+            "stop_reason": response.get("stop_reason"),
+            "tools": tools,
+            "chat_history_length": len(chat_history) if chat_history else 0
+        }
+    )
+    
+    # Cache the result if caching is enabled
+    if cache_key:
+        await tiered_cache.put(cache_key, result)
+    
+    return result
+
+async def stream_claude(
+    system_prompt: str,
+    user_message: str,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    chat_history: Optional[List[Dict[str, Any]]] = None,
+    temperature: float = 0.3,
+    max_tokens: int = 750,
+    use_cache: bool = True,
+    user_id: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    message_id: Optional[str] = None,
+    phase: Optional[str] = None,
+    component: Optional[str] = None,
+    cache_history: Optional[bool] = None,
+    deadline: Optional[Deadline] = None,
+    summary: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream Claude's response as it is generated
+
+    Yields ``{"type": "text", "text": ...}`` events for each text delta, followed by
+    exactly one ``{"type": "result", "result": ...}`` event carrying the same dictionary
+    that call_claude would have returned. Logging and caching run on the completed text
+    before the result event is yielded.
+
+    Only failures that happen before the first token are retried - once text has been
+    sent to the caller the stream cannot be restarted without duplicating output.
+    """
+    request_timestamp = time.time()
+    first_token_timestamp = None
+    content_parts: List[str] = []
+    cache_key = None
+    log_metadata = {
+        "streamed": True,
+        "tools": tools,
+        "chat_history_length": len(chat_history) if chat_history else 0
+    }
+
+    try:
+        if use_cache and temperature <= 0.6:
+            cache_key = create_cache_key(
+                system_prompt, user_message, tools, chat_history,
+                model=provider.model, temperature=temperature, max_tokens=max_tokens, phase=phase,
+                summary=summary
+            )
+            cached_result = await tiered_cache.get(cache_key)
+            coalesced = False
+            joined = inflight_requests.join(cache_key) if cached_result is None else None
+            if joined is not None:
+                # An identical call_claude request is already running - share its result
+                try:
+                    if deadline is None:
+                        cached_result = await joined
+                    else:
+                        try:
+                            cached_result = await asyncio.wait_for(joined, timeout=deadline.remaining())
+                        except asyncio.TimeoutError:
+                            raise DeadlineExceeded("Claude stream") from None
+                except DeadlineExceeded:
+                    if deadline is not None and deadline.expired:
+                        raise
+                    # The leader's deadline ran out, not this caller's: stream its own call below
+                    cached_result = None
+                coalesced = cached_result is not None
+            if cached_result is not None:
+                logger.info(f"Using {'in-flight' if coalesced else 'cached'} response for {cache_key[:8]}... (stream)")
+                result = cached_result
+                yield {"type": "text", "text": result.get("content", "")}
+
+                response_timestamp = time.time()
+                await log_llm_interaction(
+                    user_id=user_id,
+                    conversation_id=conversation_id,
+                    message_id=message_id,
+                    phase=phase,
+                    component=component,
+                    system_prompt=system_prompt,
+                    user_message=user_message,
+                    raw_llm_response=result.get("content", ""),
+                    processed_response=result.get("content", ""),
+                    model_name=result.get("model", provider.model),
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    input_tokens=0 if coalesced else result.get("usage", {}).get("input_tokens", 0),
+                    output_tokens=0 if coalesced else result.get("usage", {}).get("output_tokens", 0),
+                    request_timestamp=request_timestamp,
+                    response_timestamp=response_timestamp,
+                    cache_hit=not coalesced,
+                    coalesced=coalesced,
+                    metadata={**log_metadata, "cache_key": cache_key}
+                )
+                yield {"type": "result", "result": result}
+                return
+
+        params = _build_request_params(
+            system_prompt, user_message, tools, chat_history, temperature, max_tokens, cache_history, phase, summary
+        )
+
+        logger.info(f"Streaming {provider.name} with model={provider.model}, temperature={temperature}")
+
+        anthropic_retry.budget.record_request()
+        final_event: Dict[str, Any] = {"usage": extract_usage(None), "stop_reason": None}
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if deadline is not None:
+                    deadline.check("Claude stream")
+                # The slot is held for the whole stream: generation is what loads the provider.
+                # The request timeout bounds each read, i.e. the wait for the first token
+                async with anthropic_limiter.slot(timeout=deadline.remaining() if deadline else None):
+                    timeout = _attempt_timeout(deadline)
+                    try:
+                        async for event in provider.stream(params, timeout):
+                            if event["type"] != "text":
+                                final_event = event
+                                continue
+                            if first_token_timestamp is None:
+                                first_token_timestamp = time.time()
+                                logger.info(f"First token after {first_token_timestamp - request_timestamp:.2f}s")
+                            content_parts.append(event["text"])
+                            yield event
+                    except Exception as e:
+                        _raise_if_deadline_cut(e, timeout, "Claude stream")
+                        raise
+                break
+            except Exception as e:
+                # Once text has reached the caller a retry would duplicate output
+                wait_time = None if content_parts else anthropic_retry.next_delay(attempt, e, deadline)
+                if wait_time is None:
+                    raise
+                logger.warning(f"Stream open failed (attempt {attempt}/{anthropic_retry.max_attempts}): {e}, retrying in {wait_time:.1f}s")
+                await asyncio.sleep(wait_time)
+
+        response_timestamp = time.time()
+        content = "".join(content_parts)
+        result = {
+            "content": content,
+            "model": provider.model,
+            "usage": final_event["usage"]
+        }
+
+        await log_llm_interaction(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            message_id=message_id,
+            phase=phase,
+            component=component,
+            system_prompt=system_prompt,
+            user_message=user_message,
+            raw_llm_response=content,
+            processed_response=content,
+            model_name=provider.model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            input_tokens=result["usage"]["input_tokens"],
+            output_tokens=result["usage"]["output_tokens"],
+            cache_creation_input_tokens=result["usage"]["cache_creation_input_tokens"],
+            cache_read_input_tokens=result["usage"]["cache_read_input_tokens"],
+            request_timestamp=request_timestamp,
+            response_timestamp=response_timestamp,
+            cache_hit=False,
+            metadata={
+                **log_metadata,
+                "ttft_ms": int((first_token_timestamp - request_timestamp) * 1000) if first_token_timestamp else None,
+                "provider": provider.name,
+                "stop_reason": final_event.get("stop_reason")
+            }
+        )
+
+        if cache_key:
+            await tiered_cache.put(cache_key, result)
+
+        yield {"type": "result", "result": result}
+
+    except Exception as e:
+        logger.error(f"Error streaming from Claude: {e}")
+        partial = "".join(content_parts)
+        if isinstance(e, DeadlineExceeded) and not partial:
+            # Nobody is waiting for this response any more; report the deadline instead
+            result = _deadline_exceeded_result(e)
+        else:
+            fallback = "I'm having trouble processing your request right now."
+            if not partial:
+                # Nothing reached the student yet, so surface the fallback as the response text
+                yield {"type": "text", "text": fallback}
+            result = {"error": str(e), "content": partial or fallback, "retry_suggested": True}
+
+        response_timestamp = time.time()
+        await log_llm_interaction(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            message_id=message_id,
+            phase=phase,
+            component=component,
+            system_prompt=system_prompt,
+            user_message=user_message,
+            raw_llm_response=f"ERROR: {str(e)}" + (f"\nPARTIAL: {partial}" if partial else ""),
+            model_name=provider.model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            request_timestamp=request_timestamp,
+            response_timestamp=response_timestamp,
+            cache_hit=False,
+            metadata={
+                **log_metadata,
+                "error": "exception",
+                "error_details": str(e),
+                "partial_output_chars": len(partial),
+                "traceback": traceback.format_exc()
+            }
+        )
+        yield {"type": "result", "result": result}
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Runtime counters for the LLM layer, for capacity planning and dashboards"""
+    return {
+        "model": CLAUDE_MODEL,
+        "provider": provider.stats(),
+        "response_cache": tiered_cache.stats(),
+        "inflight_requests": inflight_requests.stats(),
+        "concurrency": anthropic_limiter.stats(),
+        "retries": anthropic_retry.stats(),
+        "hedging": {"enabled": ENABLE_HEDGING, **anthropic_hedger.stats()}
+    }
+
 def get_rubric_evaluation_tool(phase: str, component: str = "general") -> List[Dict[str, Any]]:
     """
     Create a tool for evaluating user responses against rubrics
@@ -0,0 +1,164 @@
+"""
+Incremental parser for the INSTRUCTOR_METADATA block in Claude responses
+
+Every phase prompt asks Claude to finish its feedback with a hidden block:
+
+    <!-- INSTRUCTOR_METADATA
+    Overall_Score: 3
+    Lowest_Category: MEDIUM
+    ...
+    -->
+
+The block is research data and must never reach the student. This parser consumes the
+response chunk by chunk (as it streams in) and returns only student-visible text, holding
+back any trailing characters that could still be the start of the marker. The key/value
+lines are parsed as they arrive, and the evaluation is published the moment the closing
+``-->`` is seen.
+"""
+
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("solbot.metadata_parser")
+
+METADATA_START = "<!-- INSTRUCTOR_METADATA"
+METADATA_END = "-->"
+
+_TEXT = 0
+_METADATA = 1
+
+
+def coerce_metadata_value(value: str) -> Any:
+    """Convert a metadata value to int or float where possible, otherwise keep the string"""
+    try:
+        if '.' in value:
+            return float(value)
+        return int(value)
+    except (ValueError, TypeError):
+        return value
+
+
+class InstructorMetadataParser:
+    """
+    State machine that strips INSTRUCTOR_METADATA from a response fed in chunks
+
+    Usage:
+        parser = InstructorMetadataParser(on_evaluation=callback)
+        for chunk in stream:
+            visible = parser.feed(chunk)   # safe to show the student
+        visible = parser.close()          # flush anything held back
+
+    Only the first metadata block populates ``evaluation``; later blocks are still
+    stripped from the visible text. A block that is never closed is dropped entirely
+    and leaves ``evaluation`` empty.
+    """
+
+    def __init__(self, on_evaluation: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.on_evaluation = on_evaluation
+        self.evaluation: Dict[str, Any] = {}
+        self.complete = False
+        self._state = _TEXT
+        self._pending = ""  # Held-back text that may be a partial start/end marker
+        self._line = ""     # Incomplete metadata line
+        self._fields: Dict[str, Any] = {}
+        self._closed = False
+
+    def feed(self, chunk: str) -> str:
+        """Consume the next chunk and return the student-visible text it released"""
+        if self._closed:
+            raise ValueError("Cannot feed a closed InstructorMetadataParser")
+        data = self._pending + chunk
+        self._pending = ""
+        visible: List[str] = []
+
+        while data:
+            if self._state == _TEXT:
+                start = data.find(METADATA_START)
+                if start == -1:
+                    hold = _partial_suffix(data, METADATA_START)
+                    visible.append(data[:len(data) - hold])
+                    self._pending = data[len(data) - hold:]
+                    break
+                visible.append(data[:start])
+                data = data[start + len(METADATA_START):]
+                self._state = _METADATA
+                self._fields = {}
+                self._line = ""
+            else:
+                end = data.find(METADATA_END)
+                if end == -1:
+                    hold = _partial_suffix(data, METADATA_END)
+                    self._consume_metadata(data[:len(data) - hold])
+                    self._pending = data[len(data) - hold:]
+                    break
+                self._consume_metadata(data[:end])
+                self._finish_block()
+                data = data[end + len(METADATA_END):]
+                self._state = _TEXT
+
+        return "".join(visible)
+
+    def close(self) -> str:
+        """Signal the end of the response and return any text still held back"""
+        if self._closed:
+            return ""
+        self._closed = True
+        remaining = self._pending
+        self._pending = ""
+        if self._state == _METADATA:
+            logger.warning("Response ended inside an unterminated INSTRUCTOR_METADATA block; dropping it")
+            return ""
+        return remaining
+
+    def _consume_metadata(self, text: str) -> None:
+        """Parse every complete line in ``text``; keep the trailing partial line buffered"""
+        if not text:
+            return
+        lines = (self._line + text).split('\n')
+        self._line = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+
+    def _parse_line(self, line: str) -> None:
+        if ':' not in line:
+            return
+        key, value = line.split(':', 1)
+        key = key.strip().lower().replace(" ", "_")
+        self._fields[key] = coerce_metadata_value(value.strip())
+
+    def _finish_block(self) -> None:
+        if self._line:
+            self._parse_line(self._line)
+            self._line = ""
+        if self.complete:
+            return
+        self.evaluation = self._fields
+        self.complete = True
+        if self.on_evaluation:
+            try:
+                self.on_evaluation(self.evaluation)
+            except Exception as e:
+                logger.error(f"Error in on_evaluation callback: {e}")
+
+
+def _partial_suffix(data: str, marker: str) -> int:
+    """Length of the longest suffix of ``data`` that is a proper prefix of ``marker``"""
+    first = marker[0]
+    idx = data.find(first, max(0, len(data) - len(marker) + 1))
+    while idx != -1:
+        if marker.startswith(data[idx:]):
+            return len(data) - idx
+        idx = data.find(first, idx + 1)
+    return 0
+
+
+def parse_llm_response(raw_content: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Split a complete response into the student-facing text and the evaluation metadata
+
+    Returns:
+        (cleaned_content, evaluation) where evaluation is empty if no block was found
+    """
+    parser = InstructorMetadataParser()
+    cleaned = parser.feed(raw_content) + parser.close()
+    return cleaned.strip(), parser.evaluation
@@ -0,0 +1,261 @@
+"""
+Durable local outbox for rows that could not be written to the database
+
+When Supabase is unreachable, rows that would otherwise be lost (LLM interaction logs,
+messages and assessments from the write-behind queue, user data) are appended to a local
+SQLite database in WAL mode. The outbox has a size cap so memory and disk stay bounded during
+a long outage, and a background replayer drains it to the database in batches, oldest first,
+once connectivity returns.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("solbot.outbox")
+
+DEFAULT_OUTBOX_PATH = os.getenv("OUTBOX_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "outbox.sqlite3"))
+DEFAULT_MAX_BYTES = int(os.getenv("OUTBOX_MAX_BYTES", str(100 * 1024 * 1024)))  # 100 MB of payload
+DEFAULT_REPLAY_INTERVAL = float(os.getenv("OUTBOX_REPLAY_INTERVAL", "15"))
+DEFAULT_REPLAY_BATCH = int(os.getenv("OUTBOX_REPLAY_BATCH", "200"))
+# Rows that keep failing (e.g. a constraint violation) are parked instead of blocking replay
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "50"))
+MAX_REPLAY_BACKOFF = 300.0
+
+Writer = Callable[[str, List[Dict[str, Any]]], Any]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target_table TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (dead, id);
+"""
+
+
+class Outbox:
+    """
+    Append-only SQLite outbox with a payload size cap
+
+    All methods are thread-safe: rows can be added from the event loop and from the worker
+    threads that run database writes. Once the cap is reached new rows are dropped (and
+    counted) rather than growing without bound.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_OUTBOX_PATH,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        table_order: Sequence[str] = ()
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.table_order = list(table_order)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._bytes = 0
+        self.added = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.dead = 0
+        self.replay_failures = 0
+
+    def add(self, table: str, row: Dict[str, Any]) -> bool:
+        return self.add_many(table, [row]) == 1
+
+    def add_many(self, table: str, rows: List[Dict[str, Any]]) -> int:
+        """Append rows for ``table``; returns how many were stored (the rest hit the size cap)"""
+        stored = 0
+        try:
+            with self._lock:
+                conn = self._connect()
+                now = time.time()
+                stamp = datetime.now(timezone.utc).isoformat()
+                with conn:
+                    for row in rows:
+                        # Replayed rows keep the time they were produced, not the time of the replay
+                        if row.get("created_at") is None:
+                            row = {**row, "created_at": stamp}
+                        payload = json.dumps(row, default=str)
+                        if self._bytes + len(payload) > self.max_bytes:
+                            self.dropped += 1
+                            continue
+                        conn.execute(
+                            "INSERT INTO outbox (target_table, payload, created_at) VALUES (?, ?, ?)",
+                            (table, payload, now)
+                        )
+                        self._bytes += len(payload)
+                        stored += 1
+            self.added += stored
+        except Exception as e:
+            logger.error(f"Could not write {len(rows)} {table} rows to the outbox: {e}")
+            return stored
+        if stored < len(rows):
+            logger.error(f"Outbox full ({self.max_bytes} bytes): dropped {len(rows) - stored} {table} rows")
+        else:
+            logger.warning(f"Stored {stored} {table} rows in the outbox for later replay")
+        return stored
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM outbox WHERE dead = 0").fetchone()[0]
+
+    async def replay_once(self, writer: Writer, batch_size: int = DEFAULT_REPLAY_BATCH) -> int:
+        """
+        Write one batch per table back to the database, parents first
+
+        A failed batch is split in halves until the rows that fail on their own are found, so
+        only those are counted towards OUTBOX_MAX_ATTEMPTS (and parked) while the rest of the
+        batch is written. A table whose rows all fail is left for the next pass and the other
+        tables are still replayed. Returns the number of rows replayed; raises the first error
+        if nothing could be written so the caller can back off.
+        """
+        replayed = 0
+        error: Optional[Exception] = None
+        for table, entries in await asyncio.to_thread(self._fetch, batch_size):
+            written, table_error = await self._replay_entries(writer, table, entries)
+            replayed += written
+            error = error or table_error
+        self.replayed += replayed
+        if error is not None and replayed == 0:
+            raise error
+        return replayed
+
+    async def _replay_entries(
+        self,
+        writer: Writer,
+        table: str,
+        entries: List[Tuple[int, Dict[str, Any]]]
+    ) -> Tuple[int, Optional[Exception]]:
+        # Bisect a failed batch: (written, first error). Stops after a couple of single rows fail
+        # with nothing written, which is what a database outage looks like, so an outage costs a
+        # few round trips per table instead of one per row
+        written = 0
+        failed_rows = 0
+        first_error: Optional[Exception] = None
+        pending = [entries]
+        while pending:
+            chunk = pending.pop()
+            rows = [row for _, row in chunk]
+            try:
+                if asyncio.iscoroutinefunction(writer):
+                    await writer(table, rows)
+                else:
+                    await asyncio.to_thread(writer, table, rows)
+            except Exception as e:
+                first_error = first_error or e
+                if len(chunk) > 1:
+                    middle = len(chunk) // 2
+                    # Popped from the end: the older half is retried first
+                    pending.extend((chunk[middle:], chunk[:middle]))
+                    continue
+                failed_rows += 1
+                logger.warning(f"Outbox {table} row {chunk[0][0]} failed to replay: {e}")
+                await asyncio.to_thread(self._record_failure, [chunk[0][0]])
+                if written == 0 and failed_rows >= 2:
+                    break
+                continue
+            await asyncio.to_thread(self._delete, [entry_id for entry_id, _ in chunk], sum(len(json.dumps(row, default=str)) for row in rows))
+            written += len(rows)
+        return written, first_error
+
+    async def run_replayer(
+        self,
+        writer: Writer,
+        interval: float = DEFAULT_REPLAY_INTERVAL,
+        batch_size: int = DEFAULT_REPLAY_BATCH
+    ) -> None:
+        """Drain the outbox whenever it has rows, backing off while the database is unreachable"""
+        logger.info(f"Outbox replayer started ({self.path}, interval={interval}s)")
+        delay = interval
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                # Keep going while full batches come back, so a backlog drains quickly
+                while await self.replay_once(writer, batch_size) >= batch_size:
+                    await asyncio.sleep(0)
+                delay = interval
+            except Exception as e:
+                self.replay_failures += 1
+                delay = min(MAX_REPLAY_BACKOFF, delay * 2)
+                logger.warning(f"Outbox replay failed, retrying in {delay:.0f}s: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            pending = self.pending()
+        except Exception:
+            pending = None
+        return {
+            "path": self.path,
+            "pending_rows": pending,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "added": self.added,
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+            "dead": self.dead,
+            "replay_failures": self.replay_failures
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened lazily so importing the module never touches the filesystem
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._bytes = conn.execute("SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM outbox WHERE dead = 0").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _fetch(self, batch_size: int) -> List[Tuple[str, List[Tuple[int, Dict[str, Any]]]]]:
+        with self._lock:
+            conn = self._connect()
+            tables = [r[0] for r in conn.execute("SELECT DISTINCT target_table FROM outbox WHERE dead = 0")]
+            ordered = [t for t in self.table_order if t in tables] + [t for t in tables if t not in self.table_order]
+            batches = []
+            for table in ordered:
+                entries = conn.execute(
+                    "SELECT id, payload FROM outbox WHERE dead = 0 AND target_table = ? ORDER BY id LIMIT ?",
+                    (table, batch_size)
+                ).fetchall()
+                batches.append((table, [(entry_id, json.loads(payload)) for entry_id, payload in entries]))
+            return batches
+
+    def _delete(self, ids: List[int], payload_bytes: int) -> None:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+            self._bytes = max(0, self._bytes - payload_bytes)
+
+    def _record_failure(self, ids: List[int]) -> None:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", [(i,) for i in ids])
+                parked = conn.execute(
+                    f"UPDATE outbox SET dead = 1 WHERE attempts >= ? AND dead = 0 AND id IN ({','.join('?' * len(ids))})",
+                    (DEFAULT_MAX_ATTEMPTS, *ids)
+                ).rowcount
+            if parked:
+                self.dead += parked
+                self._bytes = conn.execute("SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM outbox WHERE dead = 0").fetchone()[0]
+                logger.error(f"Parked {parked} outbox rows after {DEFAULT_MAX_ATTEMPTS} failed replays")
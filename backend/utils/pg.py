@@ -0,0 +1,323 @@
+"""
+Direct Postgres backend (asyncpg) for the hot database paths
+
+Selected with DB_BACKEND=postgres and a DATABASE_URL (for Supabase, the direct or session-mode
+pooler connection string). Compared to PostgREST over HTTP, every query is a round trip on a
+pooled connection:
+
+  - the hot queries are fixed SQL strings, so asyncpg prepares each once per connection and
+    reuses the plan from its statement cache
+  - jsonb columns are sent as native jsonb (binary codec), not pre-serialized strings
+  - write-behind batches are loaded with COPY; outbox replay uses a pipelined
+    INSERT ... ON CONFLICT DO NOTHING so rows that already made it in are skipped
+
+The schema is the one in database/migrations (001-013 applied).
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import asyncpg
+except ImportError:  # optional dependency, only needed for DB_BACKEND=postgres
+    asyncpg = None
+
+logger = logging.getLogger("solbot.pg")
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+DEFAULT_POOL_MIN = int(os.getenv("PG_POOL_MIN", "2"))
+DEFAULT_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+# Prepared statements cached per connection; must be 0 behind a transaction-mode pooler (PgBouncer)
+DEFAULT_STATEMENT_CACHE_SIZE = int(os.getenv("PG_STATEMENT_CACHE_SIZE", "100"))
+
+# Columns sent through the jsonb codec
+JSONB_COLUMNS = {
+    "users": {"profile_data"},
+    "sessions": {"metadata"},
+    "messages": {"metadata"},
+    "assessments": {"full_evaluation"},
+    "llm_interactions": {"metadata"},
+    "user_data": {"metadata"},
+    "events": {"metadata"},
+}
+
+# Timestamp columns that rows carry as ISO strings (the PostgREST format, and what the outbox
+# stores); asyncpg needs datetimes
+TIMESTAMP_COLUMNS = {
+    "messages": {"created_at"},
+    "assessments": {"created_at"},
+    "llm_interactions": {"created_at"},
+    "user_data": {"created_at"},
+    "events": {"client_ts", "created_at"},
+    "session_summaries": {"through_created_at", "updated_at"},
+}
+# ...and function parameters
+TIMESTAMP_PARAMS = {"p_created_at"}
+
+# --- Hot queries ---
+SELECT_SESSION = "SELECT id, user_id FROM sessions WHERE id = $1"
+SELECT_SESSION_SUMMARY = (
+    "SELECT summary, through_created_at, through_message_id, message_count "
+    "FROM session_summaries WHERE session_id = $1 AND phase = $2"
+)
+
+_pool = None
+_pool_lock: Optional[asyncio.Lock] = None
+
+# Counters
+_stats = {"queries": 0, "copies": 0, "rows_copied": 0, "rows_replayed": 0}
+
+
+def _encode_jsonb(value: Any) -> bytes:
+    # jsonb binary format: a version byte followed by the JSON text
+    return b"\x01" + json.dumps(value, default=str).encode("utf-8")
+
+def _decode_jsonb(data: bytes) -> Any:
+    return json.loads(data[1:].decode("utf-8"))
+
+async def _init_connection(conn) -> None:
+    # Binary, so the codec also applies to COPY (which always uses the binary format)
+    await conn.set_type_codec(
+        "jsonb", encoder=_encode_jsonb, decoder=_decode_jsonb, schema="pg_catalog", format="binary"
+    )
+
+async def init_pool(dsn: Optional[str] = None):
+    """Creates the connection pool (once); later calls return the existing pool."""
+    global _pool, _pool_lock
+    if _pool is not None:
+        return _pool
+    if asyncpg is None:
+        raise RuntimeError("DB_BACKEND=postgres requires the asyncpg package")
+    dsn = dsn or DATABASE_URL
+    if not dsn:
+        raise ValueError("DATABASE_URL not found in environment variables.")
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            logger.info(f"Creating Postgres pool (min={DEFAULT_POOL_MIN}, max={DEFAULT_POOL_MAX})")
+            _pool = await asyncpg.create_pool(
+                dsn,
+                min_size=DEFAULT_POOL_MIN,
+                max_size=DEFAULT_POOL_MAX,
+                statement_cache_size=DEFAULT_STATEMENT_CACHE_SIZE,
+                init=_init_connection,
+            )
+            logger.info("Postgres pool created successfully.")
+    return _pool
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+        logger.info("Postgres pool closed")
+
+# --- Reads ---
+
+async def fetch_session(session_id: str) -> Optional[Dict[str, Any]]:
+    pool = await init_pool()
+    _stats["queries"] += 1
+    row = await pool.fetchrow(SELECT_SESSION, session_id)
+    return _record(row) if row else None
+
+async def fetch_session_summary(session_id: str, phase: str) -> Optional[Dict[str, Any]]:
+    pool = await init_pool()
+    _stats["queries"] += 1
+    row = await pool.fetchrow(SELECT_SESSION_SUMMARY, session_id, phase)
+    return _record(row) if row else None
+
+async def fetch_recent_messages(session_id: str, limit: int, columns: Tuple[str, ...]) -> List[Dict[str, Any]]:
+    """The last `limit` user/assistant messages of a session, oldest first."""
+    pool = await init_pool()
+    _stats["queries"] += 1
+    rows = await pool.fetch(_recent_messages_sql(columns), session_id, limit)
+    return [_record(row) for row in rows]
+
+async def fetch_messages_page(
+    session_id: str,
+    limit: int,
+    columns: Tuple[str, ...],
+    after: Optional[Tuple[str, str]] = None,
+    descending: bool = False,
+    phase: Optional[str] = None,
+    component: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """One keyset page of a session's messages in (created_at, id) order."""
+    pool = await init_pool()
+    args: List[Any] = [session_id]
+    if phase is not None:
+        args.append(phase)
+    if component is not None:
+        args.append(component)
+    if after is not None:
+        args.extend([datetime.fromisoformat(after[0]), after[1]])
+    args.append(limit)
+    sql = _messages_page_sql(columns, after is not None, descending, phase is not None, component is not None)
+    _stats["queries"] += 1
+    rows = await pool.fetch(sql, *args)
+    return [_record(row) for row in rows]
+
+# --- Writes ---
+
+async def insert_row(table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    """Single-row INSERT ... RETURNING *; returns the stored record."""
+    pool = await init_pool()
+    columns = tuple(row)
+    _stats["queries"] += 1
+    stored = await pool.fetchrow(_insert_sql(table, columns, returning=True), *_values(table, columns, row))
+    return _record(stored)
+
+async def upsert_row(table: str, row: Dict[str, Any], conflict: Tuple[str, ...]) -> None:
+    """INSERT ... ON CONFLICT (conflict) DO UPDATE of the other columns."""
+    pool = await init_pool()
+    columns = tuple(row)
+    _stats["queries"] += 1
+    await pool.execute(_upsert_sql(table, columns, conflict), *_values(table, columns, row))
+
+async def copy_rows(table: str, rows: List[Dict[str, Any]]) -> None:
+    """Bulk load with COPY; used as the write-behind writer."""
+    pool = await init_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            for columns, group in _group_by_columns(rows):
+                await conn.copy_records_to_table(
+                    table,
+                    records=[_values(table, columns, row) for row in group],
+                    columns=list(columns),
+                )
+    _stats["copies"] += 1
+    _stats["rows_copied"] += len(rows)
+
+async def replay_rows(table: str, rows: List[Dict[str, Any]]) -> None:
+    """Idempotent bulk insert for outbox replay: rows whose id already exists are skipped."""
+    pool = await init_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            for columns, group in _group_by_columns(rows):
+                await conn.executemany(
+                    _insert_sql(table, columns, on_conflict_skip=True),
+                    [_values(table, columns, row) for row in group],
+                )
+    _stats["rows_replayed"] += len(rows)
+
+async def call_function(name: str, params: Dict[str, Any]) -> Any:
+    """Calls a database function with named arguments and returns its (jsonb-decoded) result."""
+    pool = await init_pool()
+    _stats["queries"] += 1
+    values = [_timestamp(value) if param in TIMESTAMP_PARAMS else value for param, value in params.items()]
+    return await pool.fetchval(_function_sql(name, tuple(params)), *values)
+
+def stats() -> Dict[str, Any]:
+    pool = {}
+    if _pool is not None:
+        pool = {
+            "size": _pool.get_size(),
+            "idle": _pool.get_idle_size(),
+            "min_size": _pool.get_min_size(),
+            "max_size": _pool.get_max_size(),
+        }
+    return {"pool": pool, "statement_cache_size": DEFAULT_STATEMENT_CACHE_SIZE, **_stats}
+
+# --- Helpers ---
+
+@functools.lru_cache(maxsize=128)
+def _insert_sql(table: str, columns: Tuple[str, ...], returning: bool = False, on_conflict_skip: bool = False) -> str:
+    # Column lists come from the row builders in db.py, never from request data; the SQL text
+    # is stable per (table, columns), so it is prepared once per connection
+    names = ", ".join(f'"{column}"' for column in columns)
+    placeholders = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+    sql = f'INSERT INTO "{table}" ({names}) VALUES ({placeholders})'
+    if on_conflict_skip:
+        sql += " ON CONFLICT DO NOTHING"
+    if returning:
+        sql += " RETURNING *"
+    return sql
+
+@functools.lru_cache(maxsize=16)
+def _upsert_sql(table: str, columns: Tuple[str, ...], conflict: Tuple[str, ...]) -> str:
+    updates = ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in columns if column not in conflict)
+    targets = ", ".join(f'"{column}"' for column in conflict)
+    return f"{_insert_sql(table, columns)} ON CONFLICT ({targets}) DO UPDATE SET {updates}"
+
+@functools.lru_cache(maxsize=16)
+def _recent_messages_sql(columns: Tuple[str, ...]) -> str:
+    names = ", ".join(f'"{column}"' for column in columns)
+    # Oldest first without reversing in Python: newest N in the subquery, re-sorted outside
+    return (
+        f"SELECT {names} FROM ("
+        f"SELECT {names}, created_at AS sort_key, id AS sort_id FROM messages "
+        f"WHERE session_id = $1 AND role IN ('user', 'assistant') ORDER BY created_at DESC, id DESC LIMIT $2"
+        f") recent ORDER BY sort_key, sort_id"
+    )
+
+@functools.lru_cache(maxsize=64)
+def _messages_page_sql(columns: Tuple[str, ...], keyset: bool, descending: bool, by_phase: bool, by_component: bool) -> str:
+    # One SQL text per query shape, so each shape is prepared once per connection
+    conditions = ["session_id = $1"]
+    n = 1
+    if by_phase:
+        n += 1
+        conditions.append(f"phase = ${n}")
+    if by_component:
+        n += 1
+        conditions.append(f"component = ${n}")
+    if keyset:
+        conditions.append(f"(created_at, id) {'<' if descending else '>'} (${n + 1}, ${n + 2})")
+        n += 2
+    direction = "DESC" if descending else "ASC"
+    names = ", ".join(f'"{column}"' for column in columns)
+    return (
+        f"SELECT {names} FROM messages WHERE {' AND '.join(conditions)} "
+        f"ORDER BY created_at {direction}, id {direction} LIMIT ${n + 1}"
+    )
+
+@functools.lru_cache(maxsize=32)
+def _function_sql(name: str, params: Tuple[str, ...]) -> str:
+    arguments = ", ".join(f"{param} => ${i}" for i, param in enumerate(params, start=1))
+    return f'SELECT "{name}"({arguments})'
+
+def _values(table: str, columns: Sequence[str], row: Dict[str, Any]) -> Tuple[Any, ...]:
+    jsonb = JSONB_COLUMNS.get(table, ())
+    timestamps = TIMESTAMP_COLUMNS.get(table, ())
+    return tuple(
+        _jsonb(row.get(column)) if column in jsonb
+        else _timestamp(row.get(column)) if column in timestamps
+        else row.get(column)
+        for column in columns
+    )
+
+def _jsonb(value: Any) -> Any:
+    # Rows built for PostgREST (and replayed from the outbox) carry JSON text; store the
+    # document itself, not a jsonb string
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+def _timestamp(value: Any) -> Any:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value
+
+def _group_by_columns(rows: List[Dict[str, Any]]) -> List[Tuple[Tuple[str, ...], List[Dict[str, Any]]]]:
+    # COPY needs one column list; rows that omit a column keep its database default
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(row)
+    return list(groups.items())
+
+def _record(row) -> Dict[str, Any]:
+    # Same shapes PostgREST returns: string ids and ISO timestamps
+    return {
+        key: str(value) if isinstance(value, uuid.UUID) else value.isoformat() if isinstance(value, datetime) else value
+        for key, value in row.items()
+    }
@@ -0,0 +1,373 @@
+"""
+LLM providers behind call_claude / stream_claude
+
+A provider turns assembled Messages API parameters into a response; everything around the
+call (caching, coalescing, the concurrency window, retries, hedging, deadlines, logging) stays
+in llm.py and applies to every provider alike.
+
+  - AnthropicProvider: the Anthropic API
+  - MockProvider: a local stand-in for load tests. Latency and output length are sampled
+    from lognormal distributions, or from a profile of recorded llm_interactions
+    (backend/benchmarks/export_llm_profile.py), and errors, timeouts and 429s are injected
+    at configurable rates. Injected errors carry ``status_code`` and ``headers`` like the SDK's,
+    so the retry policy and the adaptive limiter react to them as they would in production.
+
+Selected with LLM_PROVIDER (anthropic or mock); without an ANTHROPIC_API_KEY the mock is used,
+with zero latency unless MOCK_LLM_* settings say otherwise.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+try:
+    from anthropic import AsyncAnthropic
+except ImportError:  # only needed for LLM_PROVIDER=anthropic
+    AsyncAnthropic = None
+
+logger = logging.getLogger("solbot.providers")
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "").lower()
+
+
+def extract_usage(usage: Any) -> Dict[str, int]:
+    """Normalise an Anthropic usage object, including prompt cache token counts"""
+    return {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0
+    }
+
+
+class ProviderError(Exception):
+    """An error response from a provider, shaped like the Anthropic SDK's status errors"""
+
+    def __init__(self, message: str, status_code: int, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class LLMProvider:
+    """
+    Interface for LLM providers
+
+    ``complete`` returns ``{"content", "usage", "stop_reason"}`` (plus ``tool_calls`` when
+    present). ``stream`` yields ``{"type": "text", "text": ...}`` events followed by one
+    ``{"type": "final", "usage": ..., "stop_reason": ...}`` event. Both take the
+    messages.create parameters and a per-attempt timeout in seconds.
+    """
+
+    name = "base"
+    is_mock = False
+
+    def __init__(self, model: str):
+        self.model = model
+
+    async def complete(self, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def stream(self, params: Dict[str, Any], timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"provider": self.name, "model": self.model}
+
+
+class AnthropicProvider(LLMProvider):
+    """The Anthropic Messages API (SDK retries off: retries are handled by llm.anthropic_retry)"""
+
+    name = "anthropic"
+
+    def __init__(self, api_key: str, model: str, timeout: float = 90.0):
+        super().__init__(model)
+        if AsyncAnthropic is None:
+            raise RuntimeError("LLM_PROVIDER=anthropic requires the anthropic package")
+        self._client = AsyncAnthropic(api_key=api_key, timeout=timeout, max_retries=0)
+
+    async def complete(self, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        # The caller bounds the attempt with asyncio.wait_for(timeout)
+        response = await self._client.messages.create(**params)
+        content = "".join(block.text for block in (response.content or []) if block.type == "text")
+        result = {
+            "content": content,
+            "usage": extract_usage(response.usage),
+            "stop_reason": getattr(response, "stop_reason", None)
+        }
+        if getattr(response, "tool_calls", None):
+            result["tool_calls"] = response.tool_calls
+        return result
+
+    async def stream(self, params: Dict[str, Any], timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        async with self._client.messages.stream(**params, timeout=timeout) as response_stream:
+            async for text in response_stream.text_stream:
+                yield {"type": "text", "text": text}
+            final_message = await response_stream.get_final_message()
+        yield {
+            "type": "final",
+            "usage": extract_usage(final_message.usage),
+            "stop_reason": getattr(final_message, "stop_reason", None)
+        }
+
+
+# --- Mock provider ---
+
+MOCK_FILLER = (
+    "Thank you for sharing your response. You have identified the main parts of the task, "
+    "and the next step is to make your plan more specific. Think about when you will work on it, "
+    "which strategy fits this kind of material best, and how you will check your progress. "
+    "Consider what has worked for you in similar situations and what you would change. "
+)
+
+MOCK_METADATA = """
+
+<!-- INSTRUCTOR_METADATA
+Overall_Score: 2
+Scaffolding_Level: MEDIUM
+Task_Completion: 2
+Content_Quality: 2
+-->"""
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class LatencyProfile:
+    """
+    Distributions the mock samples from: time to first token, output tokens and the
+    generation rate. Either lognormal parameters or recorded samples (bootstrap: a recorded
+    interaction is drawn at random, keeping its latency and length together).
+    """
+
+    def __init__(
+        self,
+        ttft_median_ms: float = 0.0,
+        ttft_sigma: float = 0.0,
+        output_tokens_median: float = 300.0,
+        output_tokens_sigma: float = 0.0,
+        tokens_per_second: float = 0.0,
+        samples: Optional[List[Dict[str, float]]] = None
+    ):
+        self.ttft_median_ms = ttft_median_ms
+        self.ttft_sigma = ttft_sigma
+        self.output_tokens_median = output_tokens_median
+        self.output_tokens_sigma = output_tokens_sigma
+        self.tokens_per_second = tokens_per_second
+        self.samples = samples or []
+
+    @classmethod
+    def from_env(cls) -> "LatencyProfile":
+        path = os.getenv("MOCK_LLM_PROFILE")
+        if path:
+            return cls.from_file(path)
+        return cls(
+            ttft_median_ms=_env_float("MOCK_LLM_TTFT_MEDIAN_MS", 0.0),
+            ttft_sigma=_env_float("MOCK_LLM_TTFT_SIGMA", 0.5),
+            output_tokens_median=_env_float("MOCK_LLM_OUTPUT_TOKENS_MEDIAN", 300.0),
+            output_tokens_sigma=_env_float("MOCK_LLM_OUTPUT_TOKENS_SIGMA", 0.4),
+            tokens_per_second=_env_float("MOCK_LLM_TOKENS_PER_SECOND", 0.0)
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> "LatencyProfile":
+        """Load a profile written by export_llm_profile.py"""
+        with open(path) as f:
+            data = json.load(f)
+        return cls.from_interactions(data.get("samples", []))
+
+    @classmethod
+    def from_interactions(cls, rows: List[Dict[str, Any]]) -> "LatencyProfile":
+        """
+        A profile from recorded llm_interactions rows (duration_ms, output_tokens and, for
+        streamed calls, ttft_ms); rows without a duration are skipped.
+        """
+        samples = []
+        for row in rows:
+            duration_ms = row.get("duration_ms")
+            if not duration_ms or duration_ms <= 0:
+                continue
+            output_tokens = max(int(row.get("output_tokens") or 1), 1)
+            ttft_ms = row.get("ttft_ms")
+            if ttft_ms is None or ttft_ms > duration_ms:
+                # Unknown for non-streamed calls: assume a fixed share of the total
+                ttft_ms = duration_ms * 0.25
+            samples.append({"ttft_ms": float(ttft_ms), "duration_ms": float(duration_ms), "output_tokens": output_tokens})
+        if not samples:
+            raise ValueError("No usable llm_interactions samples in the profile")
+        return cls(samples=samples)
+
+    def sample(self, rng: random.Random, max_tokens: int) -> Dict[str, float]:
+        """One draw: ttft (seconds), output tokens and seconds per token after the first"""
+        if self.samples:
+            drawn = rng.choice(self.samples)
+            tokens = min(drawn["output_tokens"], max_tokens)
+            generation = max(drawn["duration_ms"] - drawn["ttft_ms"], 0.0) / 1000
+            return {
+                "ttft": drawn["ttft_ms"] / 1000,
+                "output_tokens": tokens,
+                "seconds_per_token": generation / max(drawn["output_tokens"], 1)
+            }
+        tokens = self.output_tokens_median * math.exp(rng.gauss(0, self.output_tokens_sigma)) if self.output_tokens_sigma else self.output_tokens_median
+        ttft_ms = self.ttft_median_ms * math.exp(rng.gauss(0, self.ttft_sigma)) if self.ttft_sigma else self.ttft_median_ms
+        return {
+            "ttft": ttft_ms / 1000,
+            "output_tokens": max(1, min(int(tokens), max_tokens)),
+            "seconds_per_token": 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        if self.samples:
+            return {"source": "recorded", "samples": len(self.samples)}
+        return {
+            "source": "lognormal",
+            "ttft_median_ms": self.ttft_median_ms,
+            "ttft_sigma": self.ttft_sigma,
+            "output_tokens_median": self.output_tokens_median,
+            "output_tokens_sigma": self.output_tokens_sigma,
+            "tokens_per_second": self.tokens_per_second
+        }
+
+
+class MockProvider(LLMProvider):
+    """
+    Local provider with realistic timing and failure injection
+
+    Each call first draws its fault: a 429 (with retry-after), a 529 overloaded error, a 500,
+    or a hang that only ends with the attempt timeout; otherwise it waits the sampled time to
+    first token and produces the sampled number of tokens at the sampled rate.
+    """
+
+    name = "mock"
+    is_mock = True
+    CHUNK_TOKENS = 4
+    CHARS_PER_TOKEN = 4
+
+    def __init__(
+        self,
+        model: str,
+        profile: Optional[LatencyProfile] = None,
+        error_rate: float = 0.0,
+        overloaded_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        retry_after_seconds: float = 1.0,
+        seed: Optional[int] = None
+    ):
+        super().__init__("MOCK_" + model)
+        self.profile = profile or LatencyProfile()
+        self.error_rate = error_rate
+        self.overloaded_rate = overloaded_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.retry_after_seconds = retry_after_seconds
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.injected: Dict[str, int] = {"rate_limited": 0, "overloaded": 0, "error": 0, "timeout": 0}
+
+    @classmethod
+    def from_env(cls, model: str) -> "MockProvider":
+        seed = os.getenv("MOCK_LLM_SEED")
+        return cls(
+            model,
+            profile=LatencyProfile.from_env(),
+            error_rate=_env_float("MOCK_LLM_ERROR_RATE", 0.0),
+            overloaded_rate=_env_float("MOCK_LLM_OVERLOADED_RATE", 0.0),
+            rate_limit_rate=_env_float("MOCK_LLM_RATE_LIMIT_RATE", 0.0),
+            timeout_rate=_env_float("MOCK_LLM_TIMEOUT_RATE", 0.0),
+            retry_after_seconds=_env_float("MOCK_LLM_RETRY_AFTER", 1.0),
+            seed=int(seed) if seed else None
+        )
+
+    async def complete(self, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        draw = await self._start(timeout, params)
+        content = self._content(params, draw["output_tokens"])
+        await asyncio.sleep(draw["ttft"] + draw["seconds_per_token"] * draw["output_tokens"])
+        return {"content": content, "usage": self._usage(params, content), "stop_reason": "end_turn"}
+
+    async def stream(self, params: Dict[str, Any], timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        draw = await self._start(timeout, params)
+        content = self._content(params, draw["output_tokens"])
+        await asyncio.sleep(draw["ttft"])
+        chunk_chars = self.CHUNK_TOKENS * self.CHARS_PER_TOKEN
+        for start in range(0, len(content), chunk_chars):
+            if start:
+                await asyncio.sleep(draw["seconds_per_token"] * self.CHUNK_TOKENS)
+            yield {"type": "text", "text": content[start:start + chunk_chars]}
+        yield {"type": "final", "usage": self._usage(params, content), "stop_reason": "end_turn"}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "calls": self.calls,
+            "injected": dict(self.injected),
+            "rates": {
+                "error": self.error_rate,
+                "overloaded": self.overloaded_rate,
+                "rate_limited": self.rate_limit_rate,
+                "timeout": self.timeout_rate
+            },
+            "profile": self.profile.describe()
+        }
+
+    async def _start(self, timeout: float, params: Dict[str, Any]) -> Dict[str, float]:
+        """Count the call, inject the drawn fault (if any) and return the timing draw"""
+        self.calls += 1
+        roll = self._rng.random()
+        for fault, rate in (
+            ("rate_limited", self.rate_limit_rate),
+            ("overloaded", self.overloaded_rate),
+            ("error", self.error_rate),
+            ("timeout", self.timeout_rate)
+        ):
+            if roll < rate:
+                self.injected[fault] += 1
+                await self._fail(fault, timeout)
+            roll -= rate
+        return self.profile.sample(self._rng, params.get("max_tokens") or 1024)
+
+    async def _fail(self, fault: str, timeout: float) -> None:
+        if fault == "rate_limited":
+            raise ProviderError(
+                "Mock rate limit", 429, {"retry-after": str(self.retry_after_seconds)}
+            )
+        if fault == "overloaded":
+            raise ProviderError("Mock overloaded", 529)
+        if fault == "error":
+            raise ProviderError("Mock internal error", 500)
+        # A hung request: nothing arrives until the attempt times out
+        await asyncio.sleep(timeout)
+        raise asyncio.TimeoutError()
+
+    def _content(self, params: Dict[str, Any], output_tokens: int) -> str:
+        chars = max(output_tokens * self.CHARS_PER_TOKEN - len(MOCK_METADATA), 0)
+        body = (MOCK_FILLER * (chars // len(MOCK_FILLER) + 1))[:chars].rstrip()
+        return body + MOCK_METADATA
+
+    def _usage(self, params: Dict[str, Any], content: str) -> Dict[str, int]:
+        system = params.get("system") or ""
+        system_chars = len(system) if isinstance(system, str) else sum(len(block.get("text", "")) for block in system)
+        message_chars = sum(len(json.dumps(message.get("content", ""))) for message in params.get("messages", []))
+        return {
+            "input_tokens": (system_chars + message_chars) // self.CHARS_PER_TOKEN,
+            "output_tokens": len(content) // self.CHARS_PER_TOKEN,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0
+        }
+
+
+def create_provider(model: str, api_key: Optional[str] = None, timeout: float = 90.0) -> LLMProvider:
+    """The provider selected by LLM_PROVIDER (default: anthropic when an API key is set, else mock)"""
+    name = LLM_PROVIDER or ("anthropic" if api_key else "mock")
+    if name == "anthropic":
+        if not api_key:
+            raise ValueError("LLM_PROVIDER=anthropic requires ANTHROPIC_API_KEY")
+        return AnthropicProvider(api_key, model, timeout=timeout)
+    if name == "mock":
+        return MockProvider.from_env(model)
+    raise ValueError(f"Unknown LLM_PROVIDER: {name}")
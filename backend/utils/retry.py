@@ -0,0 +1,215 @@
+"""
+Retry policy for outbound LLM calls
+
+Errors are classified before anything is retried: rate limits, overloads, 5xx responses,
+timeouts and connection failures are retryable; bad requests, auth failures and other 4xx
+responses are not, since repeating them only adds latency. Delays use full-jitter exponential
+backoff (``uniform(0, min(cap, base * 2**attempt))``) so a burst of failed requests does not
+retry in lockstep, and a server-supplied ``retry-after`` takes precedence.
+
+A process-wide retry budget (token bucket) caps retries at a fraction of request traffic, so
+during a provider outage retries cannot multiply the load we send.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from backend.utils.deadline import Deadline
+
+logger = logging.getLogger("solbot.retry")
+
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+DEFAULT_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+DEFAULT_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "10.0"))
+# Longest server-requested delay we are willing to wait; anything longer fails fast instead
+DEFAULT_MAX_RETRY_AFTER = float(os.getenv("LLM_RETRY_MAX_RETRY_AFTER", "20.0"))
+# Retries may add at most this fraction of request volume (plus a small floor)
+DEFAULT_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.1"))
+DEFAULT_BUDGET_MIN_PER_SECOND = float(os.getenv("LLM_RETRY_BUDGET_MIN_PER_SECOND", "1.0"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError", "APITimeoutError", "ConnectError", "ConnectTimeout",
+    "ReadTimeout", "ReadError", "RemoteProtocolError", "PoolTimeout"
+}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Classify an error as transient (worth retrying) or fatal
+
+    Errors are duck-typed on ``status_code`` and the class name, so SDK, httpx and aiohttp
+    errors (and test doubles raising the same shapes) are handled without importing them.
+    """
+    if isinstance(error, asyncio.CancelledError):
+        return False
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES or cls.__name__ == "ClientError"
+               for cls in type(error).__mro__)
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Server-requested delay from ``retry-after-ms`` / ``retry-after`` headers, if any"""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        if headers.get("retry-after") is not None:
+            # Only the delta-seconds form; an HTTP-date falls back to our own backoff
+            return max(0.0, float(headers["retry-after"]))
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class RetryBudget:
+    """
+    Token bucket shared by all requests in the process
+
+    Every first attempt deposits ``ratio`` tokens and every retry withdraws one, so retries
+    stay below ``ratio`` of traffic. ``min_per_second`` tokens trickle in regardless so that
+    low-traffic periods can still retry the occasional failure.
+    """
+
+    def __init__(
+        self,
+        ratio: float = DEFAULT_BUDGET_RATIO,
+        min_per_second: float = DEFAULT_BUDGET_MIN_PER_SECOND,
+        capacity: float = 100.0
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._tokens = min(capacity, 10.0)
+        self._updated = time.monotonic()
+        self.retries = 0
+        self.exhausted = 0
+
+    def record_request(self) -> None:
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill()
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            self.retries += 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "tokens": round(self._tokens, 2),
+            "ratio": self.ratio,
+            "retries": self.retries,
+            "exhausted": self.exhausted
+        }
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+
+class RetryPolicy:
+    """
+    Decide whether and when to retry a failed attempt
+
+    ``run`` drives a complete call; ``next_delay`` exposes the same decision for callers
+    that manage their own loop (e.g. streaming, which may only retry before the first token).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        max_retry_after: float = DEFAULT_MAX_RETRY_AFTER,
+        budget: Optional[RetryBudget] = None
+    ):
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.budget = budget or RetryBudget()
+        self.fatal = 0
+        self.gave_up = 0
+        self.deadline_stops = 0
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retry number ``attempt`` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def next_delay(self, attempt: int, error: BaseException, deadline: Optional[Deadline] = None) -> Optional[float]:
+        """
+        Seconds to wait before the next attempt, or None to give up
+
+        Args:
+            attempt: number of attempts made so far (1 after the first failure)
+            error: the exception raised by the last attempt
+            deadline: request deadline; no retry is scheduled that could not start before it
+        """
+        if not is_retryable(error):
+            self.fatal += 1
+            return None
+        if attempt >= self.max_attempts:
+            self.gave_up += 1
+            return None
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = self.backoff(attempt)
+        elif delay > self.max_retry_after:
+            logger.warning(f"{self.name}: server asked to retry after {delay:.1f}s, not waiting")
+            self.gave_up += 1
+            return None
+        if deadline is not None and delay >= deadline.remaining():
+            self.deadline_stops += 1
+            return None
+        if not self.budget.try_spend():
+            logger.warning(f"{self.name}: retry budget exhausted, not retrying {type(error).__name__}")
+            return None
+        return delay
+
+    async def run(self, attempt_fn: Callable[[], Awaitable[Any]], deadline: Optional[Deadline] = None) -> Any:
+        """Call ``attempt_fn`` until it succeeds or the policy gives up (re-raising the last error)"""
+        self.budget.record_request()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await attempt_fn()
+            except Exception as e:
+                delay = self.next_delay(attempt, e, deadline)
+                if delay is None:
+                    raise
+                logger.warning(
+                    f"{self.name}: attempt {attempt}/{self.max_attempts} failed "
+                    f"({type(e).__name__}: {e}), retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_attempts": self.max_attempts,
+            "fatal_errors": self.fatal,
+            "gave_up": self.gave_up,
+            "deadline_stops": self.deadline_stops,
+            "budget": self.budget.stats()
+        }
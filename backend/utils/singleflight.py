@@ -0,0 +1,76 @@
+"""
+Single-flight coalescing of identical concurrent async calls
+
+When a whole class submits the same template answer, or the Next.js proxy re-sends a slow
+request, several identical LLM calls can start before the first one has filled the response
+cache. SingleFlight lets the first caller (the leader) run the call while every caller that
+arrives with the same key before it finishes awaits the leader's result instead.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("solbot.singleflight")
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls by key
+
+    The shared call runs as its own task and every waiter (including the leader) awaits it
+    through ``asyncio.shield``, so cancelling one waiter - e.g. a client disconnect - never
+    cancels the call the others depend on. The key is released as soon as the call
+    finishes, so later callers go through the normal (cached) path.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run ``fn`` once per key at a time
+
+        Returns:
+            (result, coalesced) where coalesced is True if this caller waited on another
+            caller's in-flight call rather than starting its own
+        """
+        task = self._calls.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda finished: self._release(key, finished))
+        return await asyncio.shield(task), coalesced
+
+    def join(self, key: str) -> Optional[Awaitable[Any]]:
+        """
+        The in-flight call for ``key`` to await (shielded), or None if there is none
+
+        Looked up synchronously, so the call cannot finish and release the key between the
+        check and the join; on None the caller makes its own call.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            return None
+        self.coalesced += 1
+        return asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
+
+    def _release(self, key: str, finished: asyncio.Future) -> None:
+        if self._calls.get(key) is finished:
+            del self._calls[key]
+        if not finished.cancelled() and finished.exception() is not None:
+            # Retrieve the exception so an unawaited failure is not reported as never retrieved
+            logger.debug(f"Shared call {key[:8]}... failed: {finished.exception()}")
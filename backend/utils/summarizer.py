@@ -0,0 +1,241 @@
+"""
+Rolling conversation summaries
+
+Phase 4 and 5 sessions run dozens of revision turns. Instead of resending them all (or
+silently losing everything before the last few), a background worker folds a session's older
+turns in a phase into a compact running summary, stored in session_summaries (migration 012).
+Chat turns send the summary as an extra system block and only the recent turns in full.
+
+Updates are incremental and off the request path: after a turn is recorded the session is
+scheduled; a worker reads only the messages after the summary's watermark
+(through_created_at, through_message_id), and once enough have accumulated beyond the most
+recent ``keep_recent`` it asks Claude to fold them into the previous summary. A small pool of
+workers (SUMMARY_WORKERS) shares the queue, and a session is updated by one worker at a time.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from backend.utils import db, llm
+from backend.utils.cache import ResponseCache
+from backend.utils.conversation_cache import CONTEXT_ROLES
+from backend.utils.deadline import Deadline
+
+logger = logging.getLogger("solbot.summarizer")
+
+# Defaults, overridable from the environment; SUMMARY_PHASES="" disables summaries
+DEFAULT_PHASES = tuple(phase.strip() for phase in os.getenv("SUMMARY_PHASES", "4,5").split(",") if phase.strip())
+# Newest messages of the phase that are always sent in full, never summarized
+DEFAULT_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "6"))
+# Messages beyond the recent ones that must accumulate before the summary is updated
+DEFAULT_MIN_NEW_MESSAGES = int(os.getenv("SUMMARY_MIN_NEW_MESSAGES", "6"))
+DEFAULT_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+DEFAULT_CACHE_SESSIONS = int(os.getenv("SUMMARY_CACHE_SESSIONS", "5000"))
+DEFAULT_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", "1800"))
+# Bounds on one update: messages folded at once, and the text kept of each
+MAX_FOLD_MESSAGES = 100
+MAX_MESSAGE_CHARS = 2000
+MAX_PENDING = 10000
+# Concurrent summary updates (each is one LLM call)
+DEFAULT_WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))
+
+SUMMARY_PROMPT = """You maintain a running summary of a tutoring conversation between a student and SoL2LBot, an AI tutor for self-regulated learning.
+
+You are given the current summary (possibly empty) and the turns that happened after it. Return an updated summary that:
+- keeps what the student has produced so far (goals, plans, strategies, reflections) and how it changed between revisions
+- keeps the tutor's main feedback points and what the student still needs to improve
+- drops greetings, repetition and wording details
+- is written in the third person, as plain text, in at most 250 words
+
+Return only the summary."""
+
+_NO_SUMMARY: Dict[str, Any] = {}
+
+
+class ConversationSummarizer:
+    """
+    Background worker plus a read-through cache of the stored summaries
+
+    ``get`` is called on the request path (cache, else one database read); ``schedule`` is
+    called after a turn is recorded and never blocks; ``run`` is the background task that runs
+    the worker pool. An update whose session is already being updated by another worker waits
+    until that update has finished.
+    """
+
+    def __init__(
+        self,
+        phases: Tuple[str, ...] = DEFAULT_PHASES,
+        keep_recent: int = DEFAULT_KEEP_RECENT,
+        min_new_messages: int = DEFAULT_MIN_NEW_MESSAGES,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        cache_sessions: int = DEFAULT_CACHE_SESSIONS,
+        cache_ttl: float = DEFAULT_CACHE_TTL,
+        workers: int = DEFAULT_WORKERS
+    ):
+        self.phases = set(phases)
+        self.keep_recent = keep_recent
+        self.min_new_messages = max(min_new_messages, 1)
+        self.max_tokens = max_tokens
+        self.workers = max(workers, 1)
+        self._cache = ResponseCache(max_entries=cache_sessions, max_bytes=cache_sessions * 4096, ttl_seconds=cache_ttl)
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Set[Tuple[str, str]] = set()
+        # Sessions being updated, and updates of those sessions waiting for them
+        self._active: Set[str] = set()
+        self._deferred: Dict[str, List[Tuple[str, str]]] = {}
+        self.scheduled = 0
+        self.dropped = 0
+        self.updates = 0
+        self.failures = 0
+
+    def enabled_for(self, phase: Optional[str]) -> bool:
+        return phase is not None and str(phase) in self.phases
+
+    async def get(self, session_id: str, phase: Optional[str], deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """The stored summary of a session's phase, or None; failures count as no summary"""
+        if not self.enabled_for(phase):
+            return None
+        try:
+            return await self._load(session_id, phase, deadline) or None
+        except Exception as e:
+            logger.warning(f"Could not load summary for session {session_id}: {e}")
+            return None
+
+    def schedule(self, session_id: str, phase: Optional[str]) -> None:
+        """Queue a summary update for the session's phase (at most one pending per phase)"""
+        if not self.enabled_for(phase):
+            return
+        key = (session_id, str(phase))
+        if key in self._pending:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if len(self._pending) >= MAX_PENDING:
+            # The next turn of the session schedules it again
+            self.dropped += 1
+            return
+        self._pending.add(key)
+        self._queue.put_nowait(key)
+        self.scheduled += 1
+
+    async def run(self) -> None:
+        """Process scheduled updates with ``workers`` concurrent workers; run as a background task"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        logger.info(
+            f"Summarizer started (phases={sorted(self.phases)}, keep_recent={self.keep_recent}, workers={self.workers})"
+        )
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._queue.get()
+            session_id, phase = key
+            if session_id in self._active:
+                # Stays pending, so the session's next turns do not queue it again
+                self._deferred.setdefault(session_id, []).append(key)
+                continue
+            self._pending.discard(key)
+            self._active.add(session_id)
+            try:
+                if await self.update(session_id, phase):
+                    # A long backlog is folded in several steps
+                    self.schedule(session_id, phase)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Summary update failed for session {session_id}, phase {phase}: {e}")
+            finally:
+                self._active.discard(session_id)
+                for deferred in self._deferred.pop(session_id, ()):
+                    self._queue.put_nowait(deferred)
+
+    async def update(self, session_id: str, phase: str) -> bool:
+        """
+        Fold the turns after the watermark (except the most recent ones) into the summary
+
+        Returns True if more unsummarized turns remain beyond what this call folded.
+        """
+        if llm.provider.is_mock:
+            return False  # Mock responses would become the summary
+        stored = await self._load(session_id, phase)
+        after = (stored["through_created_at"], stored["through_message_id"]) if stored else None
+        limit = MAX_FOLD_MESSAGES + self.keep_recent
+        rows = await db.list_messages(session_id, limit=limit, after=after, phase=phase)
+        backlog = len(rows) == limit
+        turns = [row for row in rows if row.get("role") in CONTEXT_ROLES and row.get("content")]
+        # With a backlog the last rows are not the session's recent ones: fold them all
+        due = turns if backlog else turns[:max(len(turns) - self.keep_recent, 0)]
+        if len(due) < self.min_new_messages:
+            return False
+
+        summary = await self._summarize(stored.get("summary"), due, session_id, phase)
+        if not summary:
+            return False
+        last = due[-1]
+        record = {
+            "summary": summary,
+            "through_created_at": last["created_at"],
+            "through_message_id": last["id"],
+            "message_count": (stored.get("message_count") or 0) + len(due)
+        }
+        await db.save_session_summary(session_id, phase, **record)
+        self._cache.put(self._key(session_id, phase), record)
+        self.updates += 1
+        logger.info(f"Summary for session {session_id}, phase {phase} now covers {record['message_count']} messages")
+        return backlog
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "phases": sorted(self.phases),
+            "pending": len(self._pending),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "workers": self.workers,
+            "active": len(self._active),
+            "scheduled": self.scheduled,
+            "dropped": self.dropped,
+            "updates": self.updates,
+            "failures": self.failures,
+            "cache": self._cache.stats()
+        }
+
+    async def _load(self, session_id: str, phase: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        key = self._key(session_id, phase)
+        record = self._cache.get(key)
+        if record is None:
+            # Cache "no summary yet" too, so short sessions do not read the table every turn
+            record = await db.get_session_summary(session_id, phase, deadline=deadline) or _NO_SUMMARY
+            self._cache.put(key, record)
+        return record
+
+    async def _summarize(self, previous: Optional[str], turns: List[Dict[str, Any]], session_id: str, phase: str) -> Optional[str]:
+        transcript = "\n\n".join(
+            f"{'Student' if turn['role'] == 'user' else 'Tutor'}: {turn['content'][:MAX_MESSAGE_CHARS]}"
+            for turn in turns
+        )
+        result = await llm.call_claude(
+            system_prompt=SUMMARY_PROMPT,
+            user_message=f"Current summary:\n{previous or '(none yet)'}\n\nNew turns:\n{transcript}",
+            temperature=0.0, max_tokens=self.max_tokens, use_cache=False, cache_history=False,
+            conversation_id=session_id, phase=phase, component="conversation_summary"
+        )
+        if result.get("error"):
+            logger.warning(f"Summary call failed for session {session_id}: {result['error']}")
+            return None
+        return (result.get("content") or "").strip() or None
+
+    @staticmethod
+    def _key(session_id: str, phase: str) -> str:
+        return f"{session_id}:{phase}"
+
+
+def drop_summarized(history: List[Dict[str, Any]], summary: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The history without the messages the summary already covers (up to its last message)"""
+    if not summary:
+        return history
+    through_id = summary.get("through_message_id")
+    for index in range(len(history) - 1, -1, -1):
+        if history[index].get("id") == through_id:
+            return history[index + 1:]
+    return history
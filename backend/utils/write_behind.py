@@ -0,0 +1,189 @@
+"""
+Write-behind persistence for rows the request does not need to wait for
+
+Chat turns produce several inserts (messages, assessments, llm_interactions). Their ids are
+generated client-side, so a handler can continue as soon as a row is queued. The queue groups
+rows per table and flushes them as multi-row inserts when a batch fills up or the flush
+interval passes, whichever comes first. Tables are flushed in dependency order (messages
+before the assessments that reference them). When the queue is full, ``put`` waits - callers
+slow down instead of memory growing without bound.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger("solbot.write_behind")
+
+DEFAULT_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "5000"))
+DEFAULT_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.25"))
+
+Writer = Callable[[str, List[Dict[str, Any]]], Any]
+FailureHandler = Callable[[str, List[Dict[str, Any]], Exception], None]
+
+
+class WriteBehindQueue:
+    """
+    Bounded per-table buffer flushed by a background task
+
+    ``writer(table, rows)`` performs one multi-row insert. A synchronous writer (supabase-py)
+    runs in a worker thread so a flush never blocks the event loop; a coroutine function
+    (asyncpg COPY) is awaited directly. Flushes are serialized, so
+    rows reach the database in the order they were queued within each table.
+    """
+
+    def __init__(
+        self,
+        writer: Writer,
+        table_order: Sequence[str] = (),
+        max_rows: int = DEFAULT_MAX_ROWS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        on_failure: Optional[FailureHandler] = None
+    ):
+        self.writer = writer
+        self.table_order = list(table_order)
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_failure = on_failure
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._size = 0
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._has_space: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._closed = False
+        # Counters
+        self.queued = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.backpressure_waits = 0
+        self.max_size = 0
+        self.last_flush_ms = 0.0
+
+    def __len__(self) -> int:
+        return self._size
+
+    async def put(self, table: str, row: Dict[str, Any]) -> None:
+        """Queue a row for insertion, waiting while the queue is full"""
+        self._init_primitives()
+        if self._closed:
+            # Late writes during shutdown go straight to the database
+            await self._write(table, [row])
+            return
+        if self._size >= self.max_rows:
+            self.backpressure_waits += 1
+            self._batch_ready.set()
+            while self._size >= self.max_rows:
+                self._has_space.clear()
+                await self._has_space.wait()
+        rows = self._pending.setdefault(table, [])
+        rows.append(row)
+        self._size += 1
+        self.queued += 1
+        self.max_size = max(self.max_size, self._size)
+        if len(rows) >= self.batch_size:
+            self._batch_ready.set()
+
+    def is_pending(self, table: str, row_id: Any) -> bool:
+        """Whether a row with this id is still queued (or in a batch being written)"""
+        return any(row.get("id") == row_id for row in self._pending.get(table, ()))
+
+    async def run(self) -> None:
+        """Flush on a size or time trigger until cancelled; run as a background task"""
+        self._init_primitives()
+        logger.info(
+            f"Write-behind flusher started (batch={self.batch_size}, interval={self.flush_interval}s, max_rows={self.max_rows})"
+        )
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+
+    async def flush(self) -> int:
+        """Write everything queued so far; returns the number of rows written"""
+        self._init_primitives()
+        async with self._flush_lock:
+            started = time.monotonic()
+            written = 0
+            tables = self.table_order + [t for t in self._pending if t not in self.table_order]
+            # Only rows queued before the flush started: a message and its assessment queued
+            # mid-flush must not have the assessment written first
+            counts = {table: len(self._pending.get(table, ())) for table in tables}
+            for table in tables:
+                rows = self._pending.get(table)
+                remaining = counts[table]
+                # Rows stay queued until their batch has been attempted, so a flush interrupted
+                # by cancellation leaves nothing behind
+                while remaining:
+                    batch = rows[:min(self.batch_size, remaining)]
+                    await self._write(table, batch)
+                    del rows[:len(batch)]
+                    self._release(len(batch))
+                    remaining -= len(batch)
+                    written += len(batch)
+            if written:
+                self.last_flush_ms = round((time.monotonic() - started) * 1000, 1)
+            return written
+
+    async def close(self) -> None:
+        """Flush what is queued and write any later rows directly"""
+        self._closed = True
+        await self.flush()
+        logger.info(f"Write-behind queue closed ({self.written} rows written, {self.failed} failed)")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued_rows": self._size,
+            "max_rows": self.max_rows,
+            "max_queued_rows": self.max_size,
+            "rows_queued": self.queued,
+            "rows_written": self.written,
+            "rows_failed": self.failed,
+            "batches": self.batches,
+            "backpressure_waits": self.backpressure_waits,
+            "last_flush_ms": self.last_flush_ms
+        }
+
+    async def _write(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        """Insert one batch; failures are handed to ``on_failure`` and never raised"""
+        try:
+            if asyncio.iscoroutinefunction(self.writer):
+                await self.writer(table, rows)
+            else:
+                await asyncio.to_thread(self.writer, table, rows)
+            self.written += len(rows)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"Write-behind insert of {len(rows)} {table} rows failed: {e}")
+            if self.on_failure:
+                await asyncio.to_thread(self._handle_failure, table, rows, e)
+
+    def _handle_failure(self, table: str, rows: List[Dict[str, Any]], error: Exception) -> None:
+        try:
+            self.on_failure(table, rows, error)
+        except Exception as handler_error:
+            logger.error(f"Write-behind failure handler error: {handler_error}")
+
+    def _release(self, count: int) -> None:
+        self._size -= count
+        if self._size < self.max_rows:
+            self._has_space.set()
+
+    def _init_primitives(self) -> None:
+        # Created lazily so the queue can be constructed at import time, outside the event loop
+        if self._batch_ready is None:
+            self._batch_ready = asyncio.Event()
+            self._has_space = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
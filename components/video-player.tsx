@@ -1,6 +1,7 @@
 "use client";
 
 import { useRef, useEffect, useCallback, useState } from 'react';
+import { queueEvent } from '@/lib/event-buffer';
 
 interface VideoPlayerProps {
   src: string;
@@ -41,29 +42,21 @@ export default function VideoPlayer({
     }
   }, []);
 
-  // Log analytics event to Supabase
-  const logAnalyticsEvent = useCallback(async (eventType: string, metadata: any = {}) => {
+  // Log analytics event to Supabase (buffered: play/pause/seek events are sent in batches)
+  const logAnalyticsEvent = useCallback((eventType: string, metadata: any = {}) => {
     if (!sessionId) return;
 
-    try {
-      await fetch('/api/events', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          session_id: sessionId,
-          event_type: eventType,
-          phase: phase,
-          component: 'video_player',
-          metadata: {
-            video_title: videoTitle,
-            video_src: src,
-            ...metadata
-          }
-        })
-      });
-    } catch (error) {
-      console.error(`Failed to log ${eventType} event:`, error);
-    }
+    queueEvent({
+      session_id: sessionId,
+      event_type: eventType,
+      phase: phase,
+      component: 'video_player',
+      metadata: {
+        video_title: videoTitle,
+        video_src: src,
+        ...metadata
+      }
+    });
   }, [sessionId, phase, videoTitle, src]);
 
   const handleLoadedMetadata = useCallback(() => {
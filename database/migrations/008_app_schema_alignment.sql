@@ -0,0 +1,69 @@
+-- SoLBot App Schema Alignment
+-- Migration: 008_app_schema_alignment
+
+-- Brings the migrated schema in line with the tables and columns the backend reads and writes
+-- (backend/utils/db.py, backend/utils/llm.py), so a local Postgres with 001-008 applied can be
+-- used with DB_BACKEND=postgres.
+
+-- Users: onboarding stores a name and the profile collected in the intro phase
+ALTER TABLE users
+  ADD COLUMN IF NOT EXISTS name TEXT,
+  ADD COLUMN IF NOT EXISTS profile_data JSONB;
+
+-- Chat sessions (one per onboarding)
+CREATE TABLE IF NOT EXISTS sessions (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+  metadata JSONB,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+
+-- Messages are keyed by session and role rather than conversation and sender_type
+ALTER TABLE messages
+  ADD COLUMN IF NOT EXISTS session_id UUID REFERENCES sessions(id) ON DELETE CASCADE,
+  ADD COLUMN IF NOT EXISTS role TEXT,
+  ADD COLUMN IF NOT EXISTS phase TEXT,
+  ADD COLUMN IF NOT EXISTS component TEXT,
+  ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+ALTER TABLE messages ALTER COLUMN sender_type DROP NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id);
+
+-- set_default_jsonb() (003) reads TG_COLUMN_NAME, which does not exist in PL/pgSQL, so every
+-- message insert failed; use a column default instead
+DROP TRIGGER IF EXISTS set_default_message_metadata ON messages;
+ALTER TABLE messages ALTER COLUMN metadata SET DEFAULT '{}'::jsonb;
+
+-- Assessments: one row per evaluated submission, with the full LLM evaluation for research
+ALTER TABLE assessments
+  ADD COLUMN IF NOT EXISTS session_id UUID REFERENCES sessions(id) ON DELETE CASCADE,
+  ADD COLUMN IF NOT EXISTS user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+  ADD COLUMN IF NOT EXISTS submission_message_id UUID REFERENCES messages(id) ON DELETE SET NULL,
+  ADD COLUMN IF NOT EXISTS feedback_message_id UUID REFERENCES messages(id) ON DELETE SET NULL,
+  ADD COLUMN IF NOT EXISTS phase TEXT,
+  ADD COLUMN IF NOT EXISTS component TEXT,
+  ADD COLUMN IF NOT EXISTS attempt_number INTEGER,
+  ADD COLUMN IF NOT EXISTS overall_score NUMERIC,
+  ADD COLUMN IF NOT EXISTS lowest_category TEXT,
+  ADD COLUMN IF NOT EXISTS scaffolding_level INTEGER,
+  ADD COLUMN IF NOT EXISTS rationale TEXT,
+  ADD COLUMN IF NOT EXISTS full_evaluation JSONB,
+  ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+ALTER TABLE assessments ALTER COLUMN score DROP NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_assessments_session_id ON assessments(session_id);
+
+-- LLM interaction logs use the Anthropic field names
+ALTER TABLE llm_interactions
+  ADD COLUMN IF NOT EXISTS model_name TEXT,
+  ADD COLUMN IF NOT EXISTS input_tokens INTEGER,
+  ADD COLUMN IF NOT EXISTS output_tokens INTEGER;
+
+ALTER TABLE llm_interactions ALTER COLUMN model DROP NOT NULL;
+
+-- Refresh the PostgREST schema cache
+SELECT pg_notify('pgrst', 'reload schema');
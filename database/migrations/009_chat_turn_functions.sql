@@ -0,0 +1,90 @@
+-- SoLBot Chat Turn Functions
+-- Migration: 009_chat_turn_functions
+
+-- A chat turn is two calls: begin_chat_turn before the LLM call and complete_chat_turn after
+-- it. Each runs in a single transaction and a single round trip (PostgREST RPC or asyncpg).
+
+-- Inserts the student's message and returns, as one JSON object:
+--   message  - the stored message row
+--   history  - the last p_history_limit user/assistant messages before it, oldest first
+--              (id, role, content, phase, component only - not the metadata)
+--   user_id  - the session's user (NULL if the session does not exist)
+CREATE OR REPLACE FUNCTION begin_chat_turn(
+  p_session_id UUID,
+  p_message_id UUID,
+  p_content TEXT,
+  p_phase TEXT DEFAULT NULL,
+  p_component TEXT DEFAULT NULL,
+  p_metadata JSONB DEFAULT NULL,
+  p_history_limit INTEGER DEFAULT 10
+) RETURNS JSONB AS $$
+DECLARE
+  v_user_id UUID;
+  v_history JSONB;
+  v_message JSONB;
+BEGIN
+  SELECT user_id INTO v_user_id
+  FROM sessions
+  WHERE id = p_session_id;
+
+  -- Read before the insert, so the history never contains the message being answered
+  SELECT COALESCE(jsonb_agg(jsonb_build_object(
+    'id', recent.id, 'role', recent.role, 'content', recent.content,
+    'phase', recent.phase, 'component', recent.component
+  ) ORDER BY recent.created_at), '[]'::jsonb)
+  INTO v_history
+  FROM (
+    SELECT id, role, content, phase, component, created_at
+    FROM messages
+    WHERE session_id = p_session_id AND role IN ('user', 'assistant')
+    ORDER BY created_at DESC
+    LIMIT p_history_limit
+  ) recent;
+
+  INSERT INTO messages (id, session_id, role, content, phase, component, metadata)
+  VALUES (p_message_id, p_session_id, 'user', p_content, p_phase, p_component, p_metadata)
+  RETURNING to_jsonb(messages.*) INTO v_message;
+
+  RETURN jsonb_build_object('message', v_message, 'history', v_history, 'user_id', v_user_id);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Inserts the assistant's reply and, for submissions, the assessment that references both
+-- messages. p_assessment holds the assessment columns (id, user_id, submission_message_id,
+-- attempt_number, overall_score, lowest_category, scaffolding_level, rationale,
+-- full_evaluation); session, phase, component and feedback message come from the reply.
+-- Returns the stored assistant message row.
+CREATE OR REPLACE FUNCTION complete_chat_turn(
+  p_session_id UUID,
+  p_message_id UUID,
+  p_content TEXT,
+  p_phase TEXT DEFAULT NULL,
+  p_component TEXT DEFAULT NULL,
+  p_metadata JSONB DEFAULT NULL,
+  p_assessment JSONB DEFAULT NULL
+) RETURNS JSONB AS $$
+DECLARE
+  v_message JSONB;
+BEGIN
+  INSERT INTO messages (id, session_id, role, content, phase, component, metadata)
+  VALUES (p_message_id, p_session_id, 'assistant', p_content, p_phase, p_component, p_metadata)
+  RETURNING to_jsonb(messages.*) INTO v_message;
+
+  IF p_assessment IS NOT NULL THEN
+    INSERT INTO assessments (
+      id, session_id, user_id, submission_message_id, feedback_message_id, phase, component,
+      attempt_number, overall_score, lowest_category, scaffolding_level, rationale, full_evaluation
+    )
+    SELECT
+      COALESCE(a.id, uuid_generate_v4()), p_session_id, a.user_id, a.submission_message_id, p_message_id,
+      p_phase, p_component, a.attempt_number, a.overall_score, a.lowest_category,
+      a.scaffolding_level, a.rationale, a.full_evaluation
+    FROM jsonb_populate_record(NULL::assessments, p_assessment) a;
+  END IF;
+
+  RETURN v_message;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Refresh the PostgREST schema cache
+SELECT pg_notify('pgrst', 'reload schema');
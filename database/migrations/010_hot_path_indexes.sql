@@ -0,0 +1,41 @@
+-- SoLBot Hot Path Indexes
+-- Migration: 010_hot_path_indexes
+
+-- Composite indexes matching the queries the backend runs on every request. Each one serves
+-- its filter and its ORDER BY, so the newest N rows come straight off the index with no sort
+-- (ascending keys: "newest first" is a backward scan, and row comparisons such as
+-- (created_at, id) > (...) stay usable as index conditions).
+-- Checked by backend/benchmarks/query_plan_check.py.
+--
+-- On a large live table, run each CREATE INDEX with CONCURRENTLY instead (outside a
+-- transaction) to avoid blocking writes while it builds.
+
+-- Chat history: last N messages of a session (plus the user/assistant role filter of
+-- begin_chat_turn) and keyset pages on (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_messages_session_created
+  ON messages (session_id, created_at, id)
+  INCLUDE (role);
+
+-- Transcript pages filtered by phase and component
+CREATE INDEX IF NOT EXISTS idx_messages_session_phase_component
+  ON messages (session_id, phase, component, created_at, id);
+
+-- Assessment history of a session for one phase/component (attempt tracking, research)
+CREATE INDEX IF NOT EXISTS idx_assessments_session_phase_component
+  ON assessments (session_id, phase, component, created_at);
+
+-- User data by user, optionally by type, newest first
+CREATE INDEX IF NOT EXISTS idx_user_data_user_created
+  ON user_data (user_id, created_at);
+
+CREATE INDEX IF NOT EXISTS idx_user_data_user_type_created
+  ON user_data (user_id, data_type, created_at);
+
+-- Single-column indexes made redundant by the composites above (they are their prefixes)
+DROP INDEX IF EXISTS idx_messages_session_id;
+DROP INDEX IF EXISTS idx_assessments_session_id;
+DROP INDEX IF EXISTS idx_user_data_user_id;
+
+ANALYZE messages;
+ANALYZE assessments;
+ANALYZE user_data;
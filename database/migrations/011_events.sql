@@ -0,0 +1,51 @@
+-- SoLBot UI Events
+-- Migration: 011_events
+
+-- UI events (video plays, knowledge checks, phase completion...) get their own append-only
+-- table instead of being stored as role = 'system' rows in messages, where they made the
+-- chat history reads scan and skip them.
+
+CREATE TABLE IF NOT EXISTS events (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  -- No foreign key: events are bulk-loaded in batches, and one event with a stale session id
+  -- must not reject the whole batch
+  session_id UUID NOT NULL,
+  event_type TEXT NOT NULL,
+  phase TEXT,
+  component TEXT,
+  metadata JSONB,
+  -- When the event happened on the client (events are buffered before they are sent)
+  client_ts TIMESTAMP WITH TIME ZONE,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Events of a session in order, and of one type across sessions (research exports)
+CREATE INDEX IF NOT EXISTS idx_events_session_created ON events (session_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_events_type_created ON events (event_type, created_at);
+
+-- Append-only: rows are never updated (DELETE stays allowed for data retention)
+CREATE OR REPLACE FUNCTION reject_event_update()
+RETURNS TRIGGER AS $$
+BEGIN
+  RAISE EXCEPTION 'events is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS events_append_only ON events;
+CREATE TRIGGER events_append_only
+  BEFORE UPDATE ON events
+  FOR EACH ROW EXECUTE FUNCTION reject_event_update();
+
+-- Move the events logged so far out of messages
+INSERT INTO events (session_id, event_type, phase, component, metadata, created_at)
+SELECT session_id, content, phase, component, metadata, created_at
+FROM messages
+WHERE role = 'system' AND session_id IS NOT NULL;
+
+DELETE FROM messages WHERE role = 'system';
+
+ANALYZE events;
+ANALYZE messages;
+
+-- Refresh the PostgREST schema cache
+SELECT pg_notify('pgrst', 'reload schema');
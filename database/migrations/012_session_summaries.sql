@@ -0,0 +1,20 @@
+-- SoLBot Session Summaries
+-- Migration: 012_session_summaries
+
+-- Running summary of a session's older turns in one phase, written by the background
+-- summarizer (backend/utils/summarizer.py) and sent to the model in place of those turns.
+-- through_created_at/through_message_id mark the last message folded into the summary, so
+-- each update only reads the turns after it.
+CREATE TABLE IF NOT EXISTS session_summaries (
+  session_id UUID NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+  phase TEXT NOT NULL DEFAULT '',
+  summary TEXT NOT NULL,
+  through_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  through_message_id UUID NOT NULL,
+  message_count INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (session_id, phase)
+);
+
+-- Refresh the PostgREST schema cache
+SELECT pg_notify('pgrst', 'reload schema');
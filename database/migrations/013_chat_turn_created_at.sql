@@ -0,0 +1,91 @@
+-- SoLBot Chat Turn Timestamps
+-- Migration: 013_chat_turn_created_at
+
+-- Rows are stamped by the backend when they are built (backend/utils/db.py), so messages
+-- written by a later write-behind flush or outbox replay keep the time they happened and
+-- history ordered by created_at stays in conversation order. The chat turn functions take
+-- that timestamp too (p_created_at, NOW() when omitted), so a turn recorded partly through
+-- the functions and partly through the queue uses one clock. The assessment takes its
+-- created_at from p_assessment.
+
+-- The old signatures would make calls without p_created_at ambiguous
+DROP FUNCTION IF EXISTS begin_chat_turn(UUID, UUID, TEXT, TEXT, TEXT, JSONB, INTEGER);
+DROP FUNCTION IF EXISTS complete_chat_turn(UUID, UUID, TEXT, TEXT, TEXT, JSONB, JSONB);
+
+CREATE OR REPLACE FUNCTION begin_chat_turn(
+  p_session_id UUID,
+  p_message_id UUID,
+  p_content TEXT,
+  p_phase TEXT DEFAULT NULL,
+  p_component TEXT DEFAULT NULL,
+  p_metadata JSONB DEFAULT NULL,
+  p_history_limit INTEGER DEFAULT 10,
+  p_created_at TIMESTAMP WITH TIME ZONE DEFAULT NULL
+) RETURNS JSONB AS $$
+DECLARE
+  v_user_id UUID;
+  v_history JSONB;
+  v_message JSONB;
+BEGIN
+  SELECT user_id INTO v_user_id
+  FROM sessions
+  WHERE id = p_session_id;
+
+  -- Read before the insert, so the history never contains the message being answered
+  SELECT COALESCE(jsonb_agg(jsonb_build_object(
+    'id', recent.id, 'role', recent.role, 'content', recent.content,
+    'phase', recent.phase, 'component', recent.component
+  ) ORDER BY recent.created_at, recent.id), '[]'::jsonb)
+  INTO v_history
+  FROM (
+    SELECT id, role, content, phase, component, created_at
+    FROM messages
+    WHERE session_id = p_session_id AND role IN ('user', 'assistant')
+    ORDER BY created_at DESC, id DESC
+    LIMIT p_history_limit
+  ) recent;
+
+  INSERT INTO messages (id, session_id, role, content, phase, component, metadata, created_at)
+  VALUES (p_message_id, p_session_id, 'user', p_content, p_phase, p_component, p_metadata, COALESCE(p_created_at, NOW()))
+  RETURNING to_jsonb(messages.*) INTO v_message;
+
+  RETURN jsonb_build_object('message', v_message, 'history', v_history, 'user_id', v_user_id);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION complete_chat_turn(
+  p_session_id UUID,
+  p_message_id UUID,
+  p_content TEXT,
+  p_phase TEXT DEFAULT NULL,
+  p_component TEXT DEFAULT NULL,
+  p_metadata JSONB DEFAULT NULL,
+  p_assessment JSONB DEFAULT NULL,
+  p_created_at TIMESTAMP WITH TIME ZONE DEFAULT NULL
+) RETURNS JSONB AS $$
+DECLARE
+  v_message JSONB;
+BEGIN
+  INSERT INTO messages (id, session_id, role, content, phase, component, metadata, created_at)
+  VALUES (p_message_id, p_session_id, 'assistant', p_content, p_phase, p_component, p_metadata, COALESCE(p_created_at, NOW()))
+  RETURNING to_jsonb(messages.*) INTO v_message;
+
+  IF p_assessment IS NOT NULL THEN
+    INSERT INTO assessments (
+      id, session_id, user_id, submission_message_id, feedback_message_id, phase, component,
+      attempt_number, overall_score, lowest_category, scaffolding_level, rationale, full_evaluation,
+      created_at
+    )
+    SELECT
+      COALESCE(a.id, uuid_generate_v4()), p_session_id, a.user_id, a.submission_message_id, p_message_id,
+      p_phase, p_component, a.attempt_number, a.overall_score, a.lowest_category,
+      a.scaffolding_level, a.rationale, a.full_evaluation, COALESCE(a.created_at, NOW())
+    FROM jsonb_populate_record(NULL::assessments, p_assessment) a;
+  END IF;
+
+  RETURN v_message;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Refresh the PostgREST schema cache
+SELECT pg_notify('pgrst', 'reload schema');
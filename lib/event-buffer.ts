@@ -0,0 +1,76 @@
+/**
+ * Event Buffer - Batches fire-and-forget UI events into one /api/events request
+ * Flushes when the buffer is full, after a short delay, and when the page is hidden or
+ * unloaded (with sendBeacon, so the last events are not lost on navigation)
+ */
+
+export interface UIEvent {
+  session_id: string
+  event_type: string
+  phase?: string
+  component?: string
+  metadata?: Record<string, any>
+  client_ts?: string
+}
+
+const EVENTS_URL = '/api/events'
+const MAX_BATCH = 50
+const FLUSH_DELAY_MS = 2000
+
+let buffer: UIEvent[] = []
+let flushTimer: ReturnType<typeof setTimeout> | null = null
+let listenersAttached = false
+
+/**
+ * Queue an event; it is sent with the next flush.
+ * Events whose response is needed (e.g. chat_started) should still be POSTed directly.
+ */
+export function queueEvent(event: UIEvent): void {
+  if (typeof window === 'undefined') return
+  attachListeners()
+
+  buffer.push({ ...event, client_ts: event.client_ts || new Date().toISOString() })
+
+  if (buffer.length >= MAX_BATCH) {
+    flushEvents()
+  } else if (!flushTimer) {
+    flushTimer = setTimeout(() => flushEvents(), FLUSH_DELAY_MS)
+  }
+}
+
+/**
+ * Send everything buffered so far. With `useBeacon` the request survives page unload.
+ */
+export function flushEvents(useBeacon = false): void {
+  if (flushTimer) {
+    clearTimeout(flushTimer)
+    flushTimer = null
+  }
+  if (buffer.length === 0) return
+
+  const events = buffer
+  buffer = []
+  const body = JSON.stringify({ events })
+
+  if (useBeacon && typeof navigator !== 'undefined' && navigator.sendBeacon) {
+    const sent = navigator.sendBeacon(EVENTS_URL, new Blob([body], { type: 'application/json' }))
+    if (sent) return
+  }
+
+  fetch(EVENTS_URL, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body,
+    keepalive: true,
+  }).catch(error => console.error(`Failed to log ${events.length} events:`, error))
+}
+
+function attachListeners(): void {
+  if (listenersAttached) return
+  listenersAttached = true
+
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') flushEvents(true)
+  })
+  window.addEventListener('pagehide', () => flushEvents(true))
+}
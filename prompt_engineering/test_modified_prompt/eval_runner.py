@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Concurrent, resumable evaluation of the enhanced prompts
+
+Sends every mock student response (phases x levels x entries, 300 by default) with its
+phase prompt to an LLM provider and writes one row per response, like test_with_claude.py
+but:
+
+  - requests run concurrently, in the backend's adaptive concurrency window: 429/529
+    responses shrink the window, and failed attempts are retried with backoff, honouring
+    retry-after (backend/utils/limiter.py, backend/utils/retry.py)
+  - each row is appended to the output as soon as it is written out (CSV), or in part files
+    of --flush-every rows (Parquet, needs pyarrow), and its job is then added to a
+    checkpoint file; an interrupted run started again skips the jobs already in the
+    checkpoint or in the output
+  - the provider is the Anthropic API, the local mock (backend/utils/providers.py), or
+    either one behind a record/replay cassette (backend/utils/cassette.py)
+
+Requests are identical to test_with_claude.py's, so a cassette recorded by either script
+replays in both.
+
+Usage (from this directory):
+    python eval_runner.py [--provider anthropic|mock] [--cassette run.sqlite3 --cassette-mode replay]
+        [--concurrency 16] [--samples-per-level N] [--output claude_eval_results.csv|.parquet] [--restart]
+"""
+
+import argparse
+import asyncio
+import csv
+import glob
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+from enhanced_prompts import get_prompt, IMPROVED_PROMPTS
+
+# Make the backend package importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from backend.utils.cassette import Cassette, CassetteProvider, MODES as CASSETTE_MODES
+from backend.utils.limiter import AdaptiveConcurrencyLimiter
+from backend.utils.metadata_parser import parse_llm_response
+from backend.utils.providers import AnthropicProvider, LLMProvider, MockProvider
+from backend.utils.retry import RetryBudget, RetryPolicy
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for Parquet output
+    pa = None
+
+# Load environment variables from .env file
+load_dotenv()
+
+CLAUDE_MODEL = "claude-3-7-sonnet-20250219"
+SYSTEM_PROMPT = "You are an educational AI assistant helping students develop effective learning strategies."
+LEVELS = ["LOW", "MEDIUM", "HIGH"]
+# Keys listed in a prompt's METADATA FORMAT section, e.g. "Progress_Checks: [LOW/MEDIUM/HIGH]"
+METADATA_KEY_PATTERN = re.compile(r"^(\w+): \[", re.MULTILINE)
+
+
+def request_params(prompt: str, student_response: str, max_tokens: int = 4000) -> Dict[str, Any]:
+    """Messages API parameters for evaluating one student response (shared with test_with_claude.py)"""
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": max_tokens,
+        "temperature": 0,
+        "system": SYSTEM_PROMPT,
+        "messages": [{"role": "user", "content": f"{prompt}\n\nStudent response: {student_response}"}]
+    }
+
+
+def load_mock_data(file_path: str, seed: int = 0) -> Dict[str, Any]:
+    """The mock data JSON written by mock.py, or mock.py's data if the file does not exist"""
+    if os.path.exists(file_path):
+        with open(file_path, "r") as f:
+            return json.load(f)
+    import mock
+    # mock.py tops the entries up at random; seeded, every run (and resume) sees the same ones
+    random.seed(seed)
+    mock.generate_mock_entries()
+    return mock.solbot_mock_data
+
+
+def build_jobs(mock_data: Dict[str, Any], phases: List[str], samples_per_level: Optional[int], seed: int) -> List[Dict[str, Any]]:
+    """One job per (phase, level, entry), in a stable order so job ids survive restarts"""
+    rng = random.Random(seed)
+    jobs = []
+    for phase in phases:
+        if phase not in mock_data:
+            print(f"Skipping {phase} - not found in mock data")
+            continue
+        for level in LEVELS:
+            entries = list(enumerate(mock_data[phase].get(level, [])))
+            if samples_per_level is not None and samples_per_level < len(entries):
+                entries = sorted(rng.sample(entries, samples_per_level))
+            for index, entry in entries:
+                jobs.append({
+                    "job_id": f"{phase}/{level}/{index}",
+                    "phase": phase,
+                    "level": level,
+                    "entry": entry
+                })
+    return jobs
+
+
+def prompt_metadata_keys(phases) -> Dict[str, str]:
+    """
+    Metadata keys the phase prompts ask for, by lowercased name: parse_llm_response lowercases
+    keys, the output columns keep the prompts' spelling (as test_with_claude.py does)
+    """
+    keys: Dict[str, str] = {}
+    for phase in phases:
+        for key in METADATA_KEY_PATTERN.findall(get_prompt(phase)):
+            keys[key.lower()] = key
+    return keys
+
+
+def result_fieldnames(jobs: List[Dict[str, Any]]) -> List[str]:
+    """Fixed output columns: expected assessment keys from the data, model keys from the prompts"""
+    expected_keys: Set[str] = set()
+    for job in jobs:
+        expected_keys.update(job["entry"]["assessment"].keys())
+    claude_keys = set(prompt_metadata_keys({job["phase"] for job in jobs}).values())
+    return (
+        ["job_id", "phase", "expected_level", "student_response", "claude_response"]
+        + [f"expected_{key}" for key in sorted(expected_keys)]
+        + [f"claude_{key}" for key in sorted(claude_keys)]
+        + ["claude_metadata", "scaffolding_match", "duration_ms", "input_tokens", "output_tokens"]
+    )
+
+
+class Checkpoint:
+    """Append-only file of finished job ids, one JSON line each"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        self.done.add(json.loads(line)["job_id"])
+                    except (ValueError, KeyError):
+                        continue  # a line cut short by a crash
+        self._file = open(path, "a")
+
+    def mark(self, job_ids: List[str]) -> None:
+        for job_id in job_ids:
+            self._file.write(json.dumps({"job_id": job_id, "completed_at": time.time()}) + "\n")
+            self.done.add(job_id)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class CsvResultWriter:
+    """
+    Appends each row and flushes it; the row is durable when ``add`` returns
+
+    ``written`` holds the job ids already in the file: a run that stopped between writing a
+    row and checkpointing it must not write the row again. A row cut short by a crash is
+    removed.
+    """
+
+    def __init__(self, path: str, fieldnames: List[str]):
+        self.written = self._recover(path)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction="ignore")
+        if new_file:
+            self._writer.writeheader()
+
+    @staticmethod
+    def _recover(path: str) -> Set[str]:
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return set()
+        with open(path, newline="") as f:
+            text = f.read()
+        records = list(csv.reader(io.StringIO(text)))
+        header, rows = records[0], records[1:]
+        # csv writes "\r\n" after every row, so anything else at the end is a partial row
+        complete = [row for row in rows if len(row) == len(header)]
+        if not text.endswith("\r\n") and complete and complete[-1] is rows[-1]:
+            complete.pop()
+        if len(complete) < len(rows):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", newline="") as f:
+                csv.writer(f).writerows([header] + complete)
+            os.replace(tmp_path, path)
+        if "job_id" not in header:
+            return set()
+        column = header.index("job_id")
+        return {row[column] for row in complete}
+
+    def add(self, row: Dict[str, Any]) -> List[str]:
+        self._writer.writerow(row)
+        self._file.flush()
+        return [row["job_id"]]
+
+    def close(self) -> List[str]:
+        self._file.close()
+        return []
+
+
+class ParquetResultWriter:
+    """
+    Writes every ``flush_every`` rows to a new part file in the output directory; a part is
+    complete (written to a temporary name, then renamed) before its rows are checkpointed
+
+    ``written`` holds the job ids already in the directory's part files.
+    """
+
+    PART_PATTERN = "part-*.parquet"
+
+    def __init__(self, path: str, fieldnames: List[str], flush_every: int = 50):
+        if pa is None:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.schema = pa.schema([(name, pa.string()) for name in fieldnames])
+        self.flush_every = max(flush_every, 1)
+        self.written: Set[str] = set()
+        for part in glob.glob(os.path.join(path, self.PART_PATTERN)):
+            self.written.update(pq.read_table(part, columns=["job_id"]).column("job_id").to_pylist())
+        self._run = int(time.time())
+        self._parts = 0
+        self._rows: List[Dict[str, Any]] = []
+
+    def add(self, row: Dict[str, Any]) -> List[str]:
+        self._rows.append(row)
+        return self._flush() if len(self._rows) >= self.flush_every else []
+
+    def close(self) -> List[str]:
+        return self._flush()
+
+    def _flush(self) -> List[str]:
+        if not self._rows:
+            return []
+        columns = {
+            name: [None if row.get(name) is None else str(row[name]) for row in self._rows]
+            for name in self.schema.names
+        }
+        part = os.path.join(self.path, f"part-{self._run}-{self._parts:05d}.parquet")
+        self._parts += 1
+        pq.write_table(pa.table(columns, schema=self.schema), f"{part}.tmp")
+        os.replace(f"{part}.tmp", part)
+        written = [row["job_id"] for row in self._rows]
+        self._rows = []
+        return written
+
+
+def create_provider(args) -> LLMProvider:
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    name = args.provider or ("anthropic" if api_key else "mock")
+    if name == "anthropic":
+        if not api_key and args.cassette_mode != "replay":
+            raise ValueError("ANTHROPIC_API_KEY environment variable not set")
+        provider = AnthropicProvider(api_key, CLAUDE_MODEL, timeout=args.timeout) if api_key else MockProvider(CLAUDE_MODEL)
+    else:
+        provider = MockProvider.from_env(CLAUDE_MODEL)
+    if args.cassette:
+        provider = CassetteProvider(provider, Cassette(args.cassette, args.cassette_mode), latency_scale=args.latency_scale)
+    return provider
+
+
+class EvaluationRunner:
+    def __init__(self, provider: LLMProvider, writer, checkpoint: Checkpoint, args, metadata_keys: Dict[str, str]):
+        self.provider = provider
+        self.metadata_keys = metadata_keys
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.timeout = args.timeout
+        self.max_tokens = args.max_tokens
+        self.limiter = AdaptiveConcurrencyLimiter(
+            "eval", initial_limit=min(args.initial_concurrency, args.concurrency), max_limit=args.concurrency
+        )
+        # A batch run retries every transient failure, not a fraction of traffic like the backend
+        self.retry = RetryPolicy("eval", max_attempts=args.max_attempts, budget=RetryBudget(ratio=1.0))
+        self.concurrency = args.concurrency
+        self.completed = 0
+        self.failed: List[str] = []
+        self.matches = 0
+        self.scored = 0
+        self._started = 0.0
+        self._last_report = 0.0
+
+    async def run(self, jobs: List[Dict[str, Any]]) -> None:
+        self._started = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        total = len(jobs)
+        workers = [asyncio.create_task(self._worker(queue, total)) for _ in range(min(self.concurrency, total))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self.checkpoint.mark(self.writer.close())
+
+    async def _worker(self, queue: asyncio.Queue, total: int) -> None:
+        while not queue.empty():
+            job = queue.get_nowait()
+            try:
+                row = await self._evaluate(job)
+            except Exception as e:
+                self.failed.append(job["job_id"])
+                print(f"  {job['job_id']} failed: {type(e).__name__}: {e}")
+                continue
+            self.checkpoint.mark(self.writer.add(row))
+            self.completed += 1
+            if row["scaffolding_match"] is not None:
+                self.scored += 1
+                self.matches += row["scaffolding_match"]
+            self._report(total)
+
+    async def _evaluate(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        entry = job["entry"]
+        params = request_params(get_prompt(job["phase"]), entry["student_response"], self.max_tokens)
+
+        async def attempt():
+            async with self.limiter.slot():
+                return await asyncio.wait_for(self.provider.complete(params, self.timeout), timeout=self.timeout)
+
+        start = time.monotonic()
+        response = await self.retry.run(attempt)
+        duration_ms = int((time.monotonic() - start) * 1000)
+
+        _, parsed = parse_llm_response(response["content"])
+        metadata = {self.metadata_keys.get(key, key): value for key, value in parsed.items()}
+        row = {
+            "job_id": job["job_id"],
+            "phase": job["phase"],
+            "expected_level": job["level"],
+            "student_response": entry["student_response"],
+            "claude_response": response["content"],
+            "claude_metadata": json.dumps(metadata),
+            "duration_ms": duration_ms,
+            "input_tokens": response["usage"]["input_tokens"],
+            "output_tokens": response["usage"]["output_tokens"]
+        }
+        for key, value in entry["assessment"].items():
+            row[f"expected_{key}"] = value
+        for key, value in metadata.items():
+            row[f"claude_{key}"] = value
+        scaffolding = metadata.get("Scaffolding")
+        row["scaffolding_match"] = (
+            str(scaffolding).upper() == entry["assessment"].get("OVERALL") if scaffolding is not None else None
+        )
+        return row
+
+    def _report(self, total: int) -> None:
+        now = time.monotonic()
+        if now - self._last_report < 5 and self.completed < total:
+            return
+        self._last_report = now
+        elapsed = now - self._started
+        rate = self.completed / elapsed if elapsed else 0.0
+        remaining = total - self.completed - len(self.failed)
+        eta = f"{remaining / rate:.0f}s" if rate else "?"
+        print(
+            f"  {self.completed}/{total} done, {len(self.failed)} failed, {rate:.1f}/s, ETA {eta}, "
+            f"concurrency {self.limiter.limit:.1f} ({self.limiter.overloads} overloads)"
+        )
+
+
+async def run(args) -> int:
+    phases = args.phases or list(IMPROVED_PROMPTS)
+    jobs = build_jobs(load_mock_data(args.data, args.seed), phases, args.samples_per_level, args.seed)
+    fieldnames = result_fieldnames(jobs)
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+    parquet = args.output.endswith(".parquet")
+
+    if args.restart:
+        # Only the runner's own files: the output directory may hold other things
+        outputs = glob.glob(os.path.join(args.output, ParquetResultWriter.PART_PATTERN + "*")) if parquet else [args.output]
+        for path in [checkpoint_path] + outputs:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    checkpoint = Checkpoint(checkpoint_path)
+    writer = ParquetResultWriter(args.output, fieldnames, args.flush_every) if parquet else CsvResultWriter(args.output, fieldnames)
+    # Rows written by a run that stopped before checkpointing them
+    checkpoint.mark(sorted(writer.written - checkpoint.done))
+    pending = [job for job in jobs if job["job_id"] not in checkpoint.done]
+    print(f"{len(jobs)} jobs, {len(jobs) - len(pending)} already done (checkpoint {checkpoint_path})")
+    if not pending:
+        writer.close()
+        checkpoint.close()
+        return 0
+
+    provider = create_provider(args)
+    runner = EvaluationRunner(provider, writer, checkpoint, args, prompt_metadata_keys(phases))
+    print(f"Evaluating {len(pending)} responses with {provider.name} ({provider.model}), concurrency up to {args.concurrency}")
+    started = time.monotonic()
+    try:
+        await runner.run(pending)
+    finally:
+        checkpoint.close()
+
+    elapsed = time.monotonic() - started
+    print(f"\n{runner.completed} responses evaluated in {elapsed:.1f}s, {len(runner.failed)} failed; results in {args.output}")
+    if runner.scored:
+        print(f"Scaffolding level matches expected OVERALL in {runner.matches}/{runner.scored} responses")
+    if runner.failed:
+        print("Run the same command again to retry the failed jobs")
+    print(json.dumps(provider.stats(), indent=2, default=str))
+    return 1 if runner.failed else 0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="solbot_mock_data.json", help="mock data JSON (default: generated by mock.py)")
+    parser.add_argument("--phases", nargs="*", help="phases to evaluate (default: all prompts)")
+    parser.add_argument("--samples-per-level", type=int, default=None, help="entries per phase and level (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for sampling entries")
+    parser.add_argument("--provider", choices=["anthropic", "mock"], default=None,
+                        help="default: anthropic if ANTHROPIC_API_KEY is set, else mock (MOCK_LLM_* settings)")
+    parser.add_argument("--cassette", default=os.environ.get("LLM_CASSETTE"), help="record/replay cassette file")
+    parser.add_argument("--cassette-mode", choices=CASSETTE_MODES, default=os.environ.get("LLM_CASSETTE_MODE", "replay"))
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="replayed latency multiplier (0 = instant)")
+    parser.add_argument("--concurrency", type=int, default=16, help="most requests in flight")
+    parser.add_argument("--initial-concurrency", type=int, default=4)
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds per attempt")
+    parser.add_argument("--max-tokens", type=int, default=4000)
+    parser.add_argument("--output", default="claude_eval_results.csv", help=".csv file or .parquet directory")
+    parser.add_argument("--checkpoint", default=None, help="default: <output>.checkpoint")
+    parser.add_argument("--flush-every", type=int, default=50, help="rows per Parquet row group")
+    parser.add_argument("--restart", action="store_true", help="discard the checkpoint and previous results")
+    return parser.parse_args(argv)
+
+
+def main():
+    sys.exit(asyncio.run(run(parse_args())))
+
+
+if __name__ == "__main__":
+    # Change to the directory of this script
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -7,6 +7,7 @@ and saves the results to a CSV file.
 """
 
 import os
+import sys
 import json
 import re
 import time
@@ -16,16 +17,23 @@ import anthropic
 from dotenv import load_dotenv
 from enhanced_prompts import get_prompt, IMPROVED_PROMPTS
 
+# Make the backend package importable for the cassette
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from backend.utils.cassette import Cassette, request_fingerprint
+from eval_runner import CLAUDE_MODEL, request_params
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Optional record/replay cassette (LLM_CASSETTE, LLM_CASSETTE_MODE): replaying needs no API key
+CASSETTE = Cassette(os.environ["LLM_CASSETTE"]) if os.environ.get("LLM_CASSETTE") else None
+
 # Claude API configuration
 CLAUDE_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
-if not CLAUDE_API_KEY:
+if not CLAUDE_API_KEY and not (CASSETTE and CASSETTE.mode == "replay"):
     raise ValueError("ANTHROPIC_API_KEY environment variable not set")
 
-CLAUDE_CLIENT = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
-CLAUDE_MODEL = "claude-3-7-sonnet-20250219"  # Using Claude 3.7 Sonnet as specified
+CLAUDE_CLIENT = anthropic.Anthropic(api_key=CLAUDE_API_KEY) if CLAUDE_API_KEY else None
 
 # Metadata extraction regex pattern
 METADATA_PATTERN = r'<!-- INSTRUCTOR_METADATA\n(.*?)\n-->'
@@ -57,21 +65,38 @@ def extract_metadata(response):
     return metadata
 
 def send_to_claude(prompt, student_response):
-    """Send prompt with student response to Claude 3.7 and return the response."""
-    full_prompt = f"{prompt}\n\nStudent response: {student_response}"
+    """Send prompt with student response to Claude 3.7 and return the response (and whether it was replayed)."""
+    # The same request as eval_runner.py, so cassettes are shared
+    params = request_params(prompt, student_response)
+    
+    if CASSETTE:
+        fingerprint = request_fingerprint(params)
+        occurrence = CASSETTE.next_occurrence(fingerprint)
+        if CASSETTE.mode != "record":
+            recording = CASSETTE.get(fingerprint, occurrence)
+            if recording is not None:
+                return recording["content"], True
+            if CASSETTE.mode == "replay":
+                print(f"No recording for this request on {CASSETTE.path}")
+                return "API Error: not on the cassette", True
     
     try:
-        response = CLAUDE_CLIENT.messages.create(
-            model=CLAUDE_MODEL,
-            max_tokens=4000,
-            temperature=0,
-            system="You are an educational AI assistant helping students develop effective learning strategies.",
-            messages=[{"role": "user", "content": full_prompt}]
-        )
-        return response.content[0].text
+        start = time.time()
+        response = CLAUDE_CLIENT.messages.create(**params)
+        content = response.content[0].text
+        if CASSETTE:
+            CASSETTE.put(fingerprint, occurrence, {
+                "content": content,
+                "usage": {"input_tokens": response.usage.input_tokens, "output_tokens": response.usage.output_tokens},
+                "stop_reason": response.stop_reason,
+                "ttft_ms": None,
+                "duration_ms": (time.time() - start) * 1000,
+                "chunks": None
+            }, model=CLAUDE_MODEL)
+        return content, False
     except Exception as e:
         print(f"Error calling Claude API: {e}")
-        return f"API Error: {e}"
+        return f"API Error: {e}", False
 
 def process_responses(mock_data, samples_per_level=5):
     """Process mock responses and return results for CSV output."""
@@ -103,7 +128,7 @@ def process_responses(mock_data, samples_per_level=5):
                 print(f"  Testing {level} response {i+1}...")
                 
                 # Get Claude's response
-                claude_response = send_to_claude(prompt, student_response)
+                claude_response, replayed = send_to_claude(prompt, student_response)
                 
                 # Extract metadata from Claude's response
                 metadata = extract_metadata(claude_response)
@@ -126,8 +151,9 @@ def process_responses(mock_data, samples_per_level=5):
                 
                 results.append(result)
                 
-                # Add a delay to avoid rate limits
-                time.sleep(2)
+                # Add a delay to avoid rate limits (replayed responses cost nothing)
+                if not replayed:
+                    time.sleep(2)
     
     return results
 
@@ -163,6 +189,10 @@ def main():
         print("Failed to load mock data.")
         return
     
+    # A replayed run must pick the same samples as the recorded one
+    if CASSETTE:
+        random.seed(int(os.environ.get("EVAL_SEED", "0")))
+    
     # Process responses (5 samples per level)
     results = process_responses(mock_data, samples_per_level=5)
     
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# eval_runner.py imports its neighbours (enhanced_prompts, mock) and the backend package
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(tests_dir), "test_modified_prompt"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(tests_dir)))
@@ -0,0 +1,90 @@
+import asyncio
+import csv
+import os
+
+import pytest
+
+import eval_runner
+from backend.utils.providers import LLMProvider
+
+PHASES = ["phase2_learning_objectives", "phase5_monitoring_adaptation"]
+
+
+class PromptKeysProvider(LLMProvider):
+    """Answers with every metadata key the phase prompt asks for, spelled as in the prompt"""
+
+    name = "fake"
+
+    def __init__(self):
+        super().__init__("fake")
+        self.calls = 0
+
+    async def complete(self, params, timeout):
+        self.calls += 1
+        prompt = params["messages"][0]["content"]
+        lines = [f"{key}: HIGH" for key in eval_runner.METADATA_KEY_PATTERN.findall(prompt)]
+        content = "Good work.\n<!-- INSTRUCTOR_METADATA\n" + "\n".join(lines) + "\n-->"
+        return {"content": content, "usage": {"input_tokens": 10, "output_tokens": 5}, "stop_reason": "end_turn"}
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = PromptKeysProvider()
+    monkeypatch.setattr(eval_runner, "create_provider", lambda args: provider)
+    return provider
+
+
+def _run(output, *extra):
+    args = eval_runner.parse_args([
+        "--data", os.path.join(os.path.dirname(output), "missing.json"),
+        "--phases", *PHASES,
+        "--samples-per-level", "2",
+        "--output", output,
+        *extra
+    ])
+    return asyncio.run(eval_runner.run(args))
+
+
+def _rows(output):
+    with open(output, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_claude_columns_are_filled(tmp_path, provider):
+    output = str(tmp_path / "results.csv")
+    assert _run(output) == 0
+
+    rows = _rows(output)
+    assert len(rows) == len(PHASES) * len(eval_runner.LEVELS) * 2
+    for row in rows:
+        keys = eval_runner.prompt_metadata_keys([row["phase"]]).values()
+        assert "Scaffolding" in keys
+        for key in keys:
+            assert row[f"claude_{key}"] == "HIGH"
+        assert row["scaffolding_match"] in ("True", "False")
+
+
+def test_resume_skips_rows_written_but_not_checkpointed(tmp_path, provider):
+    output = str(tmp_path / "results.csv")
+    assert _run(output) == 0
+    calls = provider.calls
+    # A crash after the rows were written but before they were checkpointed
+    os.remove(f"{output}.checkpoint")
+    with open(output, "a", newline="") as f:
+        f.write('phase2_learning_objectives/LOW/9,phase2_learn')
+
+    assert _run(output) == 0
+    job_ids = [row["job_id"] for row in _rows(output)]
+    assert len(job_ids) == len(set(job_ids)) == calls
+    assert provider.calls == calls
+
+
+def test_restart_only_removes_runner_files(tmp_path, provider):
+    output = str(tmp_path / "results.csv")
+    other = tmp_path / "notes.txt"
+    other.write_text("keep me")
+    assert _run(output) == 0
+
+    assert _run(output, "--restart") == 0
+    assert other.read_text() == "keep me"
+    assert len(_rows(output)) == provider.calls // 2